@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from datetime import date
+import time
+from typing import AsyncIterable, Callable, Optional
+
+import numpy as np
+
+# Rows per streamed chunk: big enough that per-chunk overhead vanishes, small
+# enough that the Python lists of one chunk stay a few MB.
+ANALYTICS_CHUNK = 50_000
+COHORT_MONTHS = 12  # newest cohorts (and months after first purchase) kept in the table
+
+# (name, predicate on recency score r and the mean fm of frequency/monetary
+# scores), checked in order; None takes everyone left.
+RFM_SEGMENTS: tuple[tuple[str, Optional[Callable[[np.ndarray, np.ndarray], np.ndarray]]], ...] = (
+    ("Chempionlar", lambda r, fm: (r >= 4) & (fm >= 4)),
+    ("Sodiq mijozlar", lambda r, fm: (r >= 3) & (fm >= 3)),
+    ("Yangi mijozlar", lambda r, fm: r >= 4),
+    ("Xavf ostida", lambda r, fm: (r <= 2) & (fm >= 3)),
+    ("Uxlab qolganlar", None),
+)
+
+
+@dataclass(frozen=True)
+class SalesColumns:
+    customer_id: np.ndarray  # int64
+    day: np.ndarray  # datetime64[D]
+    amount: np.ndarray  # int64
+
+    def __len__(self) -> int:
+        return len(self.amount)
+
+
+@dataclass(frozen=True)
+class RfmSegment:
+    name: str
+    customers: int
+    monetary: int  # lifetime spend of the segment's customers
+
+
+@dataclass(frozen=True)
+class Cohorts:
+    months: list[str]  # YYYY-MM of first purchase, oldest first
+    sizes: list[int]
+    retention: list[list[float]]  # [cohort][months since first purchase] -> share still buying
+
+
+@dataclass(frozen=True)
+class Analytics:
+    sales: int
+    customers: int
+    segments: list[RfmSegment]
+    cohorts: Cohorts
+    timings_ms: dict[str, float] = field(default_factory=dict)
+
+
+async def load_columns(chunks: AsyncIterable[tuple[list[int], list[str], list[int]]]) -> SalesColumns:
+    """Stream (customer_id, sale_date, amount) column chunks into contiguous arrays."""
+    ids: list[np.ndarray] = []
+    days: list[np.ndarray] = []
+    amounts: list[np.ndarray] = []
+    async for chunk_ids, chunk_days, chunk_amounts in chunks:
+        ids.append(np.asarray(chunk_ids, dtype=np.int64))
+        days.append(np.asarray(chunk_days, dtype="datetime64[D]"))
+        amounts.append(np.asarray(chunk_amounts, dtype=np.int64))
+    if not ids:
+        return SalesColumns(np.empty(0, np.int64), np.empty(0, "datetime64[D]"), np.empty(0, np.int64))
+    return SalesColumns(np.concatenate(ids), np.concatenate(days), np.concatenate(amounts))
+
+
+def _quintiles(values: np.ndarray) -> np.ndarray:
+    """Score 1..5 by rank; equal values share the score of their first rank."""
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    first_rank = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return 1 + first_rank[inverse] * 5 // len(values)
+
+
+def rfm_segments(cols: SalesColumns, today: date) -> tuple[int, list[RfmSegment]]:
+    """(customers, segments) from recency/frequency/monetary quintiles of every buyer."""
+    if not len(cols):
+        return 0, [RfmSegment(name, 0, 0) for name, _ in RFM_SEGMENTS]
+    _, inverse = np.unique(cols.customer_id, return_inverse=True)
+    n = int(inverse.max()) + 1
+    last = np.full(n, np.iinfo(np.int64).min)
+    np.maximum.at(last, inverse, cols.day.astype(np.int64))
+    frequency = np.bincount(inverse, minlength=n)
+    monetary = np.bincount(inverse, weights=cols.amount, minlength=n).astype(np.int64)
+    recency = np.datetime64(today, "D").astype(np.int64) - last
+
+    r = 6 - _quintiles(recency)  # fewest days since the last sale scores 5
+    fm = (_quintiles(frequency) + _quintiles(monetary)) / 2
+    unassigned = np.ones(n, dtype=bool)
+    segments = []
+    for name, predicate in RFM_SEGMENTS:
+        hit = unassigned.copy() if predicate is None else unassigned & predicate(r, fm)
+        unassigned &= ~hit
+        segments.append(RfmSegment(name, int(hit.sum()), int(monetary[hit].sum())))
+    return n, segments
+
+
+def cohort_retention(cols: SalesColumns, *, months: int = COHORT_MONTHS) -> Cohorts:
+    """Share of each first-purchase month's customers buying again k months later."""
+    if not len(cols):
+        return Cohorts([], [], [])
+    month = cols.day.astype("datetime64[M]").astype(np.int64)
+    _, inverse = np.unique(cols.customer_id, return_inverse=True)
+    first = np.full(int(inverse.max()) + 1, np.iinfo(np.int64).max)
+    np.minimum.at(first, inverse, month)
+
+    lo = int(month.max()) - months + 1
+    keep = first[inverse] >= lo
+    offset = month[keep] - first[inverse][keep]
+    # One hit per (customer, month bought in), then count per (cohort, offset).
+    active = np.unique(inverse[keep] * months + offset)
+    cust, off = np.divmod(active, months)
+    matrix = np.bincount((first[cust] - lo) * months + off, minlength=months * months).reshape(months, months)
+    sizes = matrix[:, 0]
+    rows = [i for i in range(months) if sizes[i]]
+    return Cohorts(
+        months=[str(np.datetime64(lo + i, "M")) for i in rows],
+        sizes=[int(sizes[i]) for i in rows],
+        retention=[(matrix[i, : months - i] / sizes[i]).round(4).tolist() for i in rows],
+    )
+
+
+async def analyze(chunks: AsyncIterable[tuple[list[int], list[str], list[int]]], *, today: date) -> Analytics:
+    """Load the sales columns, then score them in a worker thread so the event loop stays free."""
+    t0 = time.perf_counter()
+    cols = await load_columns(chunks)
+    t1 = time.perf_counter()
+    customers, segments = await asyncio.to_thread(rfm_segments, cols, today)
+    t2 = time.perf_counter()
+    cohorts = await asyncio.to_thread(cohort_retention, cols)
+    t3 = time.perf_counter()
+    return Analytics(
+        sales=len(cols),
+        customers=customers,
+        segments=segments,
+        cohorts=cohorts,
+        timings_ms={"load": (t1 - t0) * 1000, "rfm": (t2 - t1) * 1000, "cohorts": (t3 - t2) * 1000},
+    )
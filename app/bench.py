@@ -0,0 +1,477 @@
+"""Local benchmarks against a throwaway database.
+
+    python -m app.bench writer
+    python -m app.bench export-latency
+    python -m app.bench storage
+    python -m app.bench contention
+    python -m app.bench analytics
+    python -m app.bench search
+    python -m app.bench typeahead
+    python -m app.bench sale-search
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from typing import Any, AsyncIterator
+
+import aiosqlite
+
+from . import services
+from .db import Db, close, iterate, migrate, read, run_backfills, snapshot, write
+from .exporting import sales_to_xlsx
+from .memory_storage import MemoryStorage
+from .sqlite_storage import SqliteStorage
+from .storage import Storage
+from .typeahead import CustomerIndex
+from .utils import normalize_key
+
+AUDIT_SQL = "INSERT INTO audit_logs(actor_telegram_id, actor_role, action, meta_json, at) VALUES(?,?,?,?,?)"
+AUDIT_ARGS = (1, "system", "bench", "{}", "2026-01-01T00:00:00+05:00")
+
+
+async def _fresh_db(tmp: str, name: str) -> Db:
+    db = Db(path=os.path.join(tmp, f"{name}.sqlite3"))
+    await migrate(db)
+    return db
+
+
+def _seed(path: str, *, customers: int, sales: int) -> None:
+    """Bulk-load synthetic rows with plain sqlite3 (setup only, not measured)."""
+    rnd = random.Random(42)
+    start = date(2020, 1, 1)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO customers(id, full_name, phone, status, created_at, updated_at) VALUES(?,?,?,?,?,?)",
+            ((i, f"Mijoz {i}", f"99890{i:07d}", "active", "2020-01-01", "2020-01-01") for i in range(1, customers + 1)),
+        )
+        products = ("Sement M400", "Armatura 12", "G'isht", "Kafel", "Bo'yoq")
+        conn.executemany(
+            "INSERT INTO products(id, key, name, created_at) VALUES(?,?,?,?)",
+            ((i, normalize_key(name), name, "2020-01-01") for i, name in enumerate(products, start=1)),
+        )
+        rows = [
+            (
+                rnd.randint(1, customers),
+                rnd.randint(10_000, 5_000_000),
+                rnd.randint(1, len(products)),
+                "",
+                (start + timedelta(days=rnd.randint(0, 6 * 365))).isoformat(),
+                "2020-01-01",
+            )
+            for _ in range(sales)
+        ]
+        # In date order, like real entry: a back-dated sale rewrites every later sales_daily row.
+        rows.sort(key=lambda r: r[4])
+        conn.executemany("INSERT INTO sales(customer_id, amount, product, product_id, comment, sale_date, created_at) VALUES(?,?,'',?,?,?,?)", rows)
+    conn.close()
+
+
+FIRST_NAMES = ("Alisher", "Bobur", "Dilshod", "Jasur", "Sardor", "Otabek", "Nodira", "Madina", "Gulnora", "Dilnoza", "Алишер", "Шерзод", "Жасур", "Гулнора")
+LAST_NAMES = ("Karimov", "Toshmatov", "Rahimov", "Yusupov", "Qodirov", "Ergashev", "Nazarov", "Xolmatov", "Каримов", "Юсупов")
+
+# What find_customers ran before the search index.
+LIKE_SQL = """
+    SELECT id, full_name, phone, chat_id, status, total_spent, level, last_sale_date
+    FROM customers
+    WHERE CAST(id AS TEXT) LIKE ? OR full_name LIKE ? OR phone LIKE ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+
+
+def _seed_named(path: str, *, customers: int) -> None:
+    """Customers with mixed Latin/Cyrillic names; search keys are left to the backfill."""
+    rnd = random.Random(42)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO customers(id, full_name, phone, status, created_at, updated_at) VALUES(?,?,?,?,?,?)",
+            (
+                (i, f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}", f"99890{i:07d}", "active", "2020-01-01", "2020-01-01")
+                for i in range(1, customers + 1)
+            ),
+        )
+    conn.close()
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def _per_call_write(path: str) -> None:
+    # What every service call did before the pool: connect, pragmas, one commit.
+    conn = await aiosqlite.connect(path)
+    try:
+        await conn.execute("PRAGMA foreign_keys = ON;")
+        await conn.execute("PRAGMA journal_mode = WAL;")
+        await conn.execute(AUDIT_SQL, AUDIT_ARGS)
+        await conn.commit()
+    finally:
+        await conn.close()
+
+
+async def _run_concurrent(writers: int, total: int, op) -> float:
+    per_writer = max(1, total // writers)
+
+    async def worker() -> None:
+        for _ in range(per_writer):
+            await op()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(writers)))
+    return per_writer * writers / (time.perf_counter() - started)
+
+
+async def bench_writer(total: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'writers':>8} {'queued w/s':>12} {'batch avg':>10} {'per-call w/s':>13}")
+        for writers in (1, 10, 100):
+            db = await _fresh_db(tmp, f"queued{writers}")
+            queued = await _run_concurrent(writers, total, lambda: write(db, AUDIT_SQL, AUDIT_ARGS))
+            batch_avg = db.pool.batch_stats.jobs / max(1, db.pool.batch_stats.batches)
+            await close(db)
+
+            base = await _fresh_db(tmp, f"percall{writers}")
+            await close(base)
+
+            async def per_call() -> None:
+                while True:
+                    try:
+                        return await _per_call_write(base.path)
+                    except aiosqlite.OperationalError:  # database is locked
+                        await asyncio.sleep(0.001)
+
+            baseline = await _run_concurrent(writers, total, per_call)
+            print(f"{writers:>8} {queued:>12.0f} {batch_avg:>10.1f} {baseline:>13.0f}")
+
+
+EXPORT_SQL = """
+    SELECT s.id, s.amount, COALESCE(p.name, s.product) AS product, s.comment, s.sale_date, c.id as customer_id, c.full_name, c.phone
+    FROM sales s
+    JOIN customers c ON c.id = s.customer_id
+    LEFT JOIN products p ON p.id = s.product_id
+    WHERE s.sale_date BETWEEN ? AND ?
+    ORDER BY s.sale_date DESC, s.id DESC
+"""
+
+
+async def _export(db: Db, path_kind: str) -> None:
+    async def rows() -> AsyncIterator[dict[str, Any]]:
+        checkout = snapshot(db) if path_kind == "snapshot" else read(db)
+        async with checkout as conn:
+            async for r in iterate(conn, EXPORT_SQL, ("2020-01-01", "2030-12-31")):
+                yield dict(r)
+
+    await sales_to_xlsx(rows())
+
+
+async def bench_export_latency(sales: int, writes: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = await _fresh_db(tmp, "export")
+        await close(db)
+        _seed(db.path, customers=2000, sales=sales)
+        print(f"{'export via':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'export s':>9}")
+        for kind in ("none", "reader", "snapshot"):
+            db = Db(path=db.path)
+            await write(db, AUDIT_SQL, AUDIT_ARGS)  # warm the pool
+            export = None
+            started = time.perf_counter()
+            if kind != "none":
+                export = asyncio.create_task(_export(db, kind))
+                await asyncio.sleep(0.05)
+            samples: list[float] = []
+            for _ in range(writes):
+                t0 = time.perf_counter()
+                await write(db, AUDIT_SQL, AUDIT_ARGS)
+                samples.append((time.perf_counter() - t0) * 1000)
+                await asyncio.sleep(0.002)
+            if export is not None:
+                await export
+            elapsed = time.perf_counter() - started
+            print(
+                f"{kind:>10} {statistics.median(samples):>8.2f} {_percentile(samples, 0.99):>8.2f} "
+                f"{max(samples):>8.2f} {elapsed if export else 0.0:>9.2f}"
+            )
+            await close(db)
+
+
+def _hold_write_lock(path: str, stop: threading.Event, *, hold: float, pause: float) -> None:
+    """Another process's writer: grab the lock, sit on it, let go, repeat."""
+    conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+    while not stop.is_set():
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(AUDIT_SQL, AUDIT_ARGS)
+        time.sleep(hold)
+        conn.execute("COMMIT")
+        time.sleep(pause)
+    conn.close()
+
+
+async def bench_contention(writes: int, hold_ms: int) -> None:
+    configs = (("no timeout/retry", 0, 0), ("timeout 50ms", 50, 0), ("50ms + 5 retries", 50, 5), ("defaults", 5000, 5))
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'policy':>18} {'ok':>5} {'failed':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'retries':>7}")
+        for label, timeout_ms, retries in configs:
+            path = os.path.join(tmp, f"contention{timeout_ms}_{retries}.sqlite3")
+            db = Db(path=path, busy_timeout_ms=timeout_ms, write_retries=retries)
+            await migrate(db)
+            stop = threading.Event()
+            holder = threading.Thread(target=_hold_write_lock, args=(path, stop), kwargs={"hold": hold_ms / 1000, "pause": hold_ms / 2000})
+            holder.start()
+            samples: list[float] = []
+            failed = 0
+            for _ in range(writes):
+                await asyncio.sleep(0.005)
+                t0 = time.perf_counter()
+                try:
+                    await write(db, AUDIT_SQL, AUDIT_ARGS)
+                except sqlite3.OperationalError:
+                    failed += 1
+                    continue
+                samples.append((time.perf_counter() - t0) * 1000)
+            stop.set()
+            holder.join()
+            ok = len(samples)
+            p50 = statistics.median(samples) if samples else 0.0
+            p99 = _percentile(samples, 0.99) if samples else 0.0
+            print(f"{label:>18} {ok:>5} {failed:>6} {p50:>8.1f} {p99:>8.1f} {max(samples, default=0.0):>8.1f} {db.pool.batch_stats.retries:>7}")
+            await close(db)
+
+
+async def _seed_storage(store: Storage, *, customers: int, sales: int, concurrency: int = 100) -> float:
+    """Load through the real services (audit, totals, rewards); returns sales/sec."""
+    for i in range(1, customers + 1):
+        await services.create_customer(store, full_name=f"Mijoz {i}", phone=f"99890{i:07d}", chat_id=i, tz="UTC", actor_telegram_id=1)
+    rnd = random.Random(42)
+    start = date(2024, 1, 1)
+    per_worker = sales // concurrency
+
+    async def worker() -> None:
+        for _ in range(per_worker):
+            await services.add_sale(
+                store,
+                customer_id=rnd.randint(1, customers),
+                amount=rnd.randint(10_000, 5_000_000),
+                product="Sement M400",
+                comment="",
+                sale_date=(start + timedelta(days=rnd.randint(0, 2 * 365))).isoformat(),
+                tz="UTC",
+                actor_telegram_id=1,
+            )
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return per_worker * concurrency / (time.perf_counter() - started)
+
+
+async def bench_storage(customers: int, sales: int, calls: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        stores: list[Storage] = [SqliteStorage(path=os.path.join(tmp, "storage.sqlite3")), MemoryStorage()]
+        rnd = random.Random(7)
+        ops = {
+            "get_customer_by_chat": lambda s: services.get_customer_by_chat(s, chat_id=rnd.randint(1, customers)),
+            "list_sales_for_customer": lambda s: services.list_sales_for_customer(s, customer_id=rnd.randint(1, customers)),
+            "customer_sales_stats": lambda s: services.customer_sales_stats(s, customer_id=rnd.randint(1, customers), since="2025-01-01"),
+            "find_customer": lambda s: services.find_customer(s, query=str(rnd.randint(1, customers))),
+            "monthly_report": lambda s: services.monthly_report(s, year=2025, month=rnd.randint(1, 12)),
+        }
+        print(f"{'operation':>24} " + " ".join(f"{s.name + ' p50 ms':>16}" for s in stores))
+        results: dict[str, list[str]] = {"add_sale (w/s)": []}
+        for store in stores:
+            await store.open()
+            results["add_sale (w/s)"].append(f"{await _seed_storage(store, customers=customers, sales=sales):>16.0f}")
+            for name, op in ops.items():
+                samples = []
+                for _ in range(calls):
+                    t0 = time.perf_counter()
+                    await op(store)
+                    samples.append((time.perf_counter() - t0) * 1000)
+                results.setdefault(name, []).append(f"{statistics.median(samples):>16.3f}")
+            await store.close()
+        for name, cols in results.items():
+            print(f"{name:>24} " + " ".join(cols))
+
+
+async def bench_analytics(customers: int, sales: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = await _fresh_db(tmp, "analytics")
+        await close(db)
+        _seed(db.path, customers=customers, sales=sales)
+        store = SqliteStorage(path=db.path)
+        await store.open()
+        t0 = time.perf_counter()
+        result = await services.sales_analytics(store)
+        cold = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        await services.sales_analytics(store)
+        warm = (time.perf_counter() - t0) * 1000
+        await store.close()
+    print(f"{result.sales} sales, {result.customers} customers")
+    for name, ms in result.timings_ms.items():
+        print(f"{name:>10} {ms:>10.1f} ms")
+    print(f"{'total':>10} {cold:>10.1f} ms")
+    print(f"{'cached':>10} {warm:>10.3f} ms")
+
+
+async def bench_search(customers: int, calls: int) -> None:
+    queries = ("alisher", "Алишер", "karimov dilnoza", "sherzod yus", "a", str(customers // 2), "0001234")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = await _fresh_db(tmp, "search")
+        _seed_named(db.path, customers=customers)
+        t0 = time.perf_counter()
+        await run_backfills(db)
+        print(f"index backfill: {time.perf_counter() - t0:.1f} s for {customers} customers")
+        await close(db)
+        store = SqliteStorage(path=db.path)
+        await store.open()
+        print(f"{'query':>18} {'LIKE p50':>10} {'LIKE p99':>10} {'hits':>5} {'index p50':>10} {'index p99':>10} {'hits':>5}")
+        for query in queries:
+            like, index = [], []
+            for _ in range(calls):
+                t0 = time.perf_counter()
+                async with read(store.db) as conn:
+                    q = f"%{query}%"
+                    like_rows = [r async for r in iterate(conn, LIKE_SQL, (q, q, q, 20))]
+                like.append((time.perf_counter() - t0) * 1000)
+                t0 = time.perf_counter()
+                found = await store.find_customers(query=query, limit=20)
+                index.append((time.perf_counter() - t0) * 1000)
+            print(
+                f"{query:>18} {statistics.median(like):>10.2f} {_percentile(like, 0.99):>10.2f} {len(like_rows):>5}"
+                f" {statistics.median(index):>10.2f} {_percentile(index, 0.99):>10.2f} {len(found):>5}"
+            )
+        await store.close()
+
+
+def bench_typeahead(customers: int, calls: int) -> None:
+    rnd = random.Random(42)
+    rows = [(i, f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}", f"99890{rnd.randint(0, 9_999_999):07d}") for i in range(1, customers + 1)]
+    t0 = time.perf_counter()
+    index = CustomerIndex(rows)
+    print(f"load: {(time.perf_counter() - t0) * 1000:.0f} ms for {customers} customers")
+
+    def typed(row: tuple[int, str, str]) -> str:
+        # What an admin has typed so far: part of a name word, name + part of another, or phone digits.
+        cid, full_name, phone = row
+        first, last = full_name.split()
+        return rnd.choice((first[: rnd.randint(1, len(first))], f"{first} {last[: rnd.randint(1, 3)]}", phone[3 : 3 + rnd.randint(2, 7)], str(cid)))
+
+    queries = ["", *(typed(rnd.choice(rows)) for _ in range(calls))]
+    samples = []
+    for q in queries:
+        t0 = time.perf_counter()
+        index.lookup(q, limit=20)
+        samples.append((time.perf_counter() - t0) * 1000)
+    print(f"lookup: p50 {statistics.median(samples):.3f} ms, p99 {_percentile(samples, 0.99):.3f} ms, max {max(samples):.3f} ms")
+    t0 = time.perf_counter()
+    for cid in range(customers + 1, customers + 1001):
+        index.add(cid, "Yangi Mijoz", f"99891{cid:07d}")
+    for cid in range(customers + 1, customers + 1001):
+        index.remove(cid)
+    print(f"add+remove: {(time.perf_counter() - t0) * 1000 / 1000:.3f} ms per customer")
+
+
+# The only way to search sales before the sales_search index (besides an export).
+SALE_LIKE_SQL = """
+    SELECT s.id FROM sales s LEFT JOIN products p ON p.id = s.product_id
+    WHERE (COALESCE(p.name, s.product) LIKE ? OR s.comment LIKE ?) AND s.sale_date BETWEEN ? AND ? AND (? IS NULL OR s.customer_id = ?)
+    ORDER BY s.id DESC LIMIT 10
+"""
+
+
+async def bench_sale_search(sales: int, calls: int) -> None:
+    cases = (
+        ("armatura", "2025-07-01", "2025-09-30", None),
+        ("armatura", "2020-01-01", "2025-12-31", None),
+        ("sement m400", "2020-01-01", "2020-03-31", None),
+        ("armatura", "2020-01-01", "2025-12-31", 77),
+        ("kafel", "2025-12-01", "2025-12-31", 77),
+        ("zzz", "2020-01-01", "2025-12-31", None),
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        db = await _fresh_db(tmp, "sale_search")
+        _seed(db.path, customers=20_000, sales=sales)
+        await close(db)
+        store = SqliteStorage(path=db.path)
+        await store.open()
+        print(f"{'query':>12} {'dates':>23} {'customer':>8} {'LIKE p50':>9} {'index p50':>9} {'index max':>9} {'ranked':>6}")
+        for query, start, end, customer_id in cases:
+            like, index = [], []
+            for _ in range(calls):
+                t0 = time.perf_counter()
+                async with read(store.db) as conn:
+                    q = f"%{query}%"
+                    [r async for r in iterate(conn, SALE_LIKE_SQL, (q, q, start, end, customer_id, customer_id))]
+                like.append((time.perf_counter() - t0) * 1000)
+                t0 = time.perf_counter()
+                ranked, _ = await store.search_sales(
+                    query=query, start_date=start, end_date=end, customer_id=customer_id, limit=10, offset=0
+                )
+                index.append((time.perf_counter() - t0) * 1000)
+            print(
+                f"{query:>12} {start + '..' + end:>23} {customer_id or '-':>8} {statistics.median(like):>9.1f}"
+                f" {statistics.median(index):>9.1f} {max(index):>9.1f} {ranked:>6}"
+            )
+        await store.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.bench")
+    sub = parser.add_subparsers(dest="name", required=True)
+    p_writer = sub.add_parser("writer", help="writes/sec through the single-writer queue")
+    p_writer.add_argument("--total", type=int, default=2000)
+    p_export = sub.add_parser("export-latency", help="write latency while a full-range sales export runs")
+    p_export.add_argument("--sales", type=int, default=200_000)
+    p_export.add_argument("--writes", type=int, default=300)
+    p_storage = sub.add_parser("storage", help="sqlite vs memory backend through the services layer")
+    p_storage.add_argument("--customers", type=int, default=2000)
+    p_storage.add_argument("--sales", type=int, default=20_000)
+    p_storage.add_argument("--calls", type=int, default=200)
+    p_contention = sub.add_parser("contention", help="writes while another process keeps taking the write lock")
+    p_contention.add_argument("--writes", type=int, default=200)
+    p_contention.add_argument("--hold-ms", type=int, default=80)
+    p_analytics = sub.add_parser("analytics", help="RFM + cohort analytics over all sales")
+    p_analytics.add_argument("--customers", type=int, default=20_000)
+    p_analytics.add_argument("--sales", type=int, default=1_000_000)
+    p_search = sub.add_parser("search", help="customer search: old LIKE scan vs the trigram/phone index")
+    p_search.add_argument("--customers", type=int, default=100_000)
+    p_search.add_argument("--calls", type=int, default=200)
+    p_typeahead = sub.add_parser("typeahead", help="in-memory prefix index behind the inline customer picker")
+    p_typeahead.add_argument("--customers", type=int, default=50_000)
+    p_typeahead.add_argument("--calls", type=int, default=2000)
+    p_sale_search = sub.add_parser("sale-search", help="sales full-text search: LIKE scan vs the sales_search index")
+    p_sale_search.add_argument("--sales", type=int, default=1_000_000)
+    p_sale_search.add_argument("--calls", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.name == "writer":
+        asyncio.run(bench_writer(args.total))
+    elif args.name == "export-latency":
+        asyncio.run(bench_export_latency(args.sales, args.writes))
+    elif args.name == "storage":
+        asyncio.run(bench_storage(args.customers, args.sales, args.calls))
+    elif args.name == "contention":
+        asyncio.run(bench_contention(args.writes, args.hold_ms))
+    elif args.name == "analytics":
+        asyncio.run(bench_analytics(args.customers, args.sales))
+    elif args.name == "search":
+        asyncio.run(bench_search(args.customers, args.calls))
+    elif args.name == "typeahead":
+        bench_typeahead(args.customers, args.calls)
+    elif args.name == "sale-search":
+        asyncio.run(bench_sale_search(args.sales, args.calls))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import time
+from typing import Any, Callable, Generic, Hashable, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    """Size-bounded mapping that evicts the least recently used entry.
+
+    With `ttl` (seconds) an entry also expires that long after it was put,
+    so data changed behind the cache's back is served stale for at most `ttl`.
+    """
+
+    def __init__(self, maxsize: int, *, ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic) -> None:
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._clock = clock
+        self._data: OrderedDict[Hashable, tuple[V, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires = entry
+        if self.ttl is not None and self._clock() >= expires:
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: V) -> None:
+        expires = self._clock() + self.ttl if self.ttl is not None else 0.0
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def as_dict(self, prefix: str) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            f"{prefix}.size": len(self._data),
+            f"{prefix}.hits": self.hits,
+            f"{prefix}.misses": self.misses,
+            f"{prefix}.hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            f"{prefix}.evictions": self.evictions,
+            f"{prefix}.expirations": self.expirations,
+        }
@@ -10,6 +10,21 @@ class Config:
     admin_telegram_ids: tuple[int, ...]
     db_path: str
     tz: str
+    db_pool_size: int = 4
+    db_snapshot_pool_size: int = 2
+    db_busy_timeout_ms: int = 5000
+    db_write_retries: int = 5
+    storage: str = "sqlite"  # sqlite|memory
+    dedup_ttl_hours: int = 48
+    winners_top_n: int = 5
+    report_cache_size: int = 256
+    customer_cache_size: int = 10_000
+    customer_cache_ttl: int = 300  # seconds
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name, "").strip()
+    return int(raw) if raw.isdigit() else default
 
 
 def load_config() -> Config:
@@ -39,5 +54,15 @@ def load_config() -> Config:
         admin_telegram_ids=tuple(ids),
         db_path=db_path,
         tz=tz,
+        db_pool_size=_env_int("DB_POOL_SIZE", 4),
+        db_snapshot_pool_size=_env_int("DB_SNAPSHOT_POOL_SIZE", 2),
+        db_busy_timeout_ms=_env_int("DB_BUSY_TIMEOUT_MS", 5000),
+        db_write_retries=_env_int("DB_WRITE_RETRIES", 5),
+        storage=os.getenv("STORAGE", "sqlite").strip().lower() or "sqlite",
+        dedup_ttl_hours=_env_int("DEDUP_TTL_HOURS", 48),
+        winners_top_n=_env_int("WINNERS_TOP_N", 5),
+        report_cache_size=_env_int("REPORT_CACHE_SIZE", 256),
+        customer_cache_size=_env_int("CUSTOMER_CACHE_SIZE", 10_000),
+        customer_cache_ttl=_env_int("CUSTOMER_CACHE_TTL", 300),
     )
 
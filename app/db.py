@@ -1,32 +1,537 @@
 from __future__ import annotations
 
+import asyncio
 import aiosqlite
 from contextlib import asynccontextmanager
-from dataclasses import dataclass
-from typing import Any, AsyncIterator, Optional
+from dataclasses import dataclass, field
+import random
+import sqlite3
+import time
+from urllib.parse import quote
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from .search import phone_key
+from .utils import normalize_key
+
+WRITE_BATCH_MAX = 128
+BUSY_TIMEOUT_MS = 5000
+WRITE_RETRIES = 5
+RETRY_BASE = 0.01  # seconds; doubled per attempt, full jitter, capped at RETRY_MAX
+RETRY_MAX = 1.0
+
+WriteJob = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+
+async def _open(path: str, *, busy_timeout_ms: int, wal: bool = False, autocommit: bool = False) -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(path, isolation_level=None if autocommit else "")
+    conn.row_factory = aiosqlite.Row
+    await conn.execute("PRAGMA foreign_keys = ON;")
+    await conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)};")
+    if wal:
+        # journal_mode is persistent in the file; the writer sets it once.
+        cur = await conn.execute("PRAGMA journal_mode = WAL;")
+        await cur.close()
+    return conn
+
+
+async def _open_snapshot(path: str, *, busy_timeout_ms: int) -> aiosqlite.Connection:
+    """Read-only connection tuned for long scans (reports, exports)."""
+    conn = await aiosqlite.connect(f"file:{quote(path)}?mode=ro", uri=True, isolation_level=None)
+    conn.row_factory = aiosqlite.Row
+    await conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)};")
+    await conn.execute("PRAGMA query_only = ON;")
+    await conn.execute("PRAGMA cache_size = -65536;")  # 64 MiB
+    await conn.execute("PRAGMA mmap_size = 268435456;")  # 256 MiB
+    await conn.execute("PRAGMA temp_store = MEMORY;")
+    return conn
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    waited: int = 0  # checkouts that found no idle connection
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+
+    def record(self, wait: float, *, had_idle: bool) -> None:
+        self.checkouts += 1
+        if not had_idle:
+            self.waited += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def as_dict(self, prefix: str) -> dict[str, Any]:
+        avg_ms = self.wait_total * 1000 / self.checkouts if self.checkouts else 0.0
+        return {
+            f"{prefix}.checkouts": self.checkouts,
+            f"{prefix}.waited": self.waited,
+            f"{prefix}.wait_avg_ms": round(avg_ms, 3),
+            f"{prefix}.wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+@dataclass
+class WriterStats:
+    batches: int = 0
+    jobs: int = 0
+    failed: int = 0
+    commit_total: float = 0.0
+    lock_wait_total: float = 0.0  # BEGIN IMMEDIATE / COMMIT waiting on another process
+    lock_wait_max: float = 0.0
+    retries: int = 0
+    busy_failures: int = 0  # batches that stayed locked after every retry
+
+    def record_lock_wait(self, wait: float) -> None:
+        self.lock_wait_total += wait
+        self.lock_wait_max = max(self.lock_wait_max, wait)
+
+    def as_dict(self, prefix: str) -> dict[str, Any]:
+        avg_batch = self.jobs / self.batches if self.batches else 0.0
+        avg_commit_ms = self.commit_total * 1000 / self.batches if self.batches else 0.0
+        avg_lock_ms = self.lock_wait_total * 1000 / self.batches if self.batches else 0.0
+        return {
+            f"{prefix}.batches": self.batches,
+            f"{prefix}.jobs": self.jobs,
+            f"{prefix}.failed": self.failed,
+            f"{prefix}.batch_avg": round(avg_batch, 2),
+            f"{prefix}.commit_avg_ms": round(avg_commit_ms, 3),
+            f"{prefix}.lock_wait_avg_ms": round(avg_lock_ms, 3),
+            f"{prefix}.lock_wait_max_ms": round(self.lock_wait_max * 1000, 3),
+            f"{prefix}.retries": self.retries,
+            f"{prefix}.busy_failures": self.busy_failures,
+        }
+
+
+@dataclass
+class _Job:
+    fn: WriteJob
+    future: asyncio.Future[Any]
+    queued_at: float
+    had_idle: bool
+
+
+class _Abort(Exception):
+    """Raised inside the writer when a leased transaction body failed."""
+
+
+def _discard_result(fut: asyncio.Future[Any]) -> None:
+    if not fut.cancelled():
+        fut.exception()
+
+
+def _is_busy(exc: BaseException) -> bool:
+    return isinstance(exc, sqlite3.OperationalError) and ("locked" in str(exc) or "busy" in str(exc))
+
+
+class Pool:
+    """Warm connections opened once: `size` readers plus a single writer.
+
+    The writer connection is owned by one task that takes jobs from a queue and
+    runs everything queued at that moment in a single transaction (group commit).
+    Each job gets its own savepoint, so a failing job only rolls back itself.
+
+    Batches start with BEGIN IMMEDIATE, so the write lock is taken before any
+    job runs and never has to be upgraded halfway. If another process holds
+    it past `busy_timeout_ms`, BEGIN (or COMMIT) is retried with jittered
+    backoff up to `retries` times before the batch fails.
+    """
+
+    def __init__(self, path: str, *, size: int, snapshot_size: int, busy_timeout_ms: int = BUSY_TIMEOUT_MS, retries: int = WRITE_RETRIES) -> None:
+        self.path = path
+        self.size = max(1, size)
+        self.snapshot_size = max(1, snapshot_size)
+        self.busy_timeout_ms = max(0, busy_timeout_ms)
+        self.retries = max(0, retries)
+        self.reader_stats = PoolStats()
+        self.snapshot_stats = PoolStats()
+        self.writer_stats = PoolStats()
+        self.batch_stats = WriterStats()
+        self._idle: Optional[asyncio.Queue[aiosqlite.Connection]] = None
+        self._snapshots: Optional[asyncio.Queue[aiosqlite.Connection]] = None
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._jobs: asyncio.Queue[_Job] = asyncio.Queue()
+        self._task: Optional[asyncio.Task[None]] = None
+        self._busy = False
+        self._open_lock = asyncio.Lock()
+
+    async def open(self) -> None:
+        async with self._open_lock:
+            if self._idle is not None:
+                return
+            self._writer = await _open(self.path, busy_timeout_ms=self.busy_timeout_ms, wal=True, autocommit=True)
+            idle: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+            for _ in range(self.size):
+                idle.put_nowait(await _open(self.path, busy_timeout_ms=self.busy_timeout_ms))
+            snapshots: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+            for _ in range(self.snapshot_size):
+                snapshots.put_nowait(await _open_snapshot(self.path, busy_timeout_ms=self.busy_timeout_ms))
+            self._idle = idle
+            self._snapshots = snapshots
+            self._task = asyncio.create_task(self._run_writer(self._writer))
+
+    async def close(self) -> None:
+        async with self._open_lock:
+            if self._idle is None:
+                return
+            if self._task is not None:
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+                self._task = None
+            for queue in (self._idle, self._snapshots):
+                while queue is not None and not queue.empty():
+                    await queue.get_nowait().close()
+            self._idle = self._snapshots = None
+            if self._writer is not None:
+                await self._writer.close()
+                self._writer = None
+
+    @asynccontextmanager
+    async def _checkout(self, idle: asyncio.Queue[aiosqlite.Connection], stats: PoolStats) -> AsyncIterator[aiosqlite.Connection]:
+        had_idle = not idle.empty()
+        started = time.perf_counter()
+        conn = await idle.get()
+        stats.record(time.perf_counter() - started, had_idle=had_idle)
+        try:
+            yield conn
+        finally:
+            idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        if self._idle is None:
+            await self.open()
+        assert self._idle is not None
+        async with self._checkout(self._idle, self.reader_stats) as conn:
+            yield conn
+
+    @asynccontextmanager
+    async def snapshot(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Read-only connection inside one read transaction: a stable WAL snapshot."""
+        if self._snapshots is None:
+            await self.open()
+        assert self._snapshots is not None
+        async with self._checkout(self._snapshots, self.snapshot_stats) as conn:
+            await conn.execute("BEGIN")
+            try:
+                yield conn
+            finally:
+                await conn.execute("ROLLBACK")
+
+    async def submit(self, fn: WriteJob) -> Any:
+        """Queue a write job; returns its result once the batch has committed."""
+        if self._task is None:
+            await self.open()
+        fut: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
+        had_idle = self._jobs.empty() and not self._busy
+        self._jobs.put_nowait(_Job(fn, fut, time.perf_counter(), had_idle))
+        return await fut
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Lease the write connection for a block of statements.
+
+        The block runs as one job of the current batch and returns after commit.
+        Do not open another write from inside the block: it would wait for this one.
+        """
+        loop = asyncio.get_running_loop()
+        granted: asyncio.Future[aiosqlite.Connection] = loop.create_future()
+        released: asyncio.Future[Optional[BaseException]] = loop.create_future()
+
+        async def lease(conn: aiosqlite.Connection) -> None:
+            if granted.done():  # caller gave up before its turn
+                return
+            granted.set_result(conn)
+            if await released is not None:
+                raise _Abort()
+
+        done = asyncio.ensure_future(self.submit(lease))
+        try:
+            await asyncio.wait((granted, done), return_when=asyncio.FIRST_COMPLETED)
+        except BaseException as exc:
+            granted.cancel()
+            if not released.done():
+                released.set_result(exc)
+            done.add_done_callback(_discard_result)
+            raise
+        if not granted.done():  # the batch failed before this job ran
+            granted.cancel()
+            await done
+        try:
+            yield granted.result()
+        except BaseException as exc:
+            released.set_result(exc)
+            await asyncio.wait((done,))
+            _discard_result(done)  # the caller's own error wins
+            raise
+        released.set_result(None)
+        await done
+
+    async def _run_writer(self, conn: aiosqlite.Connection) -> None:
+        while True:
+            batch = [await self._jobs.get()]
+            while len(batch) < WRITE_BATCH_MAX and not self._jobs.empty():
+                batch.append(self._jobs.get_nowait())
+            self._busy = True
+            try:
+                await self._run_batch(conn, batch)
+            except asyncio.CancelledError:
+                for job in batch:
+                    if not job.future.done():
+                        job.future.cancel()
+                raise
+            finally:
+                self._busy = False
+
+    async def _locked(self, conn: aiosqlite.Connection, sql: str) -> None:
+        """Run BEGIN IMMEDIATE / COMMIT, retrying while another process holds the lock.
+
+        Both are safe to repeat: a busy BEGIN took nothing, a busy COMMIT keeps
+        the transaction open.
+        """
+        started = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    await conn.execute(sql)
+                    return
+                except sqlite3.OperationalError as exc:
+                    if not _is_busy(exc) or attempt >= self.retries:
+                        if _is_busy(exc):
+                            self.batch_stats.busy_failures += 1
+                        raise
+                attempt += 1
+                self.batch_stats.retries += 1
+                await asyncio.sleep(random.uniform(0, min(RETRY_MAX, RETRY_BASE * 2**attempt)))
+        finally:
+            self.batch_stats.record_lock_wait(time.perf_counter() - started)
+
+    async def _run_batch(self, conn: aiosqlite.Connection, batch: list[_Job]) -> None:
+        outcomes: list[tuple[Any, Optional[BaseException]]] = []
+        try:
+            await self._locked(conn, "BEGIN IMMEDIATE")
+            for job in batch:
+                self.writer_stats.record(time.perf_counter() - job.queued_at, had_idle=job.had_idle)
+                await conn.execute("SAVEPOINT job")
+                try:
+                    result = await job.fn(conn)
+                except Exception as exc:
+                    await conn.execute("ROLLBACK TO job")
+                    await conn.execute("RELEASE job")
+                    outcomes.append((None, exc))
+                else:
+                    await conn.execute("RELEASE job")
+                    outcomes.append((result, None))
+            committed = time.perf_counter()
+            await self._locked(conn, "COMMIT")
+            self.batch_stats.commit_total += time.perf_counter() - committed
+        except Exception as exc:
+            if conn.in_transaction:
+                await conn.execute("ROLLBACK")
+            outcomes = [(None, exc)] * len(batch)
+
+        self.batch_stats.batches += 1
+        self.batch_stats.jobs += len(batch)
+        for job, (result, error) in zip(batch, outcomes):
+            if job.future.done():
+                continue
+            if error is None:
+                job.future.set_result(result)
+            else:
+                self.batch_stats.failed += 1
+                job.future.set_exception(error)
 
 
 @dataclass(frozen=True)
 class Db:
     path: str
+    pool_size: int = 4
+    snapshot_pool_size: int = 2
+    busy_timeout_ms: int = BUSY_TIMEOUT_MS
+    write_retries: int = WRITE_RETRIES
+    pool: Pool = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        pool = Pool(
+            self.path,
+            size=self.pool_size,
+            snapshot_size=self.snapshot_pool_size,
+            busy_timeout_ms=self.busy_timeout_ms,
+            retries=self.write_retries,
+        )
+        object.__setattr__(self, "pool", pool)
 
 
 @asynccontextmanager
 async def connect(db: Db) -> AsyncIterator[aiosqlite.Connection]:
-    conn = await aiosqlite.connect(db.path)
-    try:
-        conn.row_factory = aiosqlite.Row
-        await conn.execute("PRAGMA foreign_keys = ON;")
-        await conn.execute("PRAGMA journal_mode = WAL;")
+    """Write connection leased from the writer task; committed with its batch."""
+    async with db.pool.writer() as conn:
         yield conn
-        await conn.commit()
-    finally:
-        await conn.close()
 
 
-async def migrate(db: Db) -> None:
-    async with connect(db) as conn:
-        await conn.execute(
+@asynccontextmanager
+async def read(db: Db) -> AsyncIterator[aiosqlite.Connection]:
+    async with db.pool.reader() as conn:
+        yield conn
+
+
+@asynccontextmanager
+async def snapshot(db: Db) -> AsyncIterator[aiosqlite.Connection]:
+    """Read path for reports and exports; never competes with the writer or OLTP readers."""
+    async with db.pool.snapshot() as conn:
+        yield conn
+
+
+class UnitOfWork:
+    """Statements of one service call; they commit (or roll back) together.
+
+    `SqliteTx` wraps one, so helpers such as `services.audit` ride along in
+    the caller's transaction instead of opening their own.
+    """
+
+    def __init__(self, conn: aiosqlite.Connection) -> None:
+        self.conn = conn
+
+    async def execute(self, sql: str, args: tuple[Any, ...] = ()) -> aiosqlite.Cursor:
+        return await self.conn.execute(sql, args)
+
+    async def insert(self, sql: str, args: tuple[Any, ...] = ()) -> int:
+        cur = await self.conn.execute(sql, args)
+        return int(cur.lastrowid or 0)
+
+    async def fetchval(self, sql: str, args: tuple[Any, ...] = ()) -> Any:
+        return await fetchval(self.conn, sql, args)
+
+    async def fetchone(self, sql: str, args: tuple[Any, ...] = ()) -> Optional[aiosqlite.Row]:
+        return await fetchone(self.conn, sql, args)
+
+    async def fetchall(self, sql: str, args: tuple[Any, ...] = ()) -> list[aiosqlite.Row]:
+        return await fetchall(self.conn, sql, args)
+
+
+@asynccontextmanager
+async def unit_of_work(db: Db) -> AsyncIterator[UnitOfWork]:
+    async with db.pool.writer() as conn:
+        yield UnitOfWork(conn)
+
+
+async def write(db: Db, sql: str, args: tuple[Any, ...] = ()) -> int:
+    """Single statement through the writer queue; returns lastrowid after commit."""
+
+    async def job(conn: aiosqlite.Connection) -> int:
+        cur = await conn.execute(sql, args)
+        return int(cur.lastrowid or 0)
+
+    return await db.pool.submit(job)
+
+
+async def close(db: Db) -> None:
+    await db.pool.close()
+
+
+def stats(db: Db) -> dict[str, Any]:
+    return {
+        **db.pool.reader_stats.as_dict("pool.reader"),
+        **db.pool.snapshot_stats.as_dict("pool.snapshot"),
+        **db.pool.writer_stats.as_dict("pool.writer"),
+        **db.pool.batch_stats.as_dict("writer"),
+    }
+
+
+Backfill = Callable[[aiosqlite.Connection, int, int], Awaitable[Optional[int]]]
+"""(conn, after_id, limit) -> id of the last row handled, or None when finished."""
+
+BACKFILL_CHUNK = 2000
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    statements: tuple[str, ...] = ()
+    backfill: Optional[Backfill] = None
+
+
+async def _backfill_last_sale_date(conn: aiosqlite.Connection, after_id: int, limit: int) -> Optional[int]:
+    # Recomputed from sales, so it is idempotent and agrees with the triggers.
+    cur = await conn.execute("SELECT id FROM customers WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+    ids = [int(r[0]) for r in await cur.fetchall()]
+    if not ids:
+        return None
+    await conn.execute(
+        "UPDATE customers SET last_sale_date = (SELECT MAX(sale_date) FROM sales WHERE customer_id = customers.id) WHERE id BETWEEN ? AND ?",
+        (ids[0], ids[-1]),
+    )
+    return ids[-1]
+
+
+async def _backfill_sale_products(conn: aiosqlite.Connection, after_id: int, limit: int) -> Optional[int]:
+    # Keys are folded in Python (Cyrillic/Latin spelling), so this can't be one UPDATE.
+    # Setting product_id fires trg_products_upd, which adds the sale to the running totals.
+    # sales.product is left as it was; migration 10 empties it once every sale has an id.
+    rows = await fetchall(conn, "SELECT id, product, product_id, created_at FROM sales WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+    if not rows:
+        return None
+    todo = [(int(r["id"]), str(r["product"]), normalize_key(str(r["product"])), str(r["created_at"])) for r in rows if r["product_id"] is None]
+    if todo:
+        await conn.executemany(
+            "INSERT OR IGNORE INTO products(key, name, created_at) VALUES(?,?,?)",
+            [(key, product.strip(), created_at) for _, product, key, created_at in todo],
+        )
+        keys = sorted({key for _, _, key, _ in todo})
+        marks = ",".join("?" * len(keys))
+        ids = {r["key"]: int(r["id"]) for r in await fetchall(conn, f"SELECT id, key FROM products WHERE key IN ({marks})", tuple(keys))}
+        await conn.executemany("UPDATE sales SET product_id=? WHERE id=?", [(ids[key], sale_id) for sale_id, _, key, _ in todo])
+    return int(rows[-1]["id"])
+
+
+async def _backfill_drop_sale_product_text(conn: aiosqlite.Connection, after_id: int, limit: int) -> Optional[int]:
+    # Runs after the products backfill (backfills go in version order), so every sale has its id.
+    last_id = await fetchval(conn, "SELECT MAX(id) FROM (SELECT id FROM sales WHERE id > ? ORDER BY id LIMIT ?)", (after_id, limit))
+    if last_id is None:
+        return None
+    await conn.execute(
+        "UPDATE sales SET product='' WHERE id > ? AND id <= ? AND product_id IS NOT NULL AND product <> ''",
+        (after_id, last_id),
+    )
+    return int(last_id)
+
+
+async def _backfill_customer_search(conn: aiosqlite.Connection, after_id: int, limit: int) -> Optional[int]:
+    rows = await fetchall(conn, "SELECT id, full_name, phone FROM customers WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+    if not rows:
+        return None
+    # trg_customer_search_upd indexes each name as name_key is set.
+    await conn.executemany(
+        "UPDATE customers SET name_key=?, phone_rev=? WHERE id=?",
+        [(normalize_key(str(r["full_name"])), phone_key(str(r["phone"])), int(r["id"])) for r in rows],
+    )
+    return int(rows[-1]["id"])
+
+
+async def _backfill_sales_search(conn: aiosqlite.Connection, after_id: int, limit: int) -> Optional[int]:
+    last_id = await fetchval(conn, "SELECT MAX(id) FROM (SELECT id FROM sales WHERE id > ? ORDER BY id LIMIT ?)", (after_id, limit))
+    if last_id is None:
+        return None
+    # OR REPLACE: trg_sales_search_upd may have indexed a row of this chunk already.
+    await conn.execute(
+        """
+        INSERT OR REPLACE INTO sales_search(rowid, product, comment, tags)
+        SELECT s.id, COALESCE(p.key, s.product), s.comment,
+               'c' || s.customer_id || ' m' || substr(s.sale_date, 1, 4) || substr(s.sale_date, 6, 2)
+        FROM sales s LEFT JOIN products p ON p.id = s.product_id
+        WHERE s.id > ? AND s.id <= ?
+        """,
+        (after_id, last_id),
+    )
+    return int(last_id)
+
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(
+        1,
+        "baseline",
+        (
             """
             CREATE TABLE IF NOT EXISTS customers (
               id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -39,9 +544,7 @@ async def migrate(db: Db) -> None:
               created_at TEXT NOT NULL,
               updated_at TEXT NOT NULL
             );
-            """
-        )
-        await conn.execute(
+            """,
             """
             CREATE TABLE IF NOT EXISTS sales (
               id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -52,9 +555,7 @@ async def migrate(db: Db) -> None:
               sale_date TEXT NOT NULL,
               created_at TEXT NOT NULL
             );
-            """
-        )
-        await conn.execute(
+            """,
             """
             CREATE TABLE IF NOT EXISTS rewards (
               id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -64,9 +565,7 @@ async def migrate(db: Db) -> None:
               note TEXT NOT NULL DEFAULT '',
               created_at TEXT NOT NULL
             );
-            """
-        )
-        await conn.execute(
+            """,
             """
             CREATE TABLE IF NOT EXISTS notifications (
               id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -76,9 +575,7 @@ async def migrate(db: Db) -> None:
               created_at TEXT NOT NULL,
               delivered_at TEXT
             );
-            """
-        )
-        await conn.execute(
+            """,
             """
             CREATE TABLE IF NOT EXISTS audit_logs (
               id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -88,11 +585,364 @@ async def migrate(db: Db) -> None:
               meta_json TEXT NOT NULL,
               at TEXT NOT NULL
             );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_sales_customer_date ON sales(customer_id, sale_date);",
+            "CREATE INDEX IF NOT EXISTS idx_sales_date ON sales(sale_date);",
+            "CREATE INDEX IF NOT EXISTS idx_rewards_customer ON rewards(customer_id);",
             """
-        )
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_customer_date ON sales(customer_id, sale_date);")
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_date ON sales(sale_date);")
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_rewards_customer ON rewards(customer_id);")
+            CREATE TABLE IF NOT EXISTS schema_backfills (
+              version INTEGER PRIMARY KEY,
+              name TEXT NOT NULL,
+              last_id INTEGER NOT NULL DEFAULT 0,
+              done INTEGER NOT NULL DEFAULT 0
+            );
+            """,
+        ),
+    ),
+    Migration(
+        2,
+        "processed_updates",
+        (
+            # update_id is the rowid, so a lookup is one B-tree probe and a row is ~10 bytes.
+            """
+            CREATE TABLE IF NOT EXISTS processed_updates (
+              update_id INTEGER PRIMARY KEY,
+              seen_at INTEGER NOT NULL -- unix seconds
+            );
+            """,
+        ),
+    ),
+    Migration(
+        3,
+        "sales_monthly",
+        (
+            # One row per (month, customer); customer_id 0 holds the month's grand total.
+            """
+            CREATE TABLE IF NOT EXISTS sales_monthly (
+              month TEXT NOT NULL, -- YYYY-MM
+              customer_id INTEGER NOT NULL,
+              cnt INTEGER NOT NULL,
+              total INTEGER NOT NULL,
+              PRIMARY KEY (month, customer_id)
+            ) WITHOUT ROWID;
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_sales_monthly_top ON sales_monthly(month, total DESC, customer_id);",
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_sales_monthly_ins AFTER INSERT ON sales BEGIN
+              INSERT INTO sales_monthly(month, customer_id, cnt, total)
+              VALUES (substr(NEW.sale_date, 1, 7), NEW.customer_id, 1, NEW.amount), (substr(NEW.sale_date, 1, 7), 0, 1, NEW.amount)
+              ON CONFLICT(month, customer_id) DO UPDATE SET cnt = cnt + 1, total = total + excluded.total;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_sales_monthly_del AFTER DELETE ON sales BEGIN
+              UPDATE sales_monthly SET cnt = cnt - 1, total = total - OLD.amount
+              WHERE month = substr(OLD.sale_date, 1, 7) AND customer_id IN (OLD.customer_id, 0);
+              DELETE FROM sales_monthly
+              WHERE month = substr(OLD.sale_date, 1, 7) AND customer_id IN (OLD.customer_id, 0) AND cnt = 0;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_sales_monthly_upd AFTER UPDATE OF customer_id, amount, sale_date ON sales BEGIN
+              UPDATE sales_monthly SET cnt = cnt - 1, total = total - OLD.amount
+              WHERE month = substr(OLD.sale_date, 1, 7) AND customer_id IN (OLD.customer_id, 0);
+              DELETE FROM sales_monthly
+              WHERE month = substr(OLD.sale_date, 1, 7) AND customer_id IN (OLD.customer_id, 0) AND cnt = 0;
+              INSERT INTO sales_monthly(month, customer_id, cnt, total)
+              VALUES (substr(NEW.sale_date, 1, 7), NEW.customer_id, 1, NEW.amount), (substr(NEW.sale_date, 1, 7), 0, 1, NEW.amount)
+              ON CONFLICT(month, customer_id) DO UPDATE SET cnt = cnt + 1, total = total + excluded.total;
+            END;
+            """,
+            # Seeded in the same transaction that creates the triggers, so no sale is
+            # counted twice or missed. One grouped pass over sales; runs once.
+            """
+            INSERT INTO sales_monthly(month, customer_id, cnt, total)
+            SELECT substr(sale_date, 1, 7), customer_id, COUNT(1), SUM(amount) FROM sales GROUP BY 1, 2
+            UNION ALL
+            SELECT substr(sale_date, 1, 7), 0, COUNT(1), SUM(amount) FROM sales GROUP BY 1;
+            """,
+        ),
+    ),
+    Migration(
+        4,
+        "sales_daily",
+        (
+            # Per sale_date: that day's cnt/total and running cum_cnt/cum_total over all
+            # earlier days, so any [start, end] is two seeks. Days without sales have no
+            # row; the nearest earlier row carries the same running totals.
+            """
+            CREATE TABLE IF NOT EXISTS sales_daily (
+              day TEXT PRIMARY KEY, -- YYYY-MM-DD
+              cnt INTEGER NOT NULL,
+              total INTEGER NOT NULL,
+              cum_cnt INTEGER NOT NULL,
+              cum_total INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            """,
+            # A sale shifts the running totals of its own day and every later one;
+            # sales are mostly entered for today, so that is usually a single row.
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_sales_daily_ins AFTER INSERT ON sales BEGIN
+              INSERT OR IGNORE INTO sales_daily(day, cnt, total, cum_cnt, cum_total)
+              SELECT NEW.sale_date, 0, 0, COALESCE(MAX(cum_cnt), 0), COALESCE(MAX(cum_total), 0)
+              FROM (SELECT cum_cnt, cum_total FROM sales_daily WHERE day < NEW.sale_date ORDER BY day DESC LIMIT 1);
+              UPDATE sales_daily
+              SET cnt = cnt + (day = NEW.sale_date),
+                  total = total + (day = NEW.sale_date) * NEW.amount,
+                  cum_cnt = cum_cnt + 1,
+                  cum_total = cum_total + NEW.amount
+              WHERE day >= NEW.sale_date;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_sales_daily_del AFTER DELETE ON sales BEGIN
+              UPDATE sales_daily
+              SET cnt = cnt - (day = OLD.sale_date),
+                  total = total - (day = OLD.sale_date) * OLD.amount,
+                  cum_cnt = cum_cnt - 1,
+                  cum_total = cum_total - OLD.amount
+              WHERE day >= OLD.sale_date;
+              DELETE FROM sales_daily WHERE day = OLD.sale_date AND cnt = 0;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_sales_daily_upd AFTER UPDATE OF amount, sale_date ON sales BEGIN
+              UPDATE sales_daily
+              SET cnt = cnt - (day = OLD.sale_date),
+                  total = total - (day = OLD.sale_date) * OLD.amount,
+                  cum_cnt = cum_cnt - 1,
+                  cum_total = cum_total - OLD.amount
+              WHERE day >= OLD.sale_date;
+              DELETE FROM sales_daily WHERE day = OLD.sale_date AND cnt = 0;
+              INSERT OR IGNORE INTO sales_daily(day, cnt, total, cum_cnt, cum_total)
+              SELECT NEW.sale_date, 0, 0, COALESCE(MAX(cum_cnt), 0), COALESCE(MAX(cum_total), 0)
+              FROM (SELECT cum_cnt, cum_total FROM sales_daily WHERE day < NEW.sale_date ORDER BY day DESC LIMIT 1);
+              UPDATE sales_daily
+              SET cnt = cnt + (day = NEW.sale_date),
+                  total = total + (day = NEW.sale_date) * NEW.amount,
+                  cum_cnt = cum_cnt + 1,
+                  cum_total = cum_total + NEW.amount
+              WHERE day >= NEW.sale_date;
+            END;
+            """,
+            """
+            INSERT INTO sales_daily(day, cnt, total, cum_cnt, cum_total)
+            SELECT day, cnt, total, SUM(cnt) OVER w, SUM(total) OVER w
+            FROM (SELECT sale_date AS day, COUNT(1) AS cnt, SUM(amount) AS total FROM sales GROUP BY sale_date)
+            WINDOW w AS (ORDER BY day ROWS UNBOUNDED PRECEDING);
+            """,
+        ),
+    ),
+    Migration(
+        5,
+        "customers_last_sale_date",
+        (
+            "ALTER TABLE customers ADD COLUMN last_sale_date TEXT;",
+            "CREATE INDEX IF NOT EXISTS idx_customers_status_last_sale ON customers(status, last_sale_date);",
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_customers_last_sale_ins AFTER INSERT ON sales BEGIN
+              UPDATE customers SET last_sale_date = NEW.sale_date
+              WHERE id = NEW.customer_id AND (last_sale_date IS NULL OR last_sale_date < NEW.sale_date);
+            END;
+            """,
+            # Only a delete of the latest sale moves it back; idx_sales_customer_date makes that a seek.
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_customers_last_sale_del AFTER DELETE ON sales BEGIN
+              UPDATE customers SET last_sale_date = (SELECT MAX(sale_date) FROM sales WHERE customer_id = OLD.customer_id)
+              WHERE id = OLD.customer_id AND last_sale_date = OLD.sale_date;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_customers_last_sale_upd AFTER UPDATE OF customer_id, sale_date ON sales BEGIN
+              UPDATE customers SET last_sale_date = (SELECT MAX(sale_date) FROM sales WHERE customer_id = customers.id)
+              WHERE id IN (OLD.customer_id, NEW.customer_id);
+            END;
+            """,
+        ),
+        _backfill_last_sale_date,
+    ),
+    Migration(
+        6,
+        "report_snapshots",
+        (
+            # Latest precomputed report per period (day|mtd|ytd), written by the nightly job.
+            """
+            CREATE TABLE IF NOT EXISTS report_snapshots (
+              period TEXT PRIMARY KEY,
+              as_of TEXT NOT NULL, -- last day covered, YYYY-MM-DD
+              payload TEXT NOT NULL, -- JSON
+              computed_at TEXT NOT NULL
+            ) WITHOUT ROWID;
+            """,
+        ),
+    ),
+    Migration(
+        7,
+        "products",
+        (
+            # One row per normalized name (see utils.normalize_key); name is the first spelling seen.
+            """
+            CREATE TABLE IF NOT EXISTS products (
+              id INTEGER PRIMARY KEY,
+              key TEXT NOT NULL UNIQUE,
+              name TEXT NOT NULL,
+              cnt INTEGER NOT NULL DEFAULT 0,
+              total INTEGER NOT NULL DEFAULT 0,
+              created_at TEXT NOT NULL
+            );
+            """,
+            # sales.product keeps the text until migration 10, so code from before
+            # this migration still shows every product while the backfill runs.
+            "ALTER TABLE sales ADD COLUMN product_id INTEGER REFERENCES products(id);",
+            "CREATE INDEX IF NOT EXISTS idx_sales_product_date ON sales(product_id, sale_date);",
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_products_ins AFTER INSERT ON sales WHEN NEW.product_id IS NOT NULL BEGIN
+              UPDATE products SET cnt = cnt + 1, total = total + NEW.amount WHERE id = NEW.product_id;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_products_del AFTER DELETE ON sales WHEN OLD.product_id IS NOT NULL BEGIN
+              UPDATE products SET cnt = cnt - 1, total = total - OLD.amount WHERE id = OLD.product_id;
+            END;
+            """,
+            # A NULL id matches no product, so the backfill's NULL -> id only adds.
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_products_upd AFTER UPDATE OF product_id, amount ON sales BEGIN
+              UPDATE products SET cnt = cnt - 1, total = total - OLD.amount WHERE id = OLD.product_id;
+              UPDATE products SET cnt = cnt + 1, total = total + NEW.amount WHERE id = NEW.product_id;
+            END;
+            """,
+        ),
+        _backfill_sale_products,
+    ),
+    Migration(
+        8,
+        "customer_search",
+        (
+            # Search keys are folded in Python (utils.normalize_key), so SqliteTx.insert_customer
+            # writes them; the backfill fills in customers created before this.
+            "ALTER TABLE customers ADD COLUMN name_key TEXT;",
+            "ALTER TABLE customers ADD COLUMN phone_rev TEXT;",
+            "CREATE INDEX IF NOT EXISTS idx_customers_name_key ON customers(name_key);",
+            "CREATE INDEX IF NOT EXISTS idx_customers_phone_rev ON customers(phone_rev);",
+            # Trigram index over name_key: any substring of 3+ chars is a lookup, and
+            # matches come back in rowid order, so "newest N" stops early.
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS customer_search USING fts5(
+              name_key, content='customers', content_rowid='id', tokenize='trigram'
+            );
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_customer_search_ins AFTER INSERT ON customers WHEN NEW.name_key IS NOT NULL BEGIN
+              INSERT INTO customer_search(rowid, name_key) VALUES (NEW.id, NEW.name_key);
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_customer_search_del AFTER DELETE ON customers WHEN OLD.name_key IS NOT NULL BEGIN
+              INSERT INTO customer_search(customer_search, rowid, name_key) VALUES ('delete', OLD.id, OLD.name_key);
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_customer_search_upd AFTER UPDATE OF name_key ON customers BEGIN
+              INSERT INTO customer_search(customer_search, rowid, name_key) SELECT 'delete', OLD.id, OLD.name_key WHERE OLD.name_key IS NOT NULL;
+              INSERT INTO customer_search(rowid, name_key) SELECT NEW.id, NEW.name_key WHERE NEW.name_key IS NOT NULL;
+            END;
+            """,
+        ),
+        _backfill_customer_search,
+    ),
+    Migration(
+        9,
+        "sales_search",
+        (
+            # Full-text index over each sale's product (folded key) and comment; rowid = sales.id.
+            # tags holds the customer and month as tokens (search.sale_tags), so those filters
+            # intersect posting lists instead of checking every text match.
+            # It keeps its own copy of the text: the product lives in another table, so
+            # external content would need exact old values to delete.
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS sales_search USING fts5(
+              product, comment, tags, tokenize='unicode61 remove_diacritics 0'
+            );
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_sales_search_ins AFTER INSERT ON sales BEGIN
+              INSERT OR REPLACE INTO sales_search(rowid, product, comment, tags) VALUES (
+                NEW.id,
+                COALESCE((SELECT key FROM products WHERE id = NEW.product_id), NEW.product),
+                NEW.comment,
+                'c' || NEW.customer_id || ' m' || substr(NEW.sale_date, 1, 4) || substr(NEW.sale_date, 6, 2)
+              );
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_sales_search_del AFTER DELETE ON sales BEGIN
+              DELETE FROM sales_search WHERE rowid = OLD.id;
+            END;
+            """,
+            # Also catches the products backfill moving sales.product into product_id.
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_sales_search_upd AFTER UPDATE OF product, product_id, comment, customer_id, sale_date ON sales BEGIN
+              INSERT OR REPLACE INTO sales_search(rowid, product, comment, tags) VALUES (
+                NEW.id,
+                COALESCE((SELECT key FROM products WHERE id = NEW.product_id), NEW.product),
+                NEW.comment,
+                'c' || NEW.customer_id || ' m' || substr(NEW.sale_date, 1, 4) || substr(NEW.sale_date, 6, 2)
+              );
+            END;
+            """,
+        ),
+        _backfill_sales_search,
+    ),
+    # Empties the product text the products backfill (7) left in sales, once it is
+    # done; from here on, going back to code older than migration 7 shows blank products.
+    Migration(10, "sales_product_text", (), _backfill_drop_sale_product_text),
+)
+
+
+async def migrate(db: Db) -> None:
+    """Apply pending migrations, each in its own transaction.
+
+    When the schema is current this is a single `PRAGMA user_version` read.
+    Backfills are only registered here; `run_backfills` does the work later.
+    """
+    async with read(db) as conn:
+        version = int(await fetchval(conn, "PRAGMA user_version") or 0)
+    if version >= MIGRATIONS[-1].version:
+        return
+    for m in MIGRATIONS:
+        if m.version <= version:
+            continue
+        async with connect(db) as conn:
+            for sql in m.statements:
+                await conn.execute(sql)
+            if m.backfill is not None:
+                await conn.execute("INSERT OR IGNORE INTO schema_backfills(version, name) VALUES(?,?)", (m.version, m.name))
+            await conn.execute(f"PRAGMA user_version = {m.version}")
+
+
+async def run_backfills(db: Db, *, chunk: int = BACKFILL_CHUNK) -> None:
+    """Finish registered backfills in small writer jobs so live writes interleave.
+
+    Progress is saved with every chunk, so a restart resumes where it stopped.
+    """
+    by_version = {m.version: m for m in MIGRATIONS}
+    async with read(db) as conn:
+        pending = await fetchall(conn, "SELECT version, last_id FROM schema_backfills WHERE done=0 ORDER BY version")
+    for row in pending:
+        version = int(row["version"])
+        backfill = by_version[version].backfill
+        assert backfill is not None
+        last_id: Optional[int] = int(row["last_id"])
+        while last_id is not None:
+            async with connect(db) as conn:
+                after = last_id
+                last_id = await backfill(conn, after, chunk)
+                await conn.execute(
+                    "UPDATE schema_backfills SET last_id=?, done=? WHERE version=?",
+                    (after if last_id is None else last_id, int(last_id is None), version),
+                )
+            await asyncio.sleep(0)
 
 
 async def fetchval(conn: aiosqlite.Connection, sql: str, args: tuple[Any, ...] = ()) -> Any:
@@ -110,3 +960,22 @@ async def fetchall(conn: aiosqlite.Connection, sql: str, args: tuple[Any, ...] =
     cur = await conn.execute(sql, args)
     return await cur.fetchall()
 
+
+async def iterate(
+    conn: aiosqlite.Connection,
+    sql: str,
+    args: tuple[Any, ...] = (),
+    *,
+    chunk: int = 500,
+) -> AsyncIterator[aiosqlite.Row]:
+    """Stream rows `chunk` at a time instead of materialising the whole result."""
+    cur = await conn.execute(sql, args)
+    try:
+        while True:
+            rows = await cur.fetchmany(chunk)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+    finally:
+        await cur.close()
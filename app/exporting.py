@@ -1,7 +1,8 @@
 from __future__ import annotations
 
+import asyncio
 from io import BytesIO
-from typing import Any
+from typing import Any, AsyncIterable, AsyncIterator, Callable
 
 from openpyxl import Workbook
 from reportlab.lib.pagesizes import A4
@@ -9,34 +10,60 @@ from reportlab.pdfgen import canvas
 
 from .utils import fmt_amount
 
+# Rows are rendered in a worker thread one chunk at a time: openpyxl/reportlab
+# spend ~0.1 ms per row, which would otherwise stall the event loop (and every
+# sale being entered) for the whole length of a large export.
+EXPORT_CHUNK = 500
 
-def customers_to_xlsx(customers: list[dict[str, Any]]) -> BytesIO:
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Customers"
-    ws.append(["ID", "Ism", "Telefon", "Status", "Jami savdo", "Level", "Chat ID"])
-    for c in customers:
-        ws.append([c["id"], c["full_name"], c["phone"], c["status"], c["total_spent"], c["level"], c["chat_id"]])
-    bio = BytesIO()
-    wb.save(bio)
-    bio.seek(0)
-    return bio
 
+async def _chunks(rows: AsyncIterable[dict[str, Any]]) -> AsyncIterator[list[dict[str, Any]]]:
+    batch: list[dict[str, Any]] = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= EXPORT_CHUNK:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _to_xlsx(title: str, header: list[str], rows: AsyncIterable[dict[str, Any]], to_cells: Callable[[dict[str, Any]], list[Any]]) -> BytesIO:
+    # write_only keeps memory flat: rows go straight to a temp file.
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    ws.append(header)
+
+    def append(batch: list[dict[str, Any]]) -> None:
+        for row in batch:
+            ws.append(to_cells(row))
 
-def sales_to_xlsx(sales: list[dict[str, Any]]) -> BytesIO:
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Sales"
-    ws.append(["ID", "Sana", "Summa", "Mahsulot", "Izoh", "Mijoz ID", "Mijoz", "Telefon"])
-    for s in sales:
-        ws.append([s.get("id"), s.get("sale_date"), s.get("amount"), s.get("product"), s.get("comment"), s.get("customer_id"), s.get("full_name"), s.get("phone")])
+    async for batch in _chunks(rows):
+        await asyncio.to_thread(append, batch)
     bio = BytesIO()
-    wb.save(bio)
+    await asyncio.to_thread(wb.save, bio)
     bio.seek(0)
     return bio
 
 
-def customers_to_pdf(customers: list[dict[str, Any]], title: str = "Mijozlar ro'yxati") -> BytesIO:
+async def customers_to_xlsx(customers: AsyncIterable[dict[str, Any]]) -> BytesIO:
+    return await _to_xlsx(
+        "Customers",
+        ["ID", "Ism", "Telefon", "Status", "Jami savdo", "Level", "Chat ID"],
+        customers,
+        lambda c: [c["id"], c["full_name"], c["phone"], c["status"], c["total_spent"], c["level"], c["chat_id"]],
+    )
+
+
+async def sales_to_xlsx(sales: AsyncIterable[dict[str, Any]]) -> BytesIO:
+    return await _to_xlsx(
+        "Sales",
+        ["ID", "Sana", "Summa", "Mahsulot", "Izoh", "Mijoz ID", "Mijoz", "Telefon"],
+        sales,
+        lambda s: [s.get("id"), s.get("sale_date"), s.get("amount"), s.get("product"), s.get("comment"), s.get("customer_id"), s.get("full_name"), s.get("phone")],
+    )
+
+
+async def customers_to_pdf(customers: AsyncIterable[dict[str, Any]], title: str = "Mijozlar ro'yxati") -> BytesIO:
     bio = BytesIO()
     c = canvas.Canvas(bio, pagesize=A4)
     width, height = A4
@@ -46,16 +73,20 @@ def customers_to_pdf(customers: list[dict[str, Any]], title: str = "Mijozlar ro'
     y -= 30
     c.setFont("Helvetica", 10)
 
-    for row in customers:
-        line = f"#{row['id']}  {row['full_name']}  {row['phone']}  [{row['status']}]  {fmt_amount(int(row['total_spent']))}  {row['level']}"
-        c.drawString(40, y, line[:120])
-        y -= 14
-        if y < 60:
-            c.showPage()
-            y = height - 50
-            c.setFont("Helvetica", 10)
+    def draw(batch: list[dict[str, Any]]) -> None:
+        nonlocal y
+        for row in batch:
+            line = f"#{row['id']}  {row['full_name']}  {row['phone']}  [{row['status']}]  {fmt_amount(int(row['total_spent']))}  {row['level']}"
+            c.drawString(40, y, line[:120])
+            y -= 14
+            if y < 60:
+                c.showPage()
+                y = height - 50
+                c.setFont("Helvetica", 10)
+
+    async for batch in _chunks(customers):
+        await asyncio.to_thread(draw, batch)
     c.showPage()
-    c.save()
+    await asyncio.to_thread(c.save)
     bio.seek(0)
     return bio
-
@@ -2,14 +2,21 @@ from __future__ import annotations
 
 from datetime import date, datetime, timedelta
 import re
+from typing import Any
 
 from aiogram import F, Router  # pyright: ignore[reportMissingImports]
 from aiogram.filters import Command, CommandStart  # pyright: ignore[reportMissingImports]
 from aiogram.fsm.context import FSMContext  # pyright: ignore[reportMissingImports]
-from aiogram.types import CallbackQuery, Message  # pyright: ignore[reportMissingImports]
+from aiogram.types import (  # pyright: ignore[reportMissingImports]
+    CallbackQuery,
+    InlineKeyboardMarkup,
+    InlineQuery,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+    Message,
+)
 
 from .config import Config
-from .db import Db
 from .exporting import customers_to_pdf, customers_to_xlsx, sales_to_xlsx
 from .keyboards import (
     ask_phone_keyboard,
@@ -25,31 +32,47 @@ from .keyboards import (
     main_menu_admin_inline,
     main_menu_customer,
     main_menu_customer_inline,
+    pager,
+    pick_customer,
     reports_menu,
     reports_menu_inline,
     sales_menu,
     sales_menu_inline,
 )
 from .services import (
+    Customer,
     add_manual_reward,
     add_sale,
-    all_customers_with_chat,
-    active_customers_with_chat,
+    count_customers_with_chat,
     create_customer,
+    customer_sales_stats,
     delete_last_sale,
     delete_customer,
     delete_reward,
     delete_sale_by_id,
     find_customer,
     get_customer,
-    get_customer_by_chat,
+    iter_customers,
+    iter_customers_with_chat,
+    iter_sales_between,
     link_customer_chat,
     list_customers,
     list_rewards,
     list_sales_for_customer,
+    lifetime_rank,
+    monthly_leaderboard,
+    monthly_rank,
     monthly_report,
-    sales_between,
+    period_reports,
+    sales_analytics,
+    pivot_report,
+    product_report,
+    range_summary,
+    recompute_customer_totals,
+    report_cache_stats,
+    search_sales,
     set_customer_status,
+    suggest_customers,
 )
 from .states import (
     AdminBroadcast,
@@ -61,21 +84,31 @@ from .states import (
     AdminRewardDelete,
     AdminReportCustomerHistory,
     AdminReportMonthly,
+    AdminReportPivot,
     AdminReportRange,
     AdminSaleDeleteById,
     AdminSaleAdd,
+    AdminSaleSearch,
 )
-from .utils import fmt_amount, parse_amount
+from .middlewares import ActorMiddleware
+from .models import PIVOT_DIMENSIONS, PIVOT_METRICS, Actor
+from .search import SALE_SEARCH_CANDIDATES
+from .storage import Storage
+from .utils import fmt_amount, parse_amount, parse_date
 
+PIVOT_PAGE_SIZE = 20
+PRODUCT_REPORT_SIZE = 20
+SALE_SEARCH_PAGE_SIZE = 10
+ALL_DATES = ("0001-01-01", "9999-12-31")
+SUGGEST_LIMIT = 20  # inline results per query (Telegram allows 50)
+WEEKDAYS = ("Yakshanba", "Dushanba", "Seshanba", "Chorshanba", "Payshanba", "Juma", "Shanba")
 
-def build_router(db: Db, cfg: Config) -> Router:
-    router = Router()
 
-    def is_admin(telegram_id: int) -> bool:
-        return int(telegram_id) in set(cfg.admin_telegram_ids)
+def build_router(db: Storage, cfg: Config) -> Router:
+    router = Router()
 
-    async def show_menu(message: Message) -> None:
-        if is_admin(message.from_user.id):
+    async def show_menu(message: Message, actor: Actor) -> None:
+        if actor.is_admin:
             text = (
                 "━━━━━━━━━━━━━━━━━━━━\n"
                 "⚙️ ADMIN PANELI\n"
@@ -84,7 +117,7 @@ def build_router(db: Db, cfg: Config) -> Router:
             )
             await message.answer(text, reply_markup=main_menu_admin(), parse_mode="HTML")
             return
-        customer = await get_customer_by_chat(db, chat_id=message.from_user.id)
+        customer = actor.customer
         if not customer:
             text = (
                 "━━━━━━━━━━━━━━━━━━━━\n"
@@ -102,15 +135,114 @@ def build_router(db: Db, cfg: Config) -> Router:
         )
         await message.answer(text, reply_markup=main_menu_customer(), parse_mode="HTML")
 
+    def last_sale_line(customer: Customer) -> str:
+        days = customer.days_since_last_sale(date.today())
+        if days is None:
+            return ""
+        return "🕒 Oxirgi savdo: bugun\n" if days <= 0 else f"🕒 Oxirgi savdo: {days} kun oldin\n"
+
+    async def standing_lines(customer: Customer) -> str:
+        text = ""
+        overall = await lifetime_rank(db, customer_id=customer.id)
+        if overall is not None:
+            place, buyers = overall
+            text += f"🏅 Reyting: #{place} / {buyers} (top {max(1, -(-place * 100 // buyers))}%)\n"
+        month = await monthly_rank(db, customer_id=customer.id)
+        if month is not None:
+            text += f"📅 Bu oy: #{month[0]}\n"
+        return text
+
+    async def winners_text() -> str:
+        top = await monthly_leaderboard(db, limit=cfg.winners_top_n)
+        if not top:
+            return "🏆 Oylik g'oliblar: bu oy hali savdo yo'q."
+        return f"🏆 Oylik g'oliblar (Top {cfg.winners_top_n}):\n\n" + "\n".join(
+            [f"{i}. #{t['customer_id']} {t['full_name']} ({t['phone']}): {fmt_amount(int(t['sum_amount']))}" for i, t in enumerate(top, 1)]
+        )
+
+    async def period_reports_text() -> str:
+        reps = await period_reports(db, tz=cfg.tz)
+        blocks = []
+        for key, title in (("day", "Kecha"), ("mtd", "Oy boshidan"), ("ytd", "Yil boshidan")):
+            rep = reps[key]
+            blocks.append(
+                f"📈 {title} ({rep['start']} .. {rep['end']})\n"
+                f"Jami: {fmt_amount(rep['total'])}\n"
+                f"Savdolar soni: {rep['count']}\n"
+                f"O‘sish: {rep['growth_pct']:.2f}%\n"
+                + "\n".join([f"- #{t['customer_id']} {t['full_name']}: {fmt_amount(int(t['sum_amount']))}" for t in rep["top"]])
+            )
+        return "\n\n".join(blocks)
+
+    def pivot_line(row: dict[str, Any], dims: tuple[str, ...], metrics: tuple[str, ...]) -> str:
+        keys = [WEEKDAYS[row[d]] if d == "weekday" else str(row[d]) for d in dims]
+        values = {
+            "sum": lambda v: f"Jami {fmt_amount(int(v or 0))}",
+            "count": lambda v: f"{v} ta",
+            "avg": lambda v: f"o‘rtacha {fmt_amount(round(v or 0))}",
+            "customers": lambda v: f"{v} mijoz",
+        }
+        return " | ".join(keys + [values[m](row[m]) for m in metrics])
+
+    async def pivot_page(spec: dict[str, Any], page: int) -> tuple[str, InlineKeyboardMarkup]:
+        dims, metrics = tuple(spec["dims"]), tuple(spec["metrics"])
+        rows = await pivot_report(db, start_date=spec["start"], end_date=spec["end"], dims=dims, metrics=metrics)
+        pages = max(1, -(-len(rows) // PIVOT_PAGE_SIZE))
+        page = min(max(page, 0), pages - 1)
+        chunk = rows[page * PIVOT_PAGE_SIZE : (page + 1) * PIVOT_PAGE_SIZE]
+        head = f"🧮 Kesim ({spec['start']} .. {spec['end']}): {', '.join(dims) or 'jami'}\n\n"
+        body = "\n".join(pivot_line(r, dims, metrics) for r in chunk) or "Savdo yo‘q."
+        return head + body, pager("admin:pivot:", page, pages)
+
+    async def sale_search_page(spec: dict[str, Any], page: int) -> tuple[str, InlineKeyboardMarkup]:
+        page = max(page, 0)
+        total, rows = await search_sales(
+            db,
+            query=spec["query"],
+            start_date=spec["start"],
+            end_date=spec["end"],
+            customer_id=spec["customer_id"],
+            limit=SALE_SEARCH_PAGE_SIZE,
+            offset=page * SALE_SEARCH_PAGE_SIZE,
+        )
+        if not rows and page:
+            return await sale_search_page(spec, 0)
+        pages = max(1, -(-total // SALE_SEARCH_PAGE_SIZE))
+        period = "barcha sanalar" if (spec["start"], spec["end"]) == ALL_DATES else f"{spec['start']} .. {spec['end']}"
+        found = f"eng yangi {total} tasi" if total >= SALE_SEARCH_CANDIDATES else f"{total} ta"
+        head = f"🔎 «{spec['query']}» ({period}{', ' + spec['customer'] if spec['customer'] else ''}): {found}\n\n"
+        lines = [
+            f"#{r['id']} {r['sale_date']} | #{r['customer_id']} {r['full_name']} | {r['product']} | {fmt_amount(int(r['amount']))}"
+            + (f" | {r['comment']}" if r["comment"] else "")
+            for r in rows
+        ]
+        return head + ("\n".join(lines) or "Savdo topilmadi."), pager("admin:sale_search:", page, pages)
+
+    async def analytics_text() -> str:
+        res = await sales_analytics(db)
+        lines = [f"🧭 RFM segmentlar ({res.customers} mijoz, {res.sales} savdo):"]
+        for seg in res.segments:
+            lines.append(f"- {seg.name}: {seg.customers} mijoz, {fmt_amount(seg.monetary)}")
+        lines.append("\n📆 Kohortalar (birinchi xarid oyi: hajm | keyingi oylarda qaytganlar %):")
+        for month, size, row in zip(res.cohorts.months, res.cohorts.sizes, res.cohorts.retention):
+            lines.append(f"{month}: {size} | " + " ".join(f"{share * 100:.0f}" for share in row[1:7]))
+        lines.append("\n⏱ " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in res.timings_ms.items()))
+        return "\n".join(lines)
+
+    async def products_text() -> str:
+        rows = await product_report(db, limit=PRODUCT_REPORT_SIZE)
+        lines = [f"{i}. {r['name']} — {fmt_amount(int(r['total']))} ({r['cnt']} ta)" for i, r in enumerate(rows, start=1)]
+        return "📦 Eng ko‘p sotilgan mahsulotlar:\n\n" + ("\n".join(lines) or "Savdo yo‘q.")
+
     @router.message(CommandStart())
-    async def cmd_start(message: Message, state: FSMContext) -> None:
+    async def cmd_start(message: Message, state: FSMContext, actor: Actor) -> None:
         await state.clear()
-        await show_menu(message)
+        await show_menu(message, actor)
 
     @router.message(Command("admin"))
     @router.message(F.text == "/admin")
-    async def cmd_admin(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def cmd_admin(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.clear()
         text = (
@@ -122,9 +254,9 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer(text, reply_markup=main_menu_admin(), parse_mode="HTML")
 
     @router.message(Command("whoami"))
-    async def cmd_whoami(message: Message) -> None:
+    async def cmd_whoami(message: Message, actor: Actor) -> None:
         tid = int(message.from_user.id)
-        role = "admin" if is_admin(tid) else "mijoz"
+        role = "admin" if actor.is_admin else "mijoz"
         await message.answer(
             f"Sizning Telegram ID: <code>{tid}</code>\n"
             f"Sozlangan ADMIN_TELEGRAM_ID(S): <code>{','.join(map(str, cfg.admin_telegram_ids))}</code>\n"
@@ -132,6 +264,39 @@ def build_router(db: Db, cfg: Config) -> Router:
             parse_mode="HTML",
         )
 
+    @router.message(Command("stats"))
+    async def cmd_stats(message: Message, actor: Actor, actors: ActorMiddleware) -> None:
+        if not actor.is_admin:
+            return
+        lines = [f"{k}: {v}" for k, v in {**db.stats(), **report_cache_stats(db), **actors.stats()}.items()]
+        await message.answer("📈 Ichki statistika:\n\n" + "\n".join(lines))
+
+    @router.message(Command("recompute_totals"))
+    async def cmd_recompute_totals(message: Message, actor: Actor) -> None:
+        if not actor.is_admin:
+            return
+        fixed = await recompute_customer_totals(db, tz=cfg.tz)
+        await message.answer(f"🔧 Jami savdolar qayta hisoblandi. Tuzatildi: {fixed} ta mijoz")
+
+    # ---- Admin customer typeahead (inline mode). A picked result sends "#<id>",
+    # which every customer_query step resolves as an exact id.
+    @router.inline_query()
+    async def inline_customers(query: InlineQuery, actor: Actor) -> None:
+        if not actor.is_admin:
+            await query.answer([], cache_time=0, is_personal=True)
+            return
+        found = await suggest_customers(db, query=query.query, limit=SUGGEST_LIMIT)
+        results = [
+            InlineQueryResultArticle(
+                id=str(cid),
+                title=f"#{cid} {full_name}",
+                description=phone,
+                input_message_content=InputTextMessageContent(message_text=f"#{cid}"),
+            )
+            for cid, full_name, phone in found
+        ]
+        await query.answer(results, cache_time=0, is_personal=True)
+
     # ---- Customer phone linking
     @router.message(F.contact)
     async def on_contact(message: Message) -> None:
@@ -151,8 +316,8 @@ def build_router(db: Db, cfg: Config) -> Router:
     # ---- Common menu callbacks
     # ---- Reply keyboard text handlers (tugmalar text sifatida keladi)
     @router.message(F.text == "👤 Mijozlar")
-    async def msg_admin_customers(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_admin_customers(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.clear()
         text = (
@@ -164,8 +329,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer(text, reply_markup=customers_menu(), parse_mode="HTML")
 
     @router.message(F.text == "💰 Savdo")
-    async def msg_admin_sales(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_admin_sales(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.clear()
         text = (
@@ -177,8 +342,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer(text, reply_markup=sales_menu(), parse_mode="HTML")
 
     @router.message(F.text == "📊 Hisobotlar")
-    async def msg_admin_reports(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_admin_reports(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.clear()
         text = (
@@ -190,8 +355,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer(text, reply_markup=reports_menu(), parse_mode="HTML")
 
     @router.message(F.text == "🎁 Bonuslar")
-    async def msg_admin_bonuses(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_admin_bonuses(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.clear()
         text = (
@@ -203,15 +368,15 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer(text, reply_markup=bonuses_menu(), parse_mode="HTML")
 
     @router.message(F.text == "📢 Xabar yuborish")
-    async def msg_admin_broadcast(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_admin_broadcast(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.set_state(AdminBroadcast.audience)
         await message.answer("Kimga yuborilsin? `all` yoki `active` deb yozing:", reply_markup=main_menu_admin())
 
     @router.message(F.text == "📤 Eksport")
-    async def msg_admin_export(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_admin_export(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.clear()
         text = (
@@ -224,15 +389,15 @@ def build_router(db: Db, cfg: Config) -> Router:
 
     # ---- Submenyu reply tugmalari (pastda ko'rinadi)
     @router.message(F.text == "➕ Yangi mijoz qo'shish")
-    async def msg_customer_add(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_customer_add(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.set_state(AdminCustomerAdd.full_name)
         await message.answer("Yangi mijoz ismini kiriting:", reply_markup=customers_menu())
 
     @router.message(F.text == "📋 Mijozlar ro'yxati")
-    async def msg_customer_list(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_customer_list(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.clear()
         rows = await list_customers(db, limit=50)
@@ -245,22 +410,22 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer(text, reply_markup=customers_menu())
 
     @router.message(F.text == "🔍 Qidirish")
-    async def msg_customer_search(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_customer_search(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.set_state(AdminCustomerSearch.query)
         await message.answer("Qidiruv: ism/telefon/ID kiriting:", reply_markup=customers_menu())
 
     @router.message(F.text == "🗑️ Mijozni o'chirish")
-    async def msg_customer_delete(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_customer_delete(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.set_state(AdminCustomerDelete.customer_query)
-        await message.answer("O‘chirish uchun mijoz ID yoki ism/telefon kiriting:", reply_markup=customers_menu())
+        await message.answer("O‘chirish uchun mijoz ID yoki ism/telefon kiriting:", reply_markup=pick_customer())
 
     @router.message(AdminCustomerDelete.customer_query)
-    async def st_customer_delete(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_customer_delete(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         q = (message.text or "").strip()
         cid: int | None = None
@@ -281,29 +446,37 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer(f"🗑️ Mijoz o‘chirildi: #{cid}", reply_markup=customers_menu())
 
     @router.message(F.text == "➕ Yangi savdo kiritish")
-    async def msg_sale_add(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_sale_add(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.set_state(AdminSaleAdd.customer_query)
-        await message.answer("Mijoz tanlang: ism/telefon/ID yozing:", reply_markup=sales_menu())
+        await message.answer("Mijoz tanlang: ism/telefon/ID yozing:", reply_markup=pick_customer())
+
+    @router.message(F.text == "🔎 Savdo qidirish")
+    async def msg_sale_search(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            return
+        await state.clear()
+        await state.set_state(AdminSaleSearch.query)
+        await message.answer("Savdo qidirish: mahsulot yoki izohdagi so‘zlarni kiriting (masalan: armatura 12):", reply_markup=sales_menu())
 
     @router.message(F.text == "🗑️ Oxirgi savdoni o'chirish")
-    async def msg_sale_delete_last(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_sale_delete_last(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.set_state(AdminReportCustomerHistory.customer_query)
         await message.answer("Oxirgi savdoni o'chirish: mijoz ism/telefon/ID kiriting:", reply_markup=sales_menu())
 
     @router.message(F.text == "🗑️ Savdoni ID bo'yicha o'chirish")
-    async def msg_sale_delete_by_id(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_sale_delete_by_id(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.set_state(AdminSaleDeleteById.sale_id)
         await message.answer("Savdo ID kiriting:", reply_markup=sales_menu())
 
     @router.message(AdminSaleDeleteById.sale_id)
-    async def st_sale_delete_by_id(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_sale_delete_by_id(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         raw = (message.text or "").strip()
         if not raw.isdigit():
@@ -317,29 +490,58 @@ def build_router(db: Db, cfg: Config) -> Router:
             return
         await message.answer(f"🗑️ Savdo o‘chirildi. SaleID={sid}", reply_markup=sales_menu())
     @router.message(F.text == "📅 Oylik hisobot")
-    async def msg_report_monthly(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_report_monthly(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.set_state(AdminReportMonthly.year_month)
         await message.answer("Oylik hisobot: YYYY-MM kiriting (masalan 2026-02):", reply_markup=reports_menu())
 
     @router.message(F.text == "👤 Mijoz tarixi")
-    async def msg_report_customer_history(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_report_customer_history(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.set_state(AdminReportCustomerHistory.customer_query)
         await message.answer("Mijoz tarixi: ism/telefon/ID kiriting:", reply_markup=reports_menu())
 
     @router.message(F.text == "📆 Sana oralig'i hisobot")
-    async def msg_report_range(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_report_range(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.set_state(AdminReportRange.start)
         await message.answer("Boshlanish sana (YYYY-MM-DD):", reply_markup=reports_menu())
 
+    @router.message(F.text == "📈 Kun / oy / yil")
+    async def msg_report_periods(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            return
+        await state.clear()
+        await message.answer(await period_reports_text(), reply_markup=reports_menu())
+
+    @router.message(F.text == "🧮 Kesim hisobot")
+    async def msg_report_pivot(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            return
+        await state.clear()
+        await state.set_state(AdminReportPivot.start)
+        await message.answer("Boshlanish sana (YYYY-MM-DD):", reply_markup=reports_menu())
+
+    @router.message(F.text == "🧭 RFM va kohortalar")
+    async def msg_report_rfm(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            return
+        await state.clear()
+        await message.answer(await analytics_text(), reply_markup=reports_menu())
+
+    @router.message(F.text == "📦 Mahsulotlar")
+    async def msg_report_products(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            return
+        await state.clear()
+        await message.answer(await products_text(), reply_markup=reports_menu())
+
     @router.message(F.text == "📜 Bonuslar ro'yxati")
-    async def msg_bonus_list(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_bonus_list(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.clear()
         text = (
@@ -350,22 +552,22 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer(text, reply_markup=bonuses_menu())
 
     @router.message(F.text == "➕ Yutuq kiritish")
-    async def msg_bonus_manual_add(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_bonus_manual_add(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.set_state(AdminManualReward.customer_query)
-        await message.answer("Yutuq kiritish: mijoz ism/telefon/ID kiriting:", reply_markup=bonuses_menu())
+        await message.answer("Yutuq kiritish: mijoz ism/telefon/ID kiriting:", reply_markup=pick_customer())
 
     @router.message(F.text == "🗑️ Yutuqni o'chirish")
-    async def msg_bonus_delete(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_bonus_delete(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.set_state(AdminRewardDelete.customer_query)
-        await message.answer("Mijoz tanlang: ism/telefon/ID kiriting:", reply_markup=bonuses_menu())
+        await message.answer("Mijoz tanlang: ism/telefon/ID kiriting:", reply_markup=pick_customer())
 
     @router.message(AdminRewardDelete.customer_query)
-    async def st_reward_delete_customer(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_reward_delete_customer(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         q = (message.text or "").strip()
         res = await find_customer(db, query=q, limit=1)
@@ -384,8 +586,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer("Yutuqlar (oxirgi 20):\n\n" + "\n".join(lines) + "\n\nO‘chirish uchun RewardID kiriting:", reply_markup=bonuses_menu())
 
     @router.message(AdminRewardDelete.reward_id)
-    async def st_reward_delete_id(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_reward_delete_id(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         raw = (message.text or "").strip()
         if not raw.isdigit():
@@ -399,47 +601,38 @@ def build_router(db: Db, cfg: Config) -> Router:
             return
         await message.answer(f"🗑️ Yutuq o‘chirildi. RewardID={rid}", reply_markup=bonuses_menu())
     @router.message(F.text == "🏆 Oylik g'oliblar")
-    async def msg_winners_monthly(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_winners_monthly(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.clear()
-        today = date.today()
-        rep = await monthly_report(db, year=today.year, month=today.month)
-        text = "🏆 Oylik g'oliblar (Top 5):\n\n" + "\n".join(
-            [f"- #{t['customer_id']} {t['full_name']} ({t['phone']}): {fmt_amount(int(t['sum_amount']))}" for t in rep["top5"]]
-        )
-        await message.answer(text, reply_markup=bonuses_menu())
+        await message.answer(await winners_text(), reply_markup=bonuses_menu())
 
     @router.message(F.text == "📄 Mijozlar (PDF)")
-    async def msg_export_customers_pdf(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_export_customers_pdf(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.clear()
-        rows = await list_customers(db, limit=5000)
-        data = [c.__dict__ for c in rows]
-        bio = customers_to_pdf(data)
+        bio = await customers_to_pdf(c.__dict__ async for c in iter_customers(db))
         await message.answer_document(("customers.pdf", bio), caption="Mijozlar ro'yxati (PDF)", reply_markup=export_menu())
 
     @router.message(F.text == "📊 Mijozlar (Excel)")
-    async def msg_export_customers_xlsx(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_export_customers_xlsx(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.clear()
-        rows = await list_customers(db, limit=5000)
-        data = [c.__dict__ for c in rows]
-        bio = customers_to_xlsx(data)
+        bio = await customers_to_xlsx(c.__dict__ async for c in iter_customers(db))
         await message.answer_document(("customers.xlsx", bio), caption="Mijozlar ro'yxati (Excel)", reply_markup=export_menu())
 
     @router.message(F.text == "📊 Savdolar (Excel)")
-    async def msg_export_sales_range(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_export_sales_range(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.set_state(AdminExportSalesRange.start)
         await message.answer("Savdolar eksporti: start sana (YYYY-MM-DD):", reply_markup=export_menu())
 
     @router.message(F.text == "🔙 Orqaga")
-    async def msg_admin_back(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def msg_admin_back(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         await state.clear()
         text = (
@@ -452,8 +645,8 @@ def build_router(db: Db, cfg: Config) -> Router:
 
     # Mijozlar uchun reply keyboard handlers
     @router.message(F.text == "👤 Shaxsiy kabinet")
-    async def msg_customer_profile(message: Message) -> None:
-        customer = await get_customer_by_chat(db, chat_id=message.from_user.id)
+    async def msg_customer_profile(message: Message, actor: Actor) -> None:
+        customer = actor.customer
         if not customer:
             await message.answer("Telefonni yuboring:", reply_markup=ask_phone_keyboard())
             return
@@ -467,22 +660,22 @@ def build_router(db: Db, cfg: Config) -> Router:
             f"💰 Jami savdo:\n"
             f"   <b>{fmt_amount(customer.total_spent)}</b>\n\n"
             f"{level_emoji} Daraja: <b>{customer.level}</b>\n"
+            f"{await standing_lines(customer)}"
+            f"{last_sale_line(customer)}"
             "━━━━━━━━━━━━━━━━━━━━"
         )
         await message.answer(text, reply_markup=main_menu_customer(), parse_mode="HTML")
 
     @router.message(F.text == "💰 Mening savdolarim")
-    async def msg_customer_total(message: Message) -> None:
-        customer = await get_customer_by_chat(db, chat_id=message.from_user.id)
+    async def msg_customer_total(message: Message, actor: Actor) -> None:
+        customer = actor.customer
         if not customer:
             await message.answer("Telefonni yuboring:", reply_markup=ask_phone_keyboard())
             return
-        all_sales = await list_sales_for_customer(db, customer_id=customer.id, limit=10000)
-        sales_count = len(all_sales)
+        sales_count, _ = await customer_sales_stats(db, customer_id=customer.id)
         today = date.today()
         month_start = date(today.year, today.month, 1)
-        month_sales = [s for s in all_sales if s['sale_date'] >= month_start.isoformat()]
-        month_total = sum(int(s['amount']) for s in month_sales)
+        month_count, month_total = await customer_sales_stats(db, customer_id=customer.id, since=month_start.isoformat())
         level_emoji = {"Bronze": "🥉", "Silver": "🥈", "Gold": "🥇"}.get(customer.level, "⭐")
         text = (
             "━━━━━━━━━━━━━━━━━━━━\n"
@@ -493,15 +686,15 @@ def build_router(db: Db, cfg: Config) -> Router:
             f"   Savdolar soni: <b>{sales_count}</b> ta\n\n"
             f"📅 Bu oy:\n"
             f"   <b>{fmt_amount(month_total)}</b>\n"
-            f"   Savdolar: <b>{len(month_sales)}</b> ta\n\n"
+            f"   Savdolar: <b>{month_count}</b> ta\n\n"
             f"{level_emoji} Daraja: <b>{customer.level}</b>\n"
             "━━━━━━━━━━━━━━━━━━━━"
         )
         await message.answer(text, reply_markup=main_menu_customer(), parse_mode="HTML")
 
     @router.message(F.text == "🧾 Savdo tarixi")
-    async def msg_customer_history(message: Message) -> None:
-        customer = await get_customer_by_chat(db, chat_id=message.from_user.id)
+    async def msg_customer_history(message: Message, actor: Actor) -> None:
+        customer = actor.customer
         if not customer:
             await message.answer("Telefonni yuboring:", reply_markup=ask_phone_keyboard())
             return
@@ -533,8 +726,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer(text, reply_markup=customer_history_filters(), parse_mode="HTML")
 
     @router.message(F.text == "🎁 Bonuslar")
-    async def msg_customer_rewards(message: Message) -> None:
-        customer = await get_customer_by_chat(db, chat_id=message.from_user.id)
+    async def msg_customer_rewards(message: Message, actor: Actor) -> None:
+        customer = actor.customer
         if not customer:
             await message.answer("Telefonni yuboring:", reply_markup=ask_phone_keyboard())
             return
@@ -630,8 +823,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer("Telefon raqam (faqat raqam): masalan 998901234567")
 
     @router.message(AdminCustomerAdd.phone)
-    async def st_customer_add_phone(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_customer_add_phone(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         phone = re.sub(r"[^\d]", "", message.text or "")
         if len(phone) < 9:
@@ -669,8 +862,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await cb.answer()
 
     @router.message(AdminCustomerSearch.query)
-    async def st_customer_search(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_customer_search(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         q = (message.text or "").strip()
         res = await find_customer(db, query=q, limit=20)
@@ -683,8 +876,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer(text, reply_markup=main_menu_admin(), parse_mode="Markdown")
 
     @router.message(F.text.regexp(r"^status\s+\d+\s+(active|inactive)$"))
-    async def cmd_status(message: Message) -> None:
-        if not is_admin(message.from_user.id):
+    async def cmd_status(message: Message, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         parts = (message.text or "").split()
         customer_id = int(parts[1])
@@ -713,12 +906,12 @@ def build_router(db: Db, cfg: Config) -> Router:
     @router.callback_query(F.data == "admin:sale_add")
     async def cb_sale_add(cb: CallbackQuery, state: FSMContext) -> None:
         await state.set_state(AdminSaleAdd.customer_query)
-        await cb.message.edit_text("Mijoz tanlang: ism/telefon/ID yozing:")
+        await cb.message.edit_text("Mijoz tanlang: ism/telefon/ID yozing:", reply_markup=pick_customer())
         await cb.answer()
 
     @router.message(AdminSaleAdd.customer_query)
-    async def st_sale_customer(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_sale_customer(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         q = (message.text or "").strip()
         res = await find_customer(db, query=q, limit=5)
@@ -758,8 +951,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer("Sana (YYYY-MM-DD) yoki `0` (bugun):")
 
     @router.message(AdminSaleAdd.date)
-    async def st_sale_date(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_sale_date(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         raw = (message.text or "").strip()
         if raw == "0":
@@ -808,6 +1001,75 @@ def build_router(db: Db, cfg: Config) -> Router:
             except Exception:
                 pass
 
+    @router.callback_query(F.data == "admin:sale_search")
+    async def cb_sale_search(cb: CallbackQuery, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            await cb.answer()
+            return
+        await state.clear()
+        await state.set_state(AdminSaleSearch.query)
+        await cb.message.edit_text("Savdo qidirish: mahsulot yoki izohdagi so‘zlarni kiriting (masalan: armatura 12):")
+        await cb.answer()
+
+    @router.message(AdminSaleSearch.query)
+    async def st_sale_search_query(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            return
+        q = (message.text or "").strip()
+        if not q:
+            await message.answer("So‘z kiriting.")
+            return
+        await state.update_data(query=q)
+        await state.set_state(AdminSaleSearch.period)
+        await message.answer("Sana oralig‘i: YYYY-MM-DD YYYY-MM-DD (masalan 2026-01-01 2026-03-31) yoki - (hammasi):")
+
+    @router.message(AdminSaleSearch.period)
+    async def st_sale_search_period(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            return
+        raw = (message.text or "").strip()
+        dates = ALL_DATES if raw == "-" else tuple(raw.split())
+        if len(dates) != 2 or not all(re.match(r"^\d{4}-\d{2}-\d{2}$", d) for d in dates) or dates[0] > dates[1]:
+            await message.answer("Format noto‘g‘ri. YYYY-MM-DD YYYY-MM-DD yoki -.")
+            return
+        await state.update_data(start=dates[0], end=dates[1])
+        await state.set_state(AdminSaleSearch.customer)
+        await message.answer("Mijoz: ism/telefon/ID yoki - (barcha mijozlar):", reply_markup=pick_customer())
+
+    @router.message(AdminSaleSearch.customer)
+    async def st_sale_search_customer(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            return
+        q = (message.text or "").strip()
+        customer_id, customer = None, ""
+        if q != "-":
+            res = await find_customer(db, query=q, limit=1)
+            if not res:
+                await message.answer("Mijoz topilmadi. Qayta kiriting yoki -.")
+                return
+            customer_id, customer = res[0].id, f"#{res[0].id} {res[0].full_name}"
+        data = await state.get_data()
+        spec = {"query": data["query"], "start": data["start"], "end": data["end"], "customer_id": customer_id, "customer": customer}
+        # Leave the flow but keep the spec for the page buttons.
+        await state.set_state(None)
+        await state.set_data({"sale_search": spec})
+        text, markup = await sale_search_page(spec, 0)
+        await message.answer(text, reply_markup=markup)
+
+    @router.callback_query(F.data.startswith("admin:sale_search:"))
+    async def cb_sale_search_page(cb: CallbackQuery, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            await cb.answer()
+            return
+        spec = (await state.get_data()).get("sale_search")
+        if spec is None:
+            await cb.answer("Qidiruv eskirgan, qaytadan boshlang.", show_alert=True)
+            return
+        text, markup = await sale_search_page(spec, int(cb.data.split(":")[-1]))
+        if text != cb.message.text:
+            await cb.message.edit_text(text, reply_markup=markup)
+        await cb.answer()
+
     @router.callback_query(F.data == "admin:sale_delete_last")
     async def cb_sale_delete_last(cb: CallbackQuery, state: FSMContext) -> None:
         await state.set_state(AdminReportCustomerHistory.customer_query)
@@ -815,8 +1077,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await cb.answer()
 
     @router.message(AdminReportCustomerHistory.customer_query)
-    async def st_delete_last_sale(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_delete_last_sale(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         q = (message.text or "").strip()
         res = await find_customer(db, query=q, limit=5)
@@ -852,8 +1114,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await cb.answer()
 
     @router.message(AdminReportMonthly.year_month)
-    async def st_report_monthly(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_report_monthly(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         ym = (message.text or "").strip()
         if not re.match(r"^\d{4}-\d{2}$", ym):
@@ -880,8 +1142,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await cb.answer()
 
     @router.message(AdminReportCustomerHistory.customer_query)
-    async def st_report_customer_history(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_report_customer_history(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         q = (message.text or "").strip()
         res = await find_customer(db, query=q, limit=5)
@@ -906,7 +1168,7 @@ def build_router(db: Db, cfg: Config) -> Router:
     @router.message(AdminReportRange.start)
     async def st_report_range_start(message: Message, state: FSMContext) -> None:
         s = (message.text or "").strip()
-        if not re.match(r"^\d{4}-\d{2}-\d{2}$", s):
+        if parse_date(s) is None:
             await message.answer("Format noto‘g‘ri. YYYY-MM-DD.")
             return
         await state.update_data(start=s)
@@ -914,21 +1176,136 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer("Tugash sana (YYYY-MM-DD):")
 
     @router.message(AdminReportRange.end)
-    async def st_report_range_end(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_report_range_end(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         e = (message.text or "").strip()
-        if not re.match(r"^\d{4}-\d{2}-\d{2}$", e):
+        if parse_date(e) is None:
             await message.answer("Format noto‘g‘ri. YYYY-MM-DD.")
             return
         data = await state.get_data()
         start = data["start"]
+        if start > e:
+            await message.answer("Tugash sana boshlanishdan oldin bo‘lmasin.")
+            return
         await state.clear()
-        docs = await sales_between(db, start_date=start, end_date=e)
-        total = sum(int(d["amount"]) for d in docs)
-        text = f"📆 Hisobot ({start} .. {e})\nSavdolar: {len(docs)}\nJami: {fmt_amount(total)}"
+        count, total = await range_summary(db, start_date=start, end_date=e)
+        text = f"📆 Hisobot ({start} .. {e})\nSavdolar: {count}\nJami: {fmt_amount(total)}"
         await message.answer(text, reply_markup=main_menu_admin())
 
+    @router.callback_query(F.data == "admin:report_pivot")
+    async def cb_report_pivot(cb: CallbackQuery, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            await cb.answer()
+            return
+        await state.clear()
+        await state.set_state(AdminReportPivot.start)
+        await cb.message.edit_text("Boshlanish sana (YYYY-MM-DD):")
+        await cb.answer()
+
+    @router.message(AdminReportPivot.start)
+    async def st_report_pivot_start(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            return
+        s = (message.text or "").strip()
+        if parse_date(s) is None:
+            await message.answer("Format noto‘g‘ri. YYYY-MM-DD.")
+            return
+        await state.update_data(start=s)
+        await state.set_state(AdminReportPivot.end)
+        await message.answer("Tugash sana (YYYY-MM-DD):")
+
+    @router.message(AdminReportPivot.end)
+    async def st_report_pivot_end(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            return
+        e = (message.text or "").strip()
+        if parse_date(e) is None:
+            await message.answer("Format noto‘g‘ri. YYYY-MM-DD.")
+            return
+        if (await state.get_data())["start"] > e:
+            await message.answer("Tugash sana boshlanishdan oldin bo‘lmasin.")
+            return
+        await state.update_data(end=e)
+        await state.set_state(AdminReportPivot.dims)
+        await message.answer(
+            "Nima bo‘yicha guruhlash? Vergul bilan (yoki - umumiy):\n"
+            "product - mahsulot, level - daraja, weekday - hafta kuni,\n"
+            "month - oy, status - holat, customer - mijoz\n"
+            "Masalan: product, weekday"
+        )
+
+    @router.message(AdminReportPivot.dims)
+    async def st_report_pivot_dims(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            return
+        raw = (message.text or "").strip().lower()
+        dims = [] if raw == "-" else [d.strip() for d in raw.split(",") if d.strip()]
+        if any(d not in PIVOT_DIMENSIONS for d in dims) or len(set(dims)) != len(dims):
+            await message.answer("Noto‘g‘ri. Mumkin: " + ", ".join(PIVOT_DIMENSIONS))
+            return
+        await state.update_data(dims=dims)
+        await state.set_state(AdminReportPivot.metrics)
+        await message.answer(
+            "Ko‘rsatkichlar? Vergul bilan (yoki - : sum, count):\n"
+            "sum - jami, count - soni, avg - o‘rtacha, customers - mijozlar soni"
+        )
+
+    @router.message(AdminReportPivot.metrics)
+    async def st_report_pivot_metrics(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            return
+        raw = (message.text or "").strip().lower()
+        metrics = ["sum", "count"] if raw == "-" else [m.strip() for m in raw.split(",") if m.strip()]
+        if not metrics or any(m not in PIVOT_METRICS for m in metrics) or len(set(metrics)) != len(metrics):
+            await message.answer("Noto‘g‘ri. Mumkin: " + ", ".join(PIVOT_METRICS))
+            return
+        data = await state.get_data()
+        spec = {"start": data["start"], "end": data["end"], "dims": data["dims"], "metrics": metrics}
+        # Leave the flow but keep the spec for the page buttons.
+        await state.set_state(None)
+        await state.set_data({"pivot": spec})
+        text, markup = await pivot_page(spec, 0)
+        await message.answer(text, reply_markup=markup)
+
+    @router.callback_query(F.data.startswith("admin:pivot:"))
+    async def cb_pivot_page(cb: CallbackQuery, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
+            await cb.answer()
+            return
+        spec = (await state.get_data()).get("pivot")
+        if spec is None:
+            await cb.answer("Hisobot eskirgan, qaytadan tuzing.", show_alert=True)
+            return
+        text, markup = await pivot_page(spec, int(cb.data.split(":")[-1]))
+        if text != cb.message.text:
+            await cb.message.edit_text(text, reply_markup=markup)
+        await cb.answer()
+
+    @router.callback_query(F.data == "admin:report_rfm")
+    async def cb_report_rfm(cb: CallbackQuery, actor: Actor) -> None:
+        if not actor.is_admin:
+            await cb.answer()
+            return
+        await cb.message.edit_text(await analytics_text(), reply_markup=reports_menu_inline())
+        await cb.answer()
+
+    @router.callback_query(F.data == "admin:report_products")
+    async def cb_report_products(cb: CallbackQuery, actor: Actor) -> None:
+        if not actor.is_admin:
+            await cb.answer()
+            return
+        await cb.message.edit_text(await products_text(), reply_markup=reports_menu_inline())
+        await cb.answer()
+
+    @router.callback_query(F.data == "admin:report_periods")
+    async def cb_report_periods(cb: CallbackQuery, actor: Actor) -> None:
+        if not actor.is_admin:
+            await cb.answer()
+            return
+        await cb.message.edit_text(await period_reports_text(), reply_markup=reports_menu_inline())
+        await cb.answer()
+
     # =========================
     # ADMIN: Bonuses
     # =========================
@@ -954,7 +1331,7 @@ def build_router(db: Db, cfg: Config) -> Router:
     @router.callback_query(F.data == "admin:bonus_manual_add")
     async def cb_manual_reward(cb: CallbackQuery, state: FSMContext) -> None:
         await state.set_state(AdminManualReward.customer_query)
-        await cb.message.edit_text("Yutuq kiritish: mijoz ism/telefon/ID kiriting:")
+        await cb.message.edit_text("Yutuq kiritish: mijoz ism/telefon/ID kiriting:", reply_markup=pick_customer())
         await cb.answer()
 
     @router.message(AdminManualReward.customer_query)
@@ -980,8 +1357,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer("Izoh (ixtiyoriy):")
 
     @router.message(AdminManualReward.note)
-    async def st_manual_reward_note(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_manual_reward_note(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         data = await state.get_data()
         customer_id = int(data["customer_id"])
@@ -999,12 +1376,7 @@ def build_router(db: Db, cfg: Config) -> Router:
 
     @router.callback_query(F.data == "admin:winners_monthly")
     async def cb_winners_monthly(cb: CallbackQuery) -> None:
-        today = date.today()
-        rep = await monthly_report(db, year=today.year, month=today.month)
-        text = "🏆 Oylik g‘oliblar (Top 5):\n\n" + "\n".join(
-            [f"- #{t['customer_id']} {t['full_name']} ({t['phone']}): {fmt_amount(int(t['sum_amount']))}" for t in rep["top5"]]
-        )
-        await cb.message.edit_text(text, reply_markup=back_to_menu("admin"))
+        await cb.message.edit_text(await winners_text(), reply_markup=back_to_menu("admin"))
         await cb.answer()
 
     # =========================
@@ -1024,26 +1396,26 @@ def build_router(db: Db, cfg: Config) -> Router:
             return
         await state.update_data(audience=a)
         await state.set_state(AdminBroadcast.text)
-        targets = await (all_customers_with_chat(db) if a == "all" else active_customers_with_chat(db))
-        await message.answer(f"Xabar matnini yuboring.\nAuditoriya: <b>{len(targets)}</b> ta foydalanuvchi.", parse_mode="HTML")
+        audience_size = await count_customers_with_chat(db, active_only=a == "active")
+        await message.answer(f"Xabar matnini yuboring.\nAuditoriya: <b>{audience_size}</b> ta foydalanuvchi.", parse_mode="HTML")
 
     @router.message(AdminBroadcast.text)
-    async def st_broadcast_text(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_broadcast_text(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         data = await state.get_data()
         await state.clear()
         audience = data["audience"]
         text = message.text or ""
-        targets = await (all_customers_with_chat(db) if audience == "all" else active_customers_with_chat(db))
-        ok = 0
-        for c in targets:
+        ok = sent = 0
+        async for c in iter_customers_with_chat(db, active_only=audience == "active"):
+            sent += 1
             try:
                 await message.bot.send_message(int(c.chat_id), text)
                 ok += 1
             except Exception:
                 continue
-        await message.answer(f"✅ Yuborildi: {ok}/{len(targets)}", reply_markup=main_menu_admin())
+        await message.answer(f"✅ Yuborildi: {ok}/{sent}", reply_markup=main_menu_admin())
 
     # =========================
     # ADMIN: Export
@@ -1055,17 +1427,13 @@ def build_router(db: Db, cfg: Config) -> Router:
 
     @router.callback_query(F.data == "admin:export_customers_xlsx")
     async def cb_export_customers_xlsx(cb: CallbackQuery) -> None:
-        rows = await list_customers(db, limit=5000)
-        data = [c.__dict__ for c in rows]
-        bio = customers_to_xlsx(data)
+        bio = await customers_to_xlsx(c.__dict__ async for c in iter_customers(db))
         await cb.message.answer_document(("customers.xlsx", bio), caption="Mijozlar ro‘yxati (Excel)")
         await cb.answer()
 
     @router.callback_query(F.data == "admin:export_customers_pdf")
     async def cb_export_customers_pdf(cb: CallbackQuery) -> None:
-        rows = await list_customers(db, limit=5000)
-        data = [c.__dict__ for c in rows]
-        bio = customers_to_pdf(data)
+        bio = await customers_to_pdf(c.__dict__ async for c in iter_customers(db))
         await cb.message.answer_document(("customers.pdf", bio), caption="Mijozlar ro‘yxati (PDF)")
         await cb.answer()
 
@@ -1086,8 +1454,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await message.answer("End sana (YYYY-MM-DD):")
 
     @router.message(AdminExportSalesRange.end)
-    async def st_export_sales_end(message: Message, state: FSMContext) -> None:
-        if not is_admin(message.from_user.id):
+    async def st_export_sales_end(message: Message, state: FSMContext, actor: Actor) -> None:
+        if not actor.is_admin:
             return
         e = (message.text or "").strip()
         if not re.match(r"^\d{4}-\d{2}-\d{2}$", e):
@@ -1096,16 +1464,15 @@ def build_router(db: Db, cfg: Config) -> Router:
         data = await state.get_data()
         start = data["start"]
         await state.clear()
-        docs = await sales_between(db, start_date=start, end_date=e)
-        bio = sales_to_xlsx(docs)
+        bio = await sales_to_xlsx(iter_sales_between(db, start_date=start, end_date=e))
         await message.answer_document((f"sales_{start}_{e}.xlsx", bio), caption=f"Savdolar ({start}..{e})")
 
     # =========================
     # CUSTOMER PANEL
     # =========================
     @router.callback_query(F.data == "c:profile")
-    async def cb_profile(cb: CallbackQuery) -> None:
-        customer = await get_customer_by_chat(db, chat_id=cb.from_user.id)
+    async def cb_profile(cb: CallbackQuery, actor: Actor) -> None:
+        customer = actor.customer
         if not customer:
             await cb.message.answer("Telefonni yuboring:", reply_markup=ask_phone_keyboard())
             await cb.answer()
@@ -1116,13 +1483,15 @@ def build_router(db: Db, cfg: Config) -> Router:
             f"Telefon: {customer.phone}\n"
             f"Jami savdo: {fmt_amount(customer.total_spent)}\n"
             f"Daraja: {customer.level}\n"
+            f"{await standing_lines(customer)}"
+            f"{last_sale_line(customer)}"
         )
         await cb.message.edit_text(text, reply_markup=back_to_menu("customer"))
         await cb.answer()
 
     @router.callback_query(F.data == "c:history")
-    async def cb_history(cb: CallbackQuery) -> None:
-        customer = await get_customer_by_chat(db, chat_id=cb.from_user.id)
+    async def cb_history(cb: CallbackQuery, actor: Actor) -> None:
+        customer = actor.customer
         if not customer:
             await cb.message.answer("Telefonni yuboring:", reply_markup=ask_phone_keyboard())
             await cb.answer()
@@ -1159,35 +1528,32 @@ def build_router(db: Db, cfg: Config) -> Router:
         await cb.answer()
 
     @router.callback_query(F.data.startswith("c:filter:"))
-    async def cb_history_filter(cb: CallbackQuery) -> None:
+    async def cb_history_filter(cb: CallbackQuery, actor: Actor) -> None:
         """Savdo tarixini filtrlash"""
-        customer = await get_customer_by_chat(db, chat_id=cb.from_user.id)
+        customer = actor.customer
         if not customer:
             await cb.answer("Telefonni yuboring:", show_alert=True)
             return
         
         filter_type = cb.data.split(":")[-1]
-        all_sales = await list_sales_for_customer(db, customer_id=customer.id, limit=10000)
-        
         today = date.today()
-        filtered_sales = []
-        
+        since: str | None = None
+
         if filter_type == "7days":
-            cutoff = (today - timedelta(days=7)).isoformat()
-            filtered_sales = [s for s in all_sales if s['sale_date'] >= cutoff]
+            since = (today - timedelta(days=7)).isoformat()
             title = "📅 Oxirgi 7 kun"
         elif filter_type == "month":
-            month_start = date(today.year, today.month, 1).isoformat()
-            filtered_sales = [s for s in all_sales if s['sale_date'] >= month_start]
+            since = date(today.year, today.month, 1).isoformat()
             title = "📅 Bu oy"
         elif filter_type == "year":
-            year_start = date(today.year, 1, 1).isoformat()
-            filtered_sales = [s for s in all_sales if s['sale_date'] >= year_start]
+            since = date(today.year, 1, 1).isoformat()
             title = "📅 Bu yil"
         else:  # all
-            filtered_sales = all_sales[:100]  # limit
             title = "📋 Barcha savdolar"
-        
+
+        count, total = await customer_sales_stats(db, customer_id=customer.id, since=since)
+        filtered_sales = await list_sales_for_customer(db, customer_id=customer.id, limit=50, since=since) if count else []
+
         if not filtered_sales:
             text = (
                 f"━━━━━━━━━━━━━━━━━━━━\n"
@@ -1200,9 +1566,8 @@ def build_router(db: Db, cfg: Config) -> Router:
             await cb.answer()
             return
         
-        total = sum(int(s['amount']) for s in filtered_sales)
         lines = []
-        for s in filtered_sales[:50]:  # max 50
+        for s in filtered_sales:  # max 50
             lines.append(f"📅 {s['sale_date']}\n   💰 {fmt_amount(int(s['amount']))}\n   📦 {s['product']}\n")
         
         text = (
@@ -1210,7 +1575,7 @@ def build_router(db: Db, cfg: Config) -> Router:
             f"{title}\n"
             f"━━━━━━━━━━━━━━━━━━━━\n\n"
             f"📊 Jami: <b>{fmt_amount(total)}</b>\n"
-            f"📈 Savdolar: <b>{len(filtered_sales)}</b> ta\n\n"
+            f"📈 Savdolar: <b>{count}</b> ta\n\n"
             "━━━━━━━━━━━━━━━━━━━━\n"
             + "\n".join(lines) +
             "\n━━━━━━━━━━━━━━━━━━━━"
@@ -1219,8 +1584,8 @@ def build_router(db: Db, cfg: Config) -> Router:
         await cb.answer()
 
     @router.callback_query(F.data == "c:rewards")
-    async def cb_rewards(cb: CallbackQuery) -> None:
-        customer = await get_customer_by_chat(db, chat_id=cb.from_user.id)
+    async def cb_rewards(cb: CallbackQuery, actor: Actor) -> None:
+        customer = actor.customer
         if not customer:
             await cb.message.answer("Telefonni yuboring:", reply_markup=ask_phone_keyboard())
             await cb.answer()
@@ -86,6 +86,7 @@ def sales_menu_reply() -> ReplyKeyboardMarkup:
             [KeyboardButton(text="➕ Yangi savdo kiritish")],
             [KeyboardButton(text="🗑️ Oxirgi savdoni o'chirish")],
             [KeyboardButton(text="🗑️ Savdoni ID bo'yicha o'chirish")],
+            [KeyboardButton(text="🔎 Savdo qidirish")],
             [KeyboardButton(text="🔙 Orqaga")],
         ],
         resize_keyboard=True,
@@ -104,6 +105,10 @@ def reports_menu_reply() -> ReplyKeyboardMarkup:
             [KeyboardButton(text="📅 Oylik hisobot")],
             [KeyboardButton(text="👤 Mijoz tarixi")],
             [KeyboardButton(text="📆 Sana oralig'i hisobot")],
+            [KeyboardButton(text="📈 Kun / oy / yil")],
+            [KeyboardButton(text="🧮 Kesim hisobot")],
+            [KeyboardButton(text="🧭 RFM va kohortalar")],
+            [KeyboardButton(text="📦 Mahsulotlar")],
             [KeyboardButton(text="🔙 Orqaga")],
         ],
         resize_keyboard=True,
@@ -169,6 +174,7 @@ def sales_menu_inline() -> InlineKeyboardMarkup:
         inline_keyboard=[
             [InlineKeyboardButton(text="➕ Yangi savdo kiritish", callback_data="admin:sale_add")],
             [InlineKeyboardButton(text="🗑️ Oxirgi savdoni o'chirish", callback_data="admin:sale_delete_last")],
+            [InlineKeyboardButton(text="🔎 Savdo qidirish", callback_data="admin:sale_search")],
             [InlineKeyboardButton(text="🔙 Orqaga", callback_data="admin:menu")],
         ]
     )
@@ -180,6 +186,10 @@ def reports_menu_inline() -> InlineKeyboardMarkup:
             [InlineKeyboardButton(text="📅 Oylik hisobot", callback_data="admin:report_monthly")],
             [InlineKeyboardButton(text="👤 Mijoz tarixi", callback_data="admin:report_customer_history")],
             [InlineKeyboardButton(text="📆 Sana oralig'i hisobot", callback_data="admin:report_range")],
+            [InlineKeyboardButton(text="📈 Kun / oy / yil", callback_data="admin:report_periods")],
+            [InlineKeyboardButton(text="🧮 Kesim hisobot", callback_data="admin:report_pivot")],
+            [InlineKeyboardButton(text="🧭 RFM va kohortalar", callback_data="admin:report_rfm")],
+            [InlineKeyboardButton(text="📦 Mahsulotlar", callback_data="admin:report_products")],
             [InlineKeyboardButton(text="🔙 Orqaga", callback_data="admin:menu")],
         ]
     )
@@ -228,3 +238,21 @@ def customer_history_filters() -> InlineKeyboardMarkup:
         ]
     )
 
+
+
+def pager(prefix: str, page: int, pages: int) -> InlineKeyboardMarkup:
+    """⬅️ / ➡️ sahifalash tugmalari (callback: "<prefix><sahifa>")"""
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton(text="⬅️", callback_data=f"{prefix}{page - 1}"))
+    row.append(InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data=f"{prefix}{page}"))
+    if page + 1 < pages:
+        row.append(InlineKeyboardButton(text="➡️", callback_data=f"{prefix}{page + 1}"))
+    return InlineKeyboardMarkup(inline_keyboard=[row])
+
+
+def pick_customer() -> InlineKeyboardMarkup:
+    """Shu chatda inline rejimni ochadi: mijozlar yozish davomida taklif qilinadi"""
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="🔎 Mijozni qidirish", switch_inline_query_current_chat="")]]
+    )
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+import logging
 
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
@@ -8,13 +9,14 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from dotenv import load_dotenv
 
 from .config import load_config
-from .db import Db, migrate
 from .handlers import build_router
-from .services import customers_inactive_days, monthly_report
+from .middlewares import ActorMiddleware, UpdateDedupMiddleware
+from .services import customers_inactive_days, monthly_report, refresh_report_snapshots, warm_up
+from .storage import Storage, open_storage
 from .utils import fmt_amount
 
 
-async def setup_jobs(bot: Bot, db: Db, tz: str, admin_ids: tuple[int, ...]) -> None:
+async def setup_jobs(bot: Bot, db: Storage, tz: str, admin_ids: tuple[int, ...]) -> None:
     from zoneinfo import ZoneInfo
     try:
         tz_obj = ZoneInfo(tz)
@@ -59,19 +61,31 @@ async def setup_jobs(bot: Bot, db: Db, tz: str, admin_ids: tuple[int, ...]) -> N
             except Exception:
                 continue
 
+    async def snapshot_job() -> None:
+        await refresh_report_snapshots(db, tz=tz)
+
     scheduler.add_job(monthly_job, "cron", day=1, hour=9, minute=0)
     scheduler.add_job(inactivity_job, "cron", hour=10, minute=0)
+    scheduler.add_job(snapshot_job, "cron", hour=0, minute=5)
     scheduler.start()
 
 
 async def amain() -> None:
     load_dotenv(override=True)
     cfg = load_config()
-    db = Db(path=cfg.db_path)
-    await migrate(db)
+    db = open_storage(cfg)
+    await db.open()
+    await warm_up(
+        db,
+        report_cache_size=cfg.report_cache_size,
+        customer_cache_size=cfg.customer_cache_size,
+        customer_cache_ttl=cfg.customer_cache_ttl,
+    )
 
     bot = Bot(cfg.bot_token)
     dp = Dispatcher(storage=MemoryStorage())
+    dp.update.outer_middleware(UpdateDedupMiddleware(db, ttl=cfg.dedup_ttl_hours * 3600))
+    dp.update.outer_middleware(ActorMiddleware(db, admin_ids=cfg.admin_telegram_ids))
     dp.include_router(build_router(db, cfg))
 
     await setup_jobs(bot, db, cfg.tz, cfg.admin_telegram_ids)
@@ -79,7 +93,18 @@ async def amain() -> None:
         await bot.delete_webhook(drop_pending_updates=True)
     except Exception:
         pass
-    await dp.start_polling(bot)
+    backfills = asyncio.create_task(db.run_backfills())
+    try:
+        await dp.start_polling(bot)
+    finally:
+        backfills.cancel()
+        try:
+            await backfills
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logging.exception("Backfills failed")
+        await db.close()
 
 
 def main() -> None:
@@ -0,0 +1,815 @@
+from __future__ import annotations
+
+import asyncio
+from bisect import bisect_left, bisect_right, insort
+from contextlib import asynccontextmanager
+from datetime import date
+import itertools
+import math
+import sys
+from typing import Any, AsyncIterator, Callable, Optional
+
+from .models import Customer
+from .search import (
+    SALE_SEARCH_CANDIDATES,
+    SEARCH_CANDIDATES,
+    parse_query,
+    phone_key,
+    prefix_range,
+    rank,
+    sale_tags,
+    sale_terms,
+    split_words,
+    text_tokens,
+    trigrams,
+)
+from .utils import normalize_key, split_by_month
+
+# (sale_date, sale_id): ISO dates sort lexicographically, ids break ties.
+SaleKey = tuple[str, int]
+
+_FIELDS = ("id", "full_name", "phone", "chat_id", "status", "total_spent", "level", "last_sale_date")
+
+# FTS5's bm25() constants and the column weights SqliteStorage.search_sales passes.
+BM25_K1, BM25_B = 1.2, 0.75
+SEARCH_WEIGHTS = (2.0, 1.0)  # product, comment; tags weigh 0 but count towards row length
+
+
+def _customer(row: dict[str, Any]) -> Customer:
+    return Customer(**{k: row[k] for k in _FIELDS})
+
+
+def _phrase_hits(tokens: list[str], phrase: list[str]) -> int:
+    """Occurrences of `phrase` in `tokens`, its last word matching as a prefix (FTS5 "a b"*)."""
+    n = len(phrase)
+    return sum(
+        tokens[i : i + n - 1] == phrase[:-1] and tokens[i + n - 1].startswith(phrase[-1]) for i in range(len(tokens) - n + 1)
+    )
+
+
+class MemoryTx:
+    """Applies changes in place and keeps an undo log for rollback."""
+
+    def __init__(self, store: MemoryStorage) -> None:
+        self.s = store
+        self.undo: list[Callable[[], None]] = []
+
+    def rollback(self) -> None:
+        while self.undo:
+            self.undo.pop()()
+
+    def _set(self, row: dict[str, Any], **changes: Any) -> None:
+        old = {k: row[k] for k in changes}
+        row.update(changes)
+        self.undo.append(lambda: row.update(old))
+
+    async def insert_customer(self, *, full_name: str, phone: str, chat_id: Optional[int], created_at: str) -> int:
+        s = self.s
+        if phone in s._by_phone:
+            raise ValueError("UNIQUE constraint failed: customers.phone")
+        if chat_id is not None and chat_id in s._by_chat:
+            raise ValueError("UNIQUE constraint failed: customers.chat_id")
+        cid = s._next_id("customers")
+        s._customers[cid] = {
+            "id": cid,
+            "full_name": full_name,
+            "phone": phone,
+            "chat_id": chat_id,
+            "status": "active",
+            "total_spent": 0,
+            "level": "Bronze",
+            "last_sale_date": None,
+            "created_at": created_at,
+            "updated_at": created_at,
+        }
+        s._by_phone[phone] = cid
+        if chat_id is not None:
+            s._by_chat[chat_id] = cid
+        s._index_customer(s._customers[cid])
+        s._sales_by_customer[cid] = []
+        s._rewards_by_customer[cid] = []
+        self.undo.append(lambda: s._drop_customer(cid))
+        return cid
+
+    async def customer_total(self, customer_id: int) -> int:
+        row = self.s._customers.get(customer_id)
+        return 0 if row is None else int(row["total_spent"])
+
+    async def set_customer_total(self, customer_id: int, *, total_spent: int, level: str, at: str) -> None:
+        row = self.s._customers.get(customer_id)
+        if row is not None:
+            self._set(row, total_spent=total_spent, level=level, updated_at=at)
+
+    async def set_customer_status(self, customer_id: int, *, status: str, at: str) -> None:
+        row = self.s._customers.get(customer_id)
+        if row is not None:
+            self._set(row, status=status, updated_at=at)
+
+    async def customer_id_by_phone(self, phone: str) -> Optional[int]:
+        return self.s._by_phone.get(phone)
+
+    async def set_customer_chat(self, customer_id: int, *, chat_id: int, at: str) -> None:
+        s = self.s
+        row = s._customers.get(customer_id)
+        if row is None:
+            return
+        owner = s._by_chat.get(chat_id)
+        if owner is not None and owner != customer_id:
+            raise ValueError("UNIQUE constraint failed: customers.chat_id")
+        old_chat = row["chat_id"]
+        if old_chat is not None:
+            s._by_chat.pop(old_chat, None)
+        s._by_chat[chat_id] = customer_id
+        self._set(row, chat_id=chat_id, updated_at=at)
+
+        def undo() -> None:
+            s._by_chat.pop(chat_id, None)
+            if old_chat is not None:
+                s._by_chat[old_chat] = customer_id
+
+        self.undo.append(undo)
+
+    async def delete_customer(self, customer_id: int) -> bool:
+        s = self.s
+        if customer_id not in s._customers:
+            return False
+        # ON DELETE CASCADE: sales and rewards go with the customer.
+        for _, sale_id in list(s._sales_by_customer[customer_id]):
+            await self.delete_sale(sale_id)
+        for reward_id in list(s._rewards_by_customer[customer_id]):
+            await self.delete_reward(reward_id)
+        row = s._customers[customer_id]
+        s._drop_customer(customer_id)
+
+        def undo() -> None:
+            s._customers[customer_id] = row
+            s._customers = dict(sorted(s._customers.items()))
+            s._by_phone[row["phone"]] = customer_id
+            if row["chat_id"] is not None:
+                s._by_chat[row["chat_id"]] = customer_id
+            s._index_customer(row)
+            s._sales_by_customer[customer_id] = []
+            s._rewards_by_customer[customer_id] = []
+
+        self.undo.append(undo)
+        return True
+
+    async def ensure_product(self, *, key: str, name: str, created_at: str) -> int:
+        s = self.s
+        pid = s._product_by_key.get(key)
+        if pid is not None:
+            return pid
+        pid = s._next_id("products")
+        s._products[pid] = {"id": pid, "key": key, "name": name, "cnt": 0, "total": 0, "created_at": created_at}
+        s._product_by_key[key] = pid
+
+        def undo() -> None:
+            del s._products[pid]
+            del s._product_by_key[key]
+
+        self.undo.append(undo)
+        return pid
+
+    async def insert_sale(self, *, customer_id: int, amount: int, product_id: int, comment: str, sale_date: str, created_at: str) -> int:
+        s = self.s
+        if customer_id not in s._customers or product_id not in s._products:
+            raise ValueError("FOREIGN KEY constraint failed")
+        sale_id = s._next_id("sales")
+        s._add_sale(
+            {
+                "id": sale_id,
+                "customer_id": customer_id,
+                "amount": amount,
+                "product_id": product_id,
+                "comment": comment,
+                "sale_date": sale_date,
+                "created_at": created_at,
+            }
+        )
+        self.undo.append(lambda: s._remove_sale(sale_id))
+        return sale_id
+
+    async def get_sale(self, sale_id: int) -> Optional[dict[str, Any]]:
+        row = self.s._sales.get(sale_id)
+        return None if row is None else {k: row[k] for k in ("id", "customer_id", "amount", "sale_date")}
+
+    async def last_sale(self, customer_id: int) -> Optional[dict[str, Any]]:
+        keys = self.s._sales_by_customer.get(customer_id)
+        if not keys:
+            return None
+        return await self.get_sale(max(sale_id for _, sale_id in keys))
+
+    async def delete_sale(self, sale_id: int) -> None:
+        s = self.s
+        row = s._remove_sale(sale_id)
+        if row is not None:
+            self.undo.append(lambda: s._add_sale(row))
+
+    async def insert_reward(self, *, customer_id: int, reward_type: str, reward_name: str, note: str, created_at: str) -> int:
+        s = self.s
+        if customer_id not in s._customers:
+            raise ValueError("FOREIGN KEY constraint failed")
+        reward_id = s._next_id("rewards")
+        s._add_reward(
+            {
+                "id": reward_id,
+                "customer_id": customer_id,
+                "reward_type": reward_type,
+                "reward_name": reward_name,
+                "note": note,
+                "created_at": created_at,
+            }
+        )
+        self.undo.append(lambda: s._remove_reward(reward_id))
+        return reward_id
+
+    async def get_reward(self, reward_id: int) -> Optional[dict[str, Any]]:
+        row = self.s._rewards.get(reward_id)
+        return None if row is None else {"id": row["id"], "customer_id": row["customer_id"], "created_at": row["created_at"]}
+
+    async def delete_reward(self, reward_id: int) -> None:
+        s = self.s
+        row = s._remove_reward(reward_id)
+        if row is not None:
+            self.undo.append(lambda: s._add_reward(row))
+
+    async def reward_names(self, customer_id: int, *, reward_type: str) -> set[str]:
+        s = self.s
+        return {
+            s._rewards[rid]["reward_name"]
+            for rid in s._rewards_by_customer.get(customer_id, ())
+            if s._rewards[rid]["reward_type"] == reward_type
+        }
+
+    async def insert_audit(self, *, actor_telegram_id: Optional[int], actor_role: str, action: str, meta_json: str, at: str) -> None:
+        s = self.s
+        s._audit.append(
+            {
+                "id": s._next_id("audit_logs"),
+                "actor_telegram_id": actor_telegram_id,
+                "actor_role": actor_role,
+                "action": action,
+                "meta_json": meta_json,
+                "at": at,
+            }
+        )
+        self.undo.append(s._audit.pop)
+
+    async def sales_totals(self, customer_id: Optional[int] = None) -> list[dict[str, Any]]:
+        s = self.s
+        ids = list(s._customers) if customer_id is None else [customer_id] if customer_id in s._customers else []
+        out = []
+        for cid in ids:
+            row = s._customers[cid]
+            real_total = sum(s._sales[sale_id]["amount"] for _, sale_id in s._sales_by_customer[cid])
+            out.append({"id": cid, "total_spent": row["total_spent"], "level": row["level"], "real_total": real_total})
+        return out
+
+    async def customer_totals(self) -> list[tuple[int, int]]:
+        return [(cid, row["total_spent"]) for cid, row in self.s._customers.items() if row["total_spent"] > 0]
+
+    async def monthly_totals(self, month: str) -> list[tuple[int, int]]:
+        return [(cid, -neg_total) for neg_total, cid in self.s._monthly_rank.get(month, [])]
+
+    async def save_snapshot(self, period: str, *, as_of: str, payload: str, computed_at: str) -> None:
+        s = self.s
+        old = s._snapshots.get(period)
+        s._snapshots[period] = (as_of, payload)
+
+        def undo() -> None:
+            if old is None:
+                s._snapshots.pop(period, None)
+            else:
+                s._snapshots[period] = old
+
+        self.undo.append(undo)
+
+
+class MemoryStorage:
+    """Process-local backend on dicts and sorted arrays, for load tests and benchmarks.
+
+    Nothing is persisted. Transactions are serialised by one lock and reads
+    wait for it too, so a reader never sees half of a write.
+    """
+
+    name = "memory"
+
+    def __init__(self) -> None:
+        self._lock = asyncio.Lock()
+        self._seq: dict[str, int] = {}
+        self._customers: dict[int, dict[str, Any]] = {}  # insertion order == id order
+        self._by_phone: dict[str, int] = {}
+        self._by_chat: dict[int, int] = {}
+        # Search keys, as in the customer_search migration: sorted (key, id) pairs
+        # for prefix ranges and name_key trigram -> ids postings.
+        self._by_name_key: list[tuple[str, int]] = []
+        self._by_phone_rev: list[tuple[str, int]] = []
+        self._trigrams: dict[str, set[int]] = {}
+        # Sale search, as in the sales_search migration: per sale its (product, comment)
+        # tokens and row length, token -> sale ids, and the sorted tokens for prefixes.
+        self._sale_text: dict[int, tuple[list[str], list[str], int]] = {}
+        self._sale_postings: dict[str, set[int]] = {}
+        self._sale_vocab: list[str] = []
+        self._sale_text_size = 0
+        self._sales: dict[int, dict[str, Any]] = {}
+        self._sales_by_date: list[SaleKey] = []
+        self._sales_by_customer: dict[int, list[SaleKey]] = {}
+        self._rewards: dict[int, dict[str, Any]] = {}
+        self._rewards_by_customer: dict[int, list[int]] = {}
+        self._audit: list[dict[str, Any]] = []
+        self._products: dict[int, dict[str, Any]] = {}  # cnt/total kept current by _add_sale/_remove_sale
+        self._product_by_key: dict[str, int] = {}
+        self._updates: dict[int, int] = {}  # update_id -> seen_at
+        self._snapshots: dict[str, tuple[str, str]] = {}  # period -> (as_of, payload)
+        # Monthly rollup: month -> [count, total]; per customer too, plus buyers
+        # ranked by (-total, customer_id) so the top N is a slice.
+        self._monthly: dict[str, list[int]] = {}
+        self._monthly_customer: dict[tuple[str, int], list[int]] = {}
+        self._monthly_rank: dict[str, list[tuple[int, int]]] = {}
+        # Daily rollup with running totals, parallel arrays sorted by day:
+        # _daily[i] = [cnt, total, cum_cnt, cum_total] for _days[i].
+        self._days: list[str] = []
+        self._daily: list[list[int]] = []
+        self._commits = 0
+        self._rollbacks = 0
+
+    # ---- internal mutations (callers hold the lock)
+
+    def _next_id(self, table: str) -> int:
+        self._seq[table] = self._seq.get(table, 0) + 1
+        return self._seq[table]
+
+    def _drop_customer(self, customer_id: int) -> None:
+        row = self._customers.pop(customer_id)
+        self._by_phone.pop(row["phone"], None)
+        if row["chat_id"] is not None:
+            self._by_chat.pop(row["chat_id"], None)
+        self._unindex_customer(row)
+        self._sales_by_customer.pop(customer_id, None)
+        self._rewards_by_customer.pop(customer_id, None)
+
+    def _index_customer(self, row: dict[str, Any]) -> None:
+        key = normalize_key(row["full_name"])
+        insort(self._by_name_key, (key, row["id"]))
+        insort(self._by_phone_rev, (phone_key(row["phone"]), row["id"]))
+        for tri in trigrams(key):
+            self._trigrams.setdefault(tri, set()).add(row["id"])
+
+    def _unindex_customer(self, row: dict[str, Any]) -> None:
+        key = normalize_key(row["full_name"])
+        for keys, item in ((self._by_name_key, (key, row["id"])), (self._by_phone_rev, (phone_key(row["phone"]), row["id"]))):
+            del keys[bisect_left(keys, item)]
+        for tri in trigrams(key):
+            ids = self._trigrams[tri]
+            ids.discard(row["id"])
+            if not ids:
+                del self._trigrams[tri]
+
+    def _add_sale(self, row: dict[str, Any]) -> None:
+        key = (row["sale_date"], row["id"])
+        self._sales[row["id"]] = row
+        insort(self._sales_by_date, key)
+        mine = self._sales_by_customer[row["customer_id"]]
+        insort(mine, key)
+        self._customers[row["customer_id"]]["last_sale_date"] = mine[-1][0]
+        self._roll_product(row, +1)
+        self._roll_month(row, +1)
+        self._roll_day(row, +1)
+        self._index_sale(row)
+
+    def _index_sale(self, row: dict[str, Any]) -> None:
+        product, comment = text_tokens(self._products[row["product_id"]]["key"]), text_tokens(row["comment"])
+        size = len(product) + len(comment) + len(sale_tags(row["customer_id"], row["sale_date"]).split())
+        self._sale_text[row["id"]] = (product, comment, size)
+        self._sale_text_size += size
+        for token in set(product + comment):
+            if token not in self._sale_postings:
+                self._sale_postings[token] = set()
+                insort(self._sale_vocab, token)
+            self._sale_postings[token].add(row["id"])
+
+    def _unindex_sale(self, sale_id: int) -> None:
+        product, comment, size = self._sale_text.pop(sale_id)
+        self._sale_text_size -= size
+        for token in set(product + comment):
+            ids = self._sale_postings[token]
+            ids.discard(sale_id)
+            if not ids:
+                del self._sale_postings[token]
+                del self._sale_vocab[bisect_left(self._sale_vocab, token)]
+
+    def _sale_hits(self, sale_id: int, phrase: list[str]) -> list[int]:
+        """[hits in product, hits in comment] of `phrase` in a sale (see `_phrase_hits`)."""
+        return [_phrase_hits(col, phrase) for col in self._sale_text[sale_id][:2]]
+
+    def _phrase_sales(self, phrase: list[str]) -> set[int]:
+        """Ids of the sales containing `phrase`, its last word as a prefix."""
+        lo, hi = prefix_range(phrase[-1])
+        vocab = self._sale_vocab
+        ids: set[int] = set().union(*(self._sale_postings[t] for t in vocab[bisect_left(vocab, lo) : bisect_left(vocab, hi)]))
+        for token in phrase[:-1]:
+            ids &= self._sale_postings.get(token, set())
+        if len(phrase) > 1:  # holding every token is not enough for a phrase: check the order
+            ids = {sale_id for sale_id in ids if any(self._sale_hits(sale_id, phrase))}
+        return ids
+
+    def _roll_product(self, row: dict[str, Any], sign: int) -> None:
+        product = self._products[row["product_id"]]
+        product["cnt"] += sign
+        product["total"] += sign * row["amount"]
+
+    def _product_name(self, row: dict[str, Any]) -> str:
+        return self._products[row["product_id"]]["name"]
+
+    def _roll_day(self, row: dict[str, Any], sign: int) -> None:
+        day, amount = row["sale_date"], sign * row["amount"]
+        i = bisect_left(self._days, day)
+        if i == len(self._days) or self._days[i] != day:
+            prev = self._daily[i - 1] if i else [0, 0, 0, 0]
+            self._days.insert(i, day)
+            self._daily.insert(i, [0, 0, prev[2], prev[3]])
+        self._daily[i][0] += sign
+        self._daily[i][1] += amount
+        for agg in self._daily[i:]:
+            agg[2] += sign
+            agg[3] += amount
+        if self._daily[i][0] == 0:
+            del self._days[i]
+            del self._daily[i]
+
+    def _cum_upto(self, day: str, *, inclusive: bool) -> tuple[int, int]:
+        i = (bisect_right if inclusive else bisect_left)(self._days, day)
+        return (self._daily[i - 1][2], self._daily[i - 1][3]) if i else (0, 0)
+
+    def _roll_month(self, row: dict[str, Any], sign: int) -> None:
+        month, cid, amount = row["sale_date"][:7], row["customer_id"], row["amount"]
+        month_row = self._monthly.setdefault(month, [0, 0])
+        month_row[0] += sign
+        month_row[1] += sign * amount
+        if month_row[0] == 0:
+            del self._monthly[month]
+        rank = self._monthly_rank.setdefault(month, [])
+        mine = self._monthly_customer.setdefault((month, cid), [0, 0])
+        if mine[0]:
+            del rank[bisect_left(rank, (-mine[1], cid))]
+        mine[0] += sign
+        mine[1] += sign * amount
+        if mine[0]:
+            insort(rank, (-mine[1], cid))
+        else:
+            del self._monthly_customer[(month, cid)]
+        if not rank:
+            del self._monthly_rank[month]
+
+    def _remove_sale(self, sale_id: int) -> Optional[dict[str, Any]]:
+        row = self._sales.pop(sale_id, None)
+        if row is None:
+            return None
+        key = (row["sale_date"], sale_id)
+        mine = self._sales_by_customer[row["customer_id"]]
+        for keys in (self._sales_by_date, mine):
+            del keys[bisect_left(keys, key)]
+        self._customers[row["customer_id"]]["last_sale_date"] = mine[-1][0] if mine else None
+        self._roll_product(row, -1)
+        self._roll_month(row, -1)
+        self._roll_day(row, -1)
+        self._unindex_sale(sale_id)
+        return row
+
+    def _add_reward(self, row: dict[str, Any]) -> None:
+        self._rewards[row["id"]] = row
+        insort(self._rewards_by_customer[row["customer_id"]], row["id"])
+
+    def _remove_reward(self, reward_id: int) -> Optional[dict[str, Any]]:
+        row = self._rewards.pop(reward_id, None)
+        if row is not None:
+            ids = self._rewards_by_customer[row["customer_id"]]
+            del ids[bisect_left(ids, reward_id)]
+        return row
+
+    def _date_range(self, start_date: str, end_date: str) -> list[SaleKey]:
+        keys = self._sales_by_date
+        return keys[bisect_left(keys, (start_date, 0)) : bisect_right(keys, (end_date, sys.maxsize))]
+
+    # ---- Storage
+
+    async def open(self) -> None:
+        return None
+
+    async def run_backfills(self) -> None:
+        return None
+
+    async def close(self) -> None:
+        return None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "memory.customers": len(self._customers),
+            "memory.sales": len(self._sales),
+            "memory.rewards": len(self._rewards),
+            "memory.products": len(self._products),
+            "memory.audit_logs": len(self._audit),
+            "memory.commits": self._commits,
+            "memory.rollbacks": self._rollbacks,
+        }
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[MemoryTx]:
+        async with self._lock:
+            tx = MemoryTx(self)
+            try:
+                yield tx
+            except BaseException:
+                tx.rollback()
+                self._rollbacks += 1
+                raise
+            self._commits += 1
+
+    async def list_customers(self, *, limit: int) -> list[Customer]:
+        async with self._lock:
+            out = []
+            for cid in reversed(self._customers):
+                if len(out) >= limit:
+                    break
+                out.append(_customer(self._customers[cid]))
+            return out
+
+    async def iter_customers(self) -> AsyncIterator[Customer]:
+        async with self._lock:
+            rows = [_customer(self._customers[cid]) for cid in reversed(self._customers)]
+        for c in rows:
+            yield c
+
+    def _key_range(self, keys: list[tuple[str, int]], prefix: str, limit: int) -> list[int]:
+        lo, hi = prefix_range(prefix)
+        ids = [cid for _, cid in keys[bisect_left(keys, (lo, 0)) : bisect_left(keys, (hi, 0))]]
+        return sorted(ids, reverse=True)[:limit]
+
+    async def find_customers(self, *, query: str, limit: int) -> list[Customer]:
+        # Same candidates as the SQL backend, then the shared ranking.
+        digits, key = parse_query(query)
+        words, short_words = split_words(key)
+        async with self._lock:
+            if digits is not None:
+                ids = [int(digits), self._by_phone.get(digits, 0), *self._key_range(self._by_phone_rev, phone_key(digits), limit)]
+            elif words:
+                exact = self._key_range(self._by_name_key, key, len(self._customers))
+                ids = [cid for cid in exact if normalize_key(self._customers[cid]["full_name"]) == key]
+                postings = sorted((self._trigrams.get(tri, set()) for w in words for tri in trigrams(w)), key=len)
+                hits = sorted(set.intersection(*postings), reverse=True)
+                matched = [cid for cid in hits if all(w in normalize_key(self._customers[cid]["full_name"]) for w in words + short_words)]
+                ids += matched[:SEARCH_CANDIDATES]
+            elif key:
+                ids = self._key_range(self._by_name_key, key, limit)
+                newest = (cid for cid in reversed(self._customers) if all(w in normalize_key(self._customers[cid]["full_name"]) for w in short_words))
+                ids += list(itertools.islice(newest, SEARCH_CANDIDATES))
+            else:
+                ids = list(reversed(self._customers))[:limit]
+            found = [_customer(self._customers[cid]) for cid in dict.fromkeys(ids) if cid in self._customers]
+        return rank(found, digits=digits, key=key)[:limit]
+
+    async def get_customer(self, customer_id: int) -> Optional[Customer]:
+        async with self._lock:
+            row = self._customers.get(customer_id)
+            return None if row is None else _customer(row)
+
+    async def get_customer_by_chat(self, chat_id: int) -> Optional[Customer]:
+        async with self._lock:
+            cid = self._by_chat.get(chat_id)
+            return None if cid is None else _customer(self._customers[cid])
+
+    async def get_customers(self, customer_ids: list[int]) -> dict[int, Customer]:
+        async with self._lock:
+            return {cid: _customer(self._customers[cid]) for cid in customer_ids if cid in self._customers}
+
+    async def iter_customers_with_chat(self, *, active_only: bool, chunk: int) -> AsyncIterator[Customer]:
+        # `chunk` pages the SQL scan; here the rows are copied at once, like iter_customers.
+        async with self._lock:
+            ids = sorted(cid for cid in self._by_chat.values() if not active_only or self._customers[cid]["status"] == "active")
+            rows = [_customer(self._customers[cid]) for cid in ids]
+        for c in rows:
+            yield c
+
+    async def count_customers_with_chat(self, *, active_only: bool) -> int:
+        async with self._lock:
+            if not active_only:
+                return len(self._by_chat)
+            return sum(1 for cid in self._by_chat.values() if self._customers[cid]["status"] == "active")
+
+    async def customers_inactive_since(self, cutoff: str) -> list[Customer]:
+        async with self._lock:
+            hits = [
+                row
+                for row in self._customers.values()
+                if row["status"] == "active" and (row["last_sale_date"] is None or row["last_sale_date"] < cutoff)
+            ]
+            # Same order as the SQL index scan: never bought first, then oldest last sale.
+            hits.sort(key=lambda r: (r["last_sale_date"] is not None, r["last_sale_date"] or "", r["id"]))
+            return [_customer(row) for row in hits]
+
+    async def list_sales_for_customer(self, customer_id: int, *, limit: int, since: str) -> list[dict[str, Any]]:
+        async with self._lock:
+            keys = self._sales_by_customer.get(customer_id, [])
+            lo = bisect_left(keys, (since, 0))
+            out = []
+            for _, sale_id in reversed(keys[max(lo, len(keys) - limit) :]):
+                row = self._sales[sale_id]
+                out.append({**{k: row[k] for k in ("id", "amount", "comment", "sale_date", "created_at")}, "product": self._product_name(row)})
+            return out
+
+    async def customer_sales_stats(self, customer_id: int, *, since: str) -> tuple[int, int]:
+        async with self._lock:
+            keys = self._sales_by_customer.get(customer_id, [])
+            hits = keys[bisect_left(keys, (since, 0)) :]
+            return len(hits), sum(self._sales[sale_id]["amount"] for _, sale_id in hits)
+
+    async def iter_sales_between(self, *, start_date: str, end_date: str) -> AsyncIterator[dict[str, Any]]:
+        async with self._lock:
+            rows = []
+            for _, sale_id in reversed(self._date_range(start_date, end_date)):
+                row = self._sales[sale_id]
+                c = self._customers[row["customer_id"]]
+                rows.append(
+                    {
+                        "id": sale_id,
+                        "amount": row["amount"],
+                        "product": self._product_name(row),
+                        "comment": row["comment"],
+                        "sale_date": row["sale_date"],
+                        "customer_id": c["id"],
+                        "full_name": c["full_name"],
+                        "phone": c["phone"],
+                    }
+                )
+        for r in rows:
+            yield r
+
+    async def range_summary(self, *, start_date: str, end_date: str) -> tuple[int, int]:
+        if start_date > end_date:
+            return 0, 0
+        async with self._lock:
+            hi_cnt, hi_total = self._cum_upto(end_date, inclusive=True)
+            lo_cnt, lo_total = self._cum_upto(start_date, inclusive=False)
+            return hi_cnt - lo_cnt, hi_total - lo_total
+
+    async def monthly_summary(self, month: str) -> tuple[int, int]:
+        async with self._lock:
+            cnt, total = self._monthly.get(month, (0, 0))
+            return cnt, total
+
+    async def monthly_top(self, month: str, *, limit: int) -> list[dict[str, Any]]:
+        async with self._lock:
+            top = [(cid, -neg_total) for neg_total, cid in self._monthly_rank.get(month, [])[:limit]]
+            # Like the old LEFT JOIN: pad with customers who bought nothing.
+            for cid in self._customers:
+                if len(top) >= limit:
+                    break
+                if (month, cid) not in self._monthly_customer:
+                    top.append((cid, 0))
+            return [
+                {
+                    "customer_id": cid,
+                    "full_name": self._customers[cid]["full_name"],
+                    "phone": self._customers[cid]["phone"],
+                    "sum_amount": total,
+                }
+                for cid, total in top
+            ]
+
+    async def top_between(self, *, start_date: str, end_date: str, limit: int) -> list[tuple[int, int]]:
+        months, parts = split_by_month(start_date, end_date)
+        totals: dict[int, int] = {}
+        async with self._lock:
+            for month in months:
+                for neg_total, cid in self._monthly_rank.get(month, []):
+                    totals[cid] = totals.get(cid, 0) - neg_total
+            for lo, hi in parts:
+                for _, sale_id in self._date_range(lo, hi):
+                    row = self._sales[sale_id]
+                    totals[row["customer_id"]] = totals.get(row["customer_id"], 0) + row["amount"]
+        return sorted(totals.items(), key=lambda kv: (-kv[1], kv[0]))[:limit]
+
+    async def pivot(self, *, start_date: str, end_date: str, dims: tuple[str, ...], metrics: tuple[str, ...]) -> list[dict[str, Any]]:
+        groups: dict[tuple[Any, ...], list[Any]] = {}  # key -> [sum, count, customer ids]
+        names: dict[int, str] = {}  # products group by id
+        async with self._lock:
+            for _, sale_id in self._date_range(start_date, end_date):
+                row = self._sales[sale_id]
+                c = self._customers[row["customer_id"]]
+                values = {
+                    "product": row["product_id"],
+                    "level": c["level"],
+                    "weekday": (date.fromisoformat(row["sale_date"]).weekday() + 1) % 7,
+                    "month": row["sale_date"][:7],
+                    "status": c["status"],
+                    "customer": f"#{c['id']} {c['full_name']}",
+                }
+                names[row["product_id"]] = self._product_name(row)
+                acc = groups.setdefault(tuple(values[d] for d in dims), [0, 0, set()])
+                acc[0] += row["amount"]
+                acc[1] += 1
+                acc[2].add(c["id"])
+        if not groups and not dims:
+            groups[()] = [None, 0, set()]  # like SQL aggregates without GROUP BY
+        out = []
+        for key, (total, count, buyers) in groups.items():
+            metric = {"sum": total, "count": count, "avg": total / count if count else None, "customers": len(buyers)}
+            labels = dict(zip(dims, key))
+            if "product" in labels:
+                labels["product"] = names[labels["product"]]
+            out.append({**labels, **{m: metric[m] for m in metrics}})
+        out.sort(key=lambda r: tuple(r[d] for d in dims))
+        out.sort(key=lambda r: r[metrics[0]] or 0, reverse=True)
+        return out
+
+    async def top_products(self, *, limit: int) -> list[dict[str, Any]]:
+        async with self._lock:
+            rows = sorted((p for p in self._products.values() if p["cnt"] > 0), key=lambda p: (-p["total"], p["id"]))
+            return [{k: p[k] for k in ("id", "name", "cnt", "total")} for p in rows[:limit]]
+
+    async def search_sales(
+        self, *, query: str, start_date: str, end_date: str, customer_id: Optional[int], limit: int, offset: int
+    ) -> tuple[int, list[dict[str, Any]]]:
+        terms = sale_terms(query)
+        if not terms:
+            return 0, []
+        phrases = [text_tokens(w) for spellings in terms for w in spellings]
+        words = [range(sum(map(len, terms[:i])), sum(map(len, terms[: i + 1]))) for i in range(len(terms))]
+        async with self._lock:
+            by_phrase = [self._phrase_sales(phrase) for phrase in phrases]
+            found: Optional[set[int]] = None
+            for word in words:
+                ids = set().union(*(by_phrase[i] for i in word))
+                found = ids if found is None else found & ids
+            newest = [
+                sale_id
+                for sale_id in sorted(found or (), reverse=True)
+                if start_date <= self._sales[sale_id]["sale_date"] <= end_date and customer_id in (None, self._sales[sale_id]["customer_id"])
+            ][:SALE_SEARCH_CANDIDATES]
+            matched = [(sale_id, [self._sale_hits(sale_id, phrase) for phrase in phrases], self._sale_text[sale_id][2]) for sale_id in newest]
+            if not matched:
+                return 0, []
+            docs = len(self._sales)
+            avgdl = self._sale_text_size / docs
+            idf = [max(math.log((docs - len(hits) + 0.5) / (len(hits) + 0.5)), 0.0) or 1e-6 for hits in by_phrase]
+
+            def score(hits: list[list[int]], size: int) -> float:
+                total = 0.0
+                for i, h in enumerate(hits):
+                    freq = sum(w * n for w, n in zip(SEARCH_WEIGHTS, h))
+                    total += idf[i] * freq * (BM25_K1 + 1) / (freq + BM25_K1 * (1 - BM25_B + BM25_B * size / avgdl))
+                return -total
+
+            ranked = sorted(matched, key=lambda m: (score(m[1], m[2]), -m[0]))
+            out = []
+            for sale_id, _, _ in ranked[offset : offset + limit]:
+                row = self._sales[sale_id]
+                out.append(
+                    {
+                        "id": sale_id,
+                        "customer_id": row["customer_id"],
+                        "full_name": self._customers[row["customer_id"]]["full_name"],
+                        "amount": row["amount"],
+                        "product": self._product_name(row),
+                        "comment": row["comment"],
+                        "sale_date": row["sale_date"],
+                    }
+                )
+        return (len(matched) if out else 0), out
+
+    async def iter_sale_columns(self, *, chunk: int) -> AsyncIterator[tuple[list[int], list[str], list[int]]]:
+        async with self._lock:
+            rows = [(r["customer_id"], r["sale_date"], r["amount"]) for r in self._sales.values()]
+        for i in range(0, len(rows), chunk):
+            part = rows[i : i + chunk]
+            yield [r[0] for r in part], [r[1] for r in part], [r[2] for r in part]
+
+    async def load_snapshots(self) -> dict[str, tuple[str, str]]:
+        async with self._lock:
+            return dict(self._snapshots)
+
+    async def list_rewards(self, customer_id: int, *, limit: int) -> list[dict[str, Any]]:
+        async with self._lock:
+            ids = self._rewards_by_customer.get(customer_id, [])
+            return [
+                {k: self._rewards[rid][k] for k in ("id", "reward_type", "reward_name", "note", "created_at")}
+                for rid in reversed(ids[-limit:])
+            ]
+
+    async def claim_update(self, update_id: int, *, at: int) -> bool:
+        async with self._lock:
+            if update_id in self._updates:
+                return False
+            self._updates[update_id] = at
+            return True
+
+    async def release_update(self, update_id: int) -> None:
+        async with self._lock:
+            self._updates.pop(update_id, None)
+
+    async def prune_updates(self, *, before: int) -> int:
+        async with self._lock:
+            stale = [uid for uid, at in self._updates.items() if at < before]
+            for uid in stale:
+                del self._updates[uid]
+            return len(stale)
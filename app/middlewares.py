@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import time
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from aiogram import BaseMiddleware  # pyright: ignore[reportMissingImports]
+from aiogram.types import TelegramObject, Update, User  # pyright: ignore[reportMissingImports]
+
+from .models import Actor
+from .services import count_commits, get_customer_by_chat
+from .storage import Storage
+
+DEDUP_LRU_SIZE = 10_000
+DEDUP_PRUNE_EVERY = 3600  # seconds
+
+
+class UpdateDedupMiddleware(BaseMiddleware):
+    """Outer update middleware: an `update_id` that was handled is not handled again.
+
+    Recently seen ids sit in an in-memory LRU, so a replay within one run is
+    a dict lookup. Anything else is claimed in storage before the handler
+    runs, which also covers re-delivery after a restart: the claim is an
+    atomic insert, so of two deliveries only one gets to run. If the handler
+    raises before any service write of it committed (e.g. "database is
+    locked" after the write retries), the claim is released and a
+    re-delivery runs it again; once a write committed the claim stays, so a
+    failure afterwards, say in a Telegram send, cannot record a sale twice.
+    The price is a crash between the claim and the write: that update is
+    dropped. Rows older than `ttl` seconds are pruned at most once per
+    DEDUP_PRUNE_EVERY.
+    """
+
+    def __init__(self, db: Storage, *, ttl: int, lru_size: int = DEDUP_LRU_SIZE) -> None:
+        self.db = db
+        self.ttl = ttl
+        self.lru_size = lru_size
+        self._seen: OrderedDict[int, None] = OrderedDict()
+        self._pruned_at = 0.0
+
+    def _remember(self, update_id: int) -> None:
+        self._seen[update_id] = None
+        self._seen.move_to_end(update_id)
+        if len(self._seen) > self.lru_size:
+            self._seen.popitem(last=False)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        update_id = int(event.update_id)
+        if update_id in self._seen:
+            return None
+        self._remember(update_id)
+        now = time.time()
+        if not await self.db.claim_update(update_id, at=int(now)):
+            return None
+        with count_commits() as commits:
+            try:
+                result = await handler(event, data)
+            except Exception:
+                if not commits[0]:
+                    await self.db.release_update(update_id)
+                    self._seen.pop(update_id, None)
+                raise
+        if now - self._pruned_at >= DEDUP_PRUNE_EVERY:
+            self._pruned_at = now
+            await self.db.prune_updates(before=int(now) - self.ttl)
+        return result
+
+
+class ActorMiddleware(BaseMiddleware):
+    """Outer update middleware: resolves the sender once and passes it to handlers as `actor`.
+
+    Admins are recognised from a set built once from the config; every sender
+    then costs a single customer lookup by chat (usually served from the
+    services customer cache), admins included, since an admin's account can
+    also be linked to a customer. Handlers take
+    `actor: Actor` instead of checking ids themselves, so an update never
+    costs more than one lookup; `stats()` shows how many it cost on average.
+    Register after UpdateDedupMiddleware so duplicates are dropped first.
+    """
+
+    def __init__(self, db: Storage, *, admin_ids: Iterable[int]) -> None:
+        self.db = db
+        self.admin_ids = frozenset(int(i) for i in admin_ids)
+        self.updates = 0
+        self.lookups = 0
+
+    async def resolve(self, user: Optional[User]) -> Actor:
+        if user is None:
+            return Actor(telegram_id=None)
+        telegram_id = int(user.id)
+        self.lookups += 1
+        customer = await get_customer_by_chat(self.db, chat_id=telegram_id)
+        return Actor(telegram_id=telegram_id, is_admin=telegram_id in self.admin_ids, customer=customer)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "actor.updates": self.updates,
+            "actor.lookups": self.lookups,
+            "actor.lookups_per_update": round(self.lookups / self.updates, 3) if self.updates else 0.0,
+        }
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        self.updates += 1
+        data["actor"] = await self.resolve(data.get("event_from_user"))
+        data["actors"] = self
+        return await handler(event, data)
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+
+BONUS_50M = 50_000_000
+BONUS_100M = 100_000_000
+
+# Group-by dimensions and metrics of the pivot report (`Storage.pivot`).
+PIVOT_DIMENSIONS = ("product", "level", "weekday", "month", "status", "customer")
+PIVOT_METRICS = ("sum", "count", "avg", "customers")
+
+
+def compute_level(total_spent: int) -> str:
+    if total_spent >= 50_000_000:
+        return "Gold"
+    if total_spent >= 10_000_000:
+        return "Silver"
+    return "Bronze"
+
+
+@dataclass(frozen=True)
+class Customer:
+    id: int
+    full_name: str
+    phone: str
+    chat_id: Optional[int]
+    status: str
+    total_spent: int
+    level: str
+    last_sale_date: Optional[str] = None  # YYYY-MM-DD, maintained with every sale write
+
+    def days_since_last_sale(self, today: date) -> Optional[int]:
+        if self.last_sale_date is None:
+            return None
+        return (today - date.fromisoformat(self.last_sale_date)).days
+
+
+@dataclass(frozen=True)
+class Actor:
+    """Who sent an update, resolved once per update by `ActorMiddleware`.
+
+    `customer` is set for any chat linked to a customer, an admin's included;
+    `role` names the admin first, and "unknown" is anyone else.
+    """
+
+    telegram_id: Optional[int]
+    is_admin: bool = False
+    customer: Optional[Customer] = None
+
+    @property
+    def role(self) -> str:
+        if self.is_admin:
+            return "admin"
+        return "customer" if self.customer is not None else "unknown"
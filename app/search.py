@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+from .models import Customer
+from .utils import normalize_key
+
+SEARCH_CANDIDATES = 100  # newest name matches fetched before ranking
+SALE_SEARCH_CANDIDATES = 1000  # newest sale matches (within the filters) ranked and paged
+MONTH_TAGS_MAX = 12  # longer date ranges are not narrowed by month tags: the OR would cost more than it saves
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def phone_key(phone: str) -> str:
+    """Phone reversed, so a suffix search is an index range."""
+    return phone[::-1]
+
+
+def parse_query(query: str) -> tuple[Optional[str], str]:
+    """(digits, name key): digits when the query is an id or phone ("#12", "+998 90 ..."), else the folded name."""
+    digits = re.sub(r"[\s+#()-]", "", query)
+    if digits.isdigit():
+        return digits, ""
+    return None, normalize_key(query)
+
+
+def split_words(key: str) -> tuple[list[str], list[str]]:
+    """(words the trigram index can look up, shorter words that can only filter)."""
+    words = list(dict.fromkeys(key.split()))
+    return [w for w in words if len(w) >= 3], [w for w in words if len(w) < 3]
+
+
+def fts_phrases(words: list[str]) -> str:
+    """FTS5 query requiring every word as a substring (with the trigram tokenizer)."""
+    return " AND ".join('"' + w.replace('"', '""') + '"' for w in words)
+
+
+def text_tokens(text: str) -> list[str]:
+    """Words as the sales_search tokenizer (unicode61) sees them: lowercased runs of letters and digits."""
+    return re.findall(r"[^\W_]+", text.lower())
+
+
+def sale_terms(query: str) -> list[list[str]]:
+    """Per query word, the spellings any of which must prefix-match: folded (as product names are indexed) and as typed (comments)."""
+    terms = []
+    for word in query.split():
+        spellings = [w for w in dict.fromkeys((normalize_key(word), word.lower())) if text_tokens(w)]
+        if spellings:
+            terms.append(spellings)
+    return terms
+
+
+def sale_tags(customer_id: int, sale_date: str) -> str:
+    """sales_search.tags of a sale: its customer and month as tokens ("c12 m202603"), so filters are index lookups."""
+    return f"c{customer_id} m{sale_date[:4]}{sale_date[5:7]}"
+
+
+def _months(start_date: str, end_date: str) -> list[str]:
+    y, m = int(start_date[:4]), int(start_date[5:7])
+    n = (int(end_date[:4]) - y) * 12 + int(end_date[5:7]) - m + 1
+    if not 0 < n <= MONTH_TAGS_MAX:
+        return []
+    return [f"m{y + (m - 1 + i) // 12}{(m - 1 + i) % 12 + 1:02d}" for i in range(n)]
+
+
+def sale_match(query: str, *, start_date: str, end_date: str, customer_id: Optional[int]) -> Optional[str]:
+    """FTS5 query for sales_search: every word of `sale_terms` in product or comment, narrowed by tags; None without words."""
+    terms = []
+    for spellings in sale_terms(query):
+        alts = " OR ".join('"' + w.replace('"', '""') + '"*' for w in spellings)
+        terms.append(f"({alts})" if len(spellings) > 1 else alts)
+    if not terms:
+        return None
+    match = "{product comment}: (" + " AND ".join(terms) + ")"
+    if customer_id is not None:
+        match += f" AND tags: c{customer_id}"
+    months = _months(start_date, end_date)
+    if months:
+        match += f" AND tags: ({' OR '.join(months)})"
+    return match
+
+
+def like_pattern(word: str) -> str:
+    """`%word%` with LIKE wildcards in `word` escaped by a backslash."""
+    return "%" + re.sub(r"([\\%_])", r"\\\1", word) + "%"
+
+
+def prefix_range(prefix: str) -> tuple[str, str]:
+    """[lo, hi) of strings starting with `prefix`."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _tier(c: Customer, digits: Optional[str], key: str) -> int:
+    if digits is not None:
+        return 3 if c.id == int(digits) else 2 if c.phone == digits else 1
+    name = normalize_key(c.full_name)
+    if name == key:
+        return 3
+    if name.startswith(key):
+        return 2
+    return 1 if f" {key}" in f" {name}" else 0
+
+
+def rank(customers: list[Customer], *, digits: Optional[str], key: str) -> list[Customer]:
+    """Exact id / phone / name first, then phone suffixes and name (word) prefixes, then substrings; newest first on ties."""
+    return sorted(customers, key=lambda c: (-_tier(c, digits, key), -c.id))
@@ -1,116 +1,303 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 from datetime import date, datetime, timedelta
-from typing import Any, Optional
-
-from .db import Db, connect, fetchall, fetchone, fetchval
-from .utils import json_dumps, now_iso
-
-
-BONUS_50M = 50_000_000
-BONUS_100M = 100_000_000
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, Iterable, Iterator, Optional, TypeVar
+import weakref
+
+from .analytics import ANALYTICS_CHUNK, Analytics, analyze
+from .cache import LRUCache
+from .leaderboard import Leaderboard
+from .models import BONUS_50M, BONUS_100M, PIVOT_DIMENSIONS, PIVOT_METRICS, Customer, compute_level
+from .storage import Storage, Tx
+from .typeahead import CustomerIndex
+from .utils import _next_month, json_dumps, normalize_key, now_iso
+
+T = TypeVar("T")
+
+REPORT_CACHE_SIZE = 256
+CUSTOMER_CACHE_SIZE = 10_000
+CUSTOMER_CACHE_TTL = 300.0  # seconds; only bounds staleness from writes outside this process
+NO_CUSTOMER = 0  # customer_chats value for a chat linked to nobody
+CUSTOMERS = "customers"  # pseudo-period: customer set changed (report padding, names)
+CUSTOMER_ATTRS = "customer_attrs"  # pseudo-period: some customer's level or status may have changed
+SALES = "sales"  # pseudo-period: any sale at all
+SNAPSHOT_PERIODS = ("day", "mtd", "ytd")
+PERIOD_TOP = 5  # buyers listed per period report
+
+
+@dataclass
+class _Runtime:
+    """In-process state derived from one storage's data; rebuilt, never persisted."""
+
+    month: str = ""  # month the leaderboard covers; "" = needs a rebuild
+    leaderboard: Leaderboard = field(default_factory=Leaderboard)
+    lifetime: Optional[Leaderboard] = None  # ranked by total_spent; None = needs a rebuild
+    rebuild_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # Data version per period (YYYY-MM or CUSTOMERS), bumped after each commit
+    # that changes it; `generation` is bumped by writes that may touch any period.
+    versions: dict[str, int] = field(default_factory=dict)
+    generation: int = 0
+    reports: LRUCache[Any] = field(default_factory=lambda: LRUCache(REPORT_CACHE_SIZE))
+    # Nightly report snapshots as of `snapshots_as_of` ("" = not loaded yet);
+    # stale once a sale dated before today is added or deleted.
+    snapshots_as_of: str = ""
+    snapshots: dict[str, dict[str, Any]] = field(default_factory=dict)
+    snapshots_stale: bool = False
+    snapshot_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # Name/phone prefixes for inline suggestions; updated after each customer
+    # create/delete commits, None = not loaded yet.
+    typeahead: Optional[CustomerIndex] = None
+    # Customer rows by id and chat_id -> customer id, for the customer panel.
+    # Writes drop the entries they change after commit and bump `customer_epoch`,
+    # so a lookup that raced a write does not store what it read before it.
+    customers: LRUCache[Customer] = field(default_factory=lambda: LRUCache(CUSTOMER_CACHE_SIZE, ttl=CUSTOMER_CACHE_TTL))
+    customer_chats: LRUCache[int] = field(default_factory=lambda: LRUCache(CUSTOMER_CACHE_SIZE, ttl=CUSTOMER_CACHE_TTL))
+    customer_epoch: int = 0
+
+    def invalidate(self) -> None:
+        self.month = ""
+        self.lifetime = None
+        self.reports.clear()
+
+    def sale_committed(self, sale_date: str) -> None:
+        self.bump(sale_date[:7], CUSTOMER_ATTRS, SALES)
+        if sale_date < date.today().isoformat():
+            self.snapshots_stale = True
+
+    def version_of(self, periods: Iterable[str]) -> tuple[int, ...]:
+        return (self.generation, *(self.versions.get(p, 0) for p in periods))
+
+    def bump(self, *periods: str) -> None:
+        for p in periods:
+            self.versions[p] = self.versions.get(p, 0) + 1
+
+    def forget_customer(self, customer_id: Optional[int], *, chat_id: Optional[int] = None) -> None:
+        if customer_id is not None:
+            self.customers.pop(customer_id)
+        if chat_id is not None:
+            self.customer_chats.pop(chat_id)
+        self.customer_epoch += 1
+
+
+_runtimes: weakref.WeakKeyDictionary[Any, _Runtime] = weakref.WeakKeyDictionary()
+
+
+def _runtime(db: Storage) -> _Runtime:
+    rt = _runtimes.get(db)
+    if rt is None:
+        rt = _runtimes[db] = _Runtime()
+    return rt
+
+
+def _current_month() -> str:
+    return date.today().isoformat()[:7]
+
+
+_commits: ContextVar[Optional[list[int]]] = ContextVar("commits", default=None)
+
+
+@contextmanager
+def count_commits() -> Iterator[list[int]]:
+    """Count the service writes this task commits inside the block, in `[n]`."""
+    counter = [0]
+    token = _commits.set(counter)
+    try:
+        yield counter
+    finally:
+        _commits.reset(token)
+
+
+@asynccontextmanager
+async def _transaction(db: Storage) -> AsyncIterator[Tx]:
+    """`db.transaction()` that drops derived state if the write does not commit.
+
+    In-memory structures are updated inside the transaction, in commit order
+    with every other write; if it then fails they may be ahead of the data.
+    """
+    try:
+        async with db.transaction() as tx:
+            yield tx
+    except BaseException:
+        _runtime(db).invalidate()
+        raise
+    counter = _commits.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def _track_sale(db: Storage, *, customer_id: int, sale_date: str, delta: int) -> None:
+    rt = _runtime(db)
+    if sale_date[:7] == rt.month:
+        rt.leaderboard.add(customer_id, delta)
+    if rt.lifetime is not None:
+        rt.lifetime.add(customer_id, delta)
+
+
+async def _cached(db: Storage, key: Hashable, periods: list[str], compute: Callable[[], Awaitable[T]]) -> T:
+    """Report `key` from the cache while none of `periods` changed, else `compute()`.
+
+    The versions are part of the cache key, so a write makes older entries
+    unreachable and LRU eviction drops them. They are read before computing:
+    a write committing meanwhile leaves the new entry already stale rather
+    than serving pre-write data. Cached values are shared between callers
+    and must not be mutated.
+    """
+    rt = _runtime(db)
+    full_key = (key, rt.version_of(periods))
+    value = rt.reports.get(full_key)
+    if value is None:
+        value = await compute()
+        rt.reports.put(full_key, value)
+    return value
+
+
+def _months_between(start_date: str, end_date: str) -> list[str]:
+    """YYYY-MM of every month touched by [start_date, end_date]; ValueError for a date that is not one."""
+    months: list[str] = []
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    m = start.replace(day=1) if start <= end else _next_month(end)
+    while m <= end:
+        months.append(m.isoformat()[:7])
+        m = _next_month(m)
+    return months
+
+
+def report_cache_stats(db: Storage) -> dict[str, Any]:
+    rt = _runtime(db)
+    return {**rt.reports.as_dict("reports"), **rt.customers.as_dict("customers"), **rt.customer_chats.as_dict("customer_chats")}
+
+
+async def _month_leaderboard(db: Storage) -> Leaderboard:
+    rt = _runtime(db)
+    month = _current_month()
+    if rt.month != month:
+        async with rt.rebuild_lock:
+            if rt.month != month:
+                # Read inside a write transaction so no sale commits between the
+                # rollup read and the swap.
+                async with _transaction(db) as tx:
+                    rt.leaderboard = Leaderboard(await tx.monthly_totals(month))
+                    rt.month = month
+    return rt.leaderboard
+
+
+async def _lifetime_leaderboard(db: Storage) -> Leaderboard:
+    rt = _runtime(db)
+    if rt.lifetime is None:
+        async with rt.rebuild_lock:
+            if rt.lifetime is None:
+                async with _transaction(db) as tx:
+                    rt.lifetime = Leaderboard(await tx.customer_totals())
+    return rt.lifetime
+
+
+async def warm_up(
+    db: Storage,
+    *,
+    report_cache_size: int = REPORT_CACHE_SIZE,
+    customer_cache_size: int = CUSTOMER_CACHE_SIZE,
+    customer_cache_ttl: float = CUSTOMER_CACHE_TTL,
+) -> None:
+    """Build in-memory indexes from storage; call once after `db.open()`."""
+    rt = _runtime(db)
+    rt.reports = LRUCache(report_cache_size)
+    rt.customers = LRUCache(customer_cache_size, ttl=customer_cache_ttl)
+    rt.customer_chats = LRUCache(customer_cache_size, ttl=customer_cache_ttl)
+    await _month_leaderboard(db)
+    await _lifetime_leaderboard(db)
+    await _typeahead(db)
+
+
+async def _apply_total_delta(tx: Tx, *, customer_id: int, delta: int, at: str) -> int:
+    """Shift total_spent by one sale's amount and re-level; O(1) in sales history."""
+    total_spent = await tx.customer_total(customer_id) + delta
+    await tx.set_customer_total(customer_id, total_spent=total_spent, level=compute_level(total_spent), at=at)
+    return total_spent
+
+
+async def audit(tx: Tx, *, actor_telegram_id: Optional[int], actor_role: str, action: str, meta: dict[str, Any], tz: str) -> None:
+    await tx.insert_audit(actor_telegram_id=actor_telegram_id, actor_role=actor_role, action=action, meta_json=json_dumps(meta), at=now_iso(tz))
+
+
+async def create_customer(db: Storage, *, full_name: str, phone: str, chat_id: Optional[int], tz: str, actor_telegram_id: int) -> int:
+    async with _transaction(db) as tx:
+        cid = await tx.insert_customer(full_name=full_name.strip(), phone=phone.strip(), chat_id=chat_id, created_at=now_iso(tz))
+        await audit(tx, actor_telegram_id=actor_telegram_id, actor_role="admin", action="customer.create", meta={"customer_id": cid, "full_name": full_name, "phone": phone}, tz=tz)
+    rt = _runtime(db)
+    rt.bump(CUSTOMERS)
+    rt.forget_customer(None, chat_id=chat_id)
+    if rt.typeahead is not None:
+        rt.typeahead.add(cid, full_name.strip(), phone.strip())
+    return cid
 
 
-def compute_level(total_spent: int) -> str:
-    if total_spent >= 50_000_000:
-        return "Gold"
-    if total_spent >= 10_000_000:
-        return "Silver"
-    return "Bronze"
+async def list_customers(db: Storage, *, limit: int = 50) -> list[Customer]:
+    return await db.list_customers(limit=limit)
 
 
-@dataclass(frozen=True)
-class Customer:
-    id: int
-    full_name: str
-    phone: str
-    chat_id: Optional[int]
-    status: str
-    total_spent: int
-    level: str
+def iter_customers(db: Storage) -> AsyncIterator[Customer]:
+    return db.iter_customers()
 
 
-async def audit(db: Db, *, actor_telegram_id: Optional[int], actor_role: str, action: str, meta: dict[str, Any], tz: str) -> None:
-    async with connect(db) as conn:
-        await conn.execute(
-            "INSERT INTO audit_logs(actor_telegram_id, actor_role, action, meta_json, at) VALUES(?,?,?,?,?)",
-            (actor_telegram_id, actor_role, action, json_dumps(meta), now_iso(tz)),
-        )
+async def find_customer(db: Storage, *, query: str, limit: int = 20) -> list[Customer]:
+    return await db.find_customers(query=query.strip(), limit=limit)
 
 
-async def create_customer(db: Db, *, full_name: str, phone: str, chat_id: Optional[int], tz: str, actor_telegram_id: int) -> int:
-    async with connect(db) as conn:
-        created_at = now_iso(tz)
-        updated_at = created_at
-        cur = await conn.execute(
-            """
-            INSERT INTO customers(full_name, phone, chat_id, status, total_spent, level, created_at, updated_at)
-            VALUES(?,?,?,?,?,?,?,?)
-            """,
-            (full_name.strip(), phone.strip(), chat_id, "active", 0, "Bronze", created_at, updated_at),
-        )
-        cid = int(cur.lastrowid)
-    await audit(db, actor_telegram_id=actor_telegram_id, actor_role="admin", action="customer.create", meta={"customer_id": cid, "full_name": full_name, "phone": phone}, tz=tz)
-    return cid
+async def _typeahead(db: Storage) -> CustomerIndex:
+    rt = _runtime(db)
+    async with rt.rebuild_lock:
+        if rt.typeahead is None:
+            rt.typeahead = CustomerIndex([(c.id, c.full_name, c.phone) async for c in db.iter_customers()])
+        return rt.typeahead
 
 
-async def list_customers(db: Db, *, limit: int = 50) -> list[Customer]:
-    async with connect(db) as conn:
-        rows = await fetchall(
-            conn,
-            "SELECT id, full_name, phone, chat_id, status, total_spent, level FROM customers ORDER BY id DESC LIMIT ?",
-            (limit,),
-        )
-    return [Customer(**dict(r)) for r in rows]
-
-
-async def find_customer(db: Db, *, query: str, limit: int = 20) -> list[Customer]:
-    q = f"%{query.strip()}%"
-    async with connect(db) as conn:
-        rows = await fetchall(
-            conn,
-            """
-            SELECT id, full_name, phone, chat_id, status, total_spent, level
-            FROM customers
-            WHERE CAST(id AS TEXT) LIKE ? OR full_name LIKE ? OR phone LIKE ?
-            ORDER BY id DESC
-            LIMIT ?
-            """,
-            (q, q, q, limit),
-        )
-    return [Customer(**dict(r)) for r in rows]
+async def suggest_customers(db: Storage, *, query: str, limit: int) -> list[tuple[int, str, str]]:
+    """(id, full_name, phone) whose name words or phone start with the query's words, from memory."""
+    rt = _runtime(db)
+    index = rt.typeahead if rt.typeahead is not None else await _typeahead(db)
+    return index.lookup(query, limit=limit)
 
 
-async def get_customer(db: Db, *, customer_id: int) -> Optional[Customer]:
-    async with connect(db) as conn:
-        row = await fetchone(
-            conn,
-            "SELECT id, full_name, phone, chat_id, status, total_spent, level FROM customers WHERE id=?",
-            (customer_id,),
-        )
-    return None if row is None else Customer(**dict(row))
+async def get_customer(db: Storage, *, customer_id: int) -> Optional[Customer]:
+    rt = _runtime(db)
+    customer = rt.customers.get(customer_id)
+    if customer is None:
+        epoch = rt.customer_epoch
+        customer = await db.get_customer(customer_id)
+        if customer is not None and epoch == rt.customer_epoch:
+            rt.customers.put(customer_id, customer)
+    return customer
 
 
-async def set_customer_status(db: Db, *, customer_id: int, status: str, tz: str, actor_telegram_id: int) -> None:
-    async with connect(db) as conn:
-        await conn.execute("UPDATE customers SET status=?, updated_at=? WHERE id=?", (status, now_iso(tz), customer_id))
-    await audit(db, actor_telegram_id=actor_telegram_id, actor_role="admin", action="customer.status", meta={"customer_id": customer_id, "status": status}, tz=tz)
+async def set_customer_status(db: Storage, *, customer_id: int, status: str, tz: str, actor_telegram_id: int) -> None:
+    async with _transaction(db) as tx:
+        await tx.set_customer_status(customer_id, status=status, at=now_iso(tz))
+        await audit(tx, actor_telegram_id=actor_telegram_id, actor_role="admin", action="customer.status", meta={"customer_id": customer_id, "status": status}, tz=tz)
+    rt = _runtime(db)
+    rt.bump(CUSTOMER_ATTRS)
+    rt.forget_customer(customer_id)
 
 
-async def link_customer_chat(db: Db, *, phone: str, chat_id: int, tz: str) -> Optional[int]:
-    async with connect(db) as conn:
-        row = await fetchone(conn, "SELECT id FROM customers WHERE phone=?", (phone.strip(),))
-        if row is None:
+async def link_customer_chat(db: Storage, *, phone: str, chat_id: int, tz: str) -> Optional[int]:
+    async with _transaction(db) as tx:
+        customer_id = await tx.customer_id_by_phone(phone.strip())
+        if customer_id is None:
             return None
-        customer_id = int(row["id"])
-        await conn.execute("UPDATE customers SET chat_id=?, updated_at=? WHERE id=?", (chat_id, now_iso(tz), customer_id))
-    await audit(db, actor_telegram_id=chat_id, actor_role="customer", action="customer.link_chat", meta={"customer_id": customer_id, "phone": phone}, tz=tz)
+        await tx.set_customer_chat(customer_id, chat_id=chat_id, at=now_iso(tz))
+        await audit(tx, actor_telegram_id=chat_id, actor_role="customer", action="customer.link_chat", meta={"customer_id": customer_id, "phone": phone}, tz=tz)
+    # A chat the customer had before now resolves to nobody: its cached id no
+    # longer finds a customer row with that chat_id.
+    _runtime(db).forget_customer(customer_id, chat_id=chat_id)
     return customer_id
 
 
 async def add_sale(
-    db: Db,
+    db: Storage,
     *,
     customer_id: int,
     amount: int,
@@ -120,83 +307,94 @@ async def add_sale(
     tz: str,
     actor_telegram_id: int,
 ) -> tuple[int, list[str]]:
-    async with connect(db) as conn:
+    async with _transaction(db) as tx:
         created_at = now_iso(tz)
-        cur = await conn.execute(
-            """
-            INSERT INTO sales(customer_id, amount, product, comment, sale_date, created_at)
-            VALUES(?,?,?,?,?,?)
-            """,
-            (customer_id, amount, product.strip(), (comment or "").strip(), sale_date, created_at),
+        product_id = await tx.ensure_product(key=normalize_key(product), name=product.strip(), created_at=created_at)
+        sale_id = await tx.insert_sale(
+            customer_id=customer_id,
+            amount=amount,
+            product_id=product_id,
+            comment=(comment or "").strip(),
+            sale_date=sale_date,
+            created_at=created_at,
         )
-        sale_id = int(cur.lastrowid)
 
-        total_spent = int(await fetchval(conn, "SELECT COALESCE(SUM(amount),0) FROM sales WHERE customer_id=?", (customer_id,)) or 0)
-        level = compute_level(total_spent)
-        await conn.execute("UPDATE customers SET total_spent=?, level=?, updated_at=? WHERE id=?", (total_spent, level, created_at, customer_id))
+        await _apply_total_delta(tx, customer_id=customer_id, delta=amount, at=created_at)
+        _track_sale(db, customer_id=customer_id, sale_date=sale_date, delta=amount)
 
-    await audit(
-        db,
-        actor_telegram_id=actor_telegram_id,
-        actor_role="admin",
-        action="sale.add",
-        meta={"customer_id": customer_id, "sale_id": sale_id, "amount": amount, "product": product, "sale_date": sale_date},
-        tz=tz,
-    )
+        await audit(
+            tx,
+            actor_telegram_id=actor_telegram_id,
+            actor_role="admin",
+            action="sale.add",
+            meta={"customer_id": customer_id, "sale_id": sale_id, "amount": amount, "product": product, "product_id": product_id, "sale_date": sale_date},
+            tz=tz,
+        )
 
-    earned = await check_threshold_rewards(db, customer_id=customer_id, tz=tz, actor_telegram_id=actor_telegram_id)
+        earned = await check_threshold_rewards(tx, customer_id=customer_id, tz=tz, actor_telegram_id=actor_telegram_id)
+    rt = _runtime(db)
+    rt.sale_committed(sale_date)
+    rt.forget_customer(customer_id)
+    if earned:
+        rt.bump(created_at[:7])
     return sale_id, earned
 
 
-async def delete_last_sale(db: Db, *, customer_id: int, tz: str, actor_telegram_id: int) -> Optional[int]:
-    async with connect(db) as conn:
-        row = await fetchone(conn, "SELECT id, amount FROM sales WHERE customer_id=? ORDER BY id DESC LIMIT 1", (customer_id,))
-        if row is None:
+async def delete_last_sale(db: Storage, *, customer_id: int, tz: str, actor_telegram_id: int) -> Optional[int]:
+    async with _transaction(db) as tx:
+        sale = await tx.last_sale(customer_id)
+        if sale is None:
             return None
-        sale_id = int(row["id"])
-        await conn.execute("DELETE FROM sales WHERE id=?", (sale_id,))
+        sale_id = int(sale["id"])
+        await tx.delete_sale(sale_id)
+        await _apply_total_delta(tx, customer_id=customer_id, delta=-int(sale["amount"]), at=now_iso(tz))
+        _track_sale(db, customer_id=customer_id, sale_date=sale["sale_date"], delta=-int(sale["amount"]))
+
+        await audit(tx, actor_telegram_id=actor_telegram_id, actor_role="admin", action="sale.delete_last", meta={"customer_id": customer_id, "sale_id": sale_id}, tz=tz)
+    rt = _runtime(db)
+    rt.sale_committed(sale["sale_date"])
+    rt.forget_customer(customer_id)
+    return sale_id
 
-        total_spent = int(await fetchval(conn, "SELECT COALESCE(SUM(amount),0) FROM sales WHERE customer_id=?", (customer_id,)) or 0)
-        level = compute_level(total_spent)
-        await conn.execute("UPDATE customers SET total_spent=?, level=?, updated_at=? WHERE id=?", (total_spent, level, now_iso(tz), customer_id))
 
-    await audit(db, actor_telegram_id=actor_telegram_id, actor_role="admin", action="sale.delete_last", meta={"customer_id": customer_id, "sale_id": sale_id}, tz=tz)
-    return sale_id
+async def list_sales_for_customer(db: Storage, *, customer_id: int, limit: int = 50, since: Optional[str] = None) -> list[dict[str, Any]]:
+    return await db.list_sales_for_customer(customer_id, limit=limit, since=since or "")
 
 
-async def list_sales_for_customer(db: Db, *, customer_id: int, limit: int = 50) -> list[dict[str, Any]]:
-    async with connect(db) as conn:
-        rows = await fetchall(
-            conn,
-            """
-            SELECT id, amount, product, comment, sale_date, created_at
-            FROM sales
-            WHERE customer_id=?
-            ORDER BY sale_date DESC, id DESC
-            LIMIT ?
-            """,
-            (customer_id, limit),
-        )
-    return [dict(r) for r in rows]
-
-
-async def sales_between(db: Db, *, start_date: str, end_date: str) -> list[dict[str, Any]]:
-    async with connect(db) as conn:
-        rows = await fetchall(
-            conn,
-            """
-            SELECT s.id, s.amount, s.product, s.comment, s.sale_date, c.id as customer_id, c.full_name, c.phone
-            FROM sales s
-            JOIN customers c ON c.id = s.customer_id
-            WHERE s.sale_date BETWEEN ? AND ?
-            ORDER BY s.sale_date DESC, s.id DESC
-            """,
-            (start_date, end_date),
-        )
-    return [dict(r) for r in rows]
+async def customer_sales_stats(db: Storage, *, customer_id: int, since: Optional[str] = None) -> tuple[int, int]:
+    """(count, sum) of a customer's sales on or after `since`, without loading rows."""
+    return await db.customer_sales_stats(customer_id, since=since or "")
+
+
+def iter_sales_between(db: Storage, *, start_date: str, end_date: str) -> AsyncIterator[dict[str, Any]]:
+    return db.iter_sales_between(start_date=start_date, end_date=end_date)
+
+
+async def range_summary(db: Storage, *, start_date: str, end_date: str) -> tuple[int, int]:
+    """(count, total) of sales in [start_date, end_date]; two lookups, no rows loaded."""
+    return await _cached(
+        db,
+        ("range", start_date, end_date),
+        _months_between(start_date, end_date),
+        lambda: db.range_summary(start_date=start_date, end_date=end_date),
+    )
+
+
+async def sales_between(db: Storage, *, start_date: str, end_date: str) -> list[dict[str, Any]]:
+    return [s async for s in iter_sales_between(db, start_date=start_date, end_date=end_date)]
+
+
+async def monthly_report(db: Storage, *, year: int, month: int) -> dict[str, Any]:
+    prev = f"{year:04d}-{month - 1:02d}" if month > 1 else f"{year - 1:04d}-12"
+    return await _cached(
+        db,
+        ("monthly", year, month),
+        [f"{year:04d}-{month:02d}", prev, CUSTOMERS],
+        lambda: _monthly_report(db, year=year, month=month),
+    )
 
 
-async def monthly_report(db: Db, *, year: int, month: int) -> dict[str, Any]:
+async def _monthly_report(db: Storage, *, year: int, month: int) -> dict[str, Any]:
     start = date(year, month, 1)
     if month == 12:
         end = date(year, 12, 31)
@@ -205,36 +403,13 @@ async def monthly_report(db: Db, *, year: int, month: int) -> dict[str, Any]:
     start_s = start.isoformat()
     end_s = end.isoformat()
 
-    async with connect(db) as conn:
-        total = int(await fetchval(conn, "SELECT COALESCE(SUM(amount),0) FROM sales WHERE sale_date BETWEEN ? AND ?", (start_s, end_s)) or 0)
-        count = int(await fetchval(conn, "SELECT COUNT(1) FROM sales WHERE sale_date BETWEEN ? AND ?", (start_s, end_s)) or 0)
-        top_rows = await fetchall(
-            conn,
-            """
-            SELECT c.id as customer_id, c.full_name, c.phone, COALESCE(SUM(s.amount),0) as sum_amount
-            FROM customers c
-            LEFT JOIN sales s ON s.customer_id=c.id AND s.sale_date BETWEEN ? AND ?
-            GROUP BY c.id
-            ORDER BY sum_amount DESC
-            LIMIT 5
-            """,
-            (start_s, end_s),
-        )
-        top5 = [dict(r) for r in top_rows]
-
-        # Growth vs prev month
-        prev_year = year if month > 1 else year - 1
-        prev_month = month - 1 if month > 1 else 12
-        prev_start = date(prev_year, prev_month, 1)
-        prev_end = (date(prev_year, prev_month + 1, 1) - timedelta(days=1)) if prev_month != 12 else date(prev_year, 12, 31)
-        prev_total = int(
-            await fetchval(
-                conn,
-                "SELECT COALESCE(SUM(amount),0) FROM sales WHERE sale_date BETWEEN ? AND ?",
-                (prev_start.isoformat(), prev_end.isoformat()),
-            )
-            or 0
-        )
+    count, total = await db.monthly_summary(start_s[:7])
+    top5 = await db.monthly_top(start_s[:7], limit=5)
+
+    # Growth vs prev month
+    prev_year = year if month > 1 else year - 1
+    prev_month = month - 1 if month > 1 else 12
+    _, prev_total = await db.monthly_summary(f"{prev_year:04d}-{prev_month:02d}")
     growth_pct = 0.0
     if prev_total > 0:
         growth_pct = (total - prev_total) * 100.0 / prev_total
@@ -250,28 +425,225 @@ async def monthly_report(db: Db, *, year: int, month: int) -> dict[str, Any]:
     }
 
 
-async def check_threshold_rewards(db: Db, *, customer_id: int, tz: str, actor_telegram_id: int) -> list[str]:
+def _growth_pct(total: int, prev_total: int) -> float:
+    return (total - prev_total) * 100.0 / prev_total if prev_total > 0 else 0.0
+
+
+def _period_bounds(period: str, end: date) -> tuple[date, date, date, date]:
+    """(start, end, prev_start, prev_end): `period` up to `end` and the same span one period earlier."""
+    if period == "day":
+        prev = end - timedelta(days=1)
+        return end, end, prev, prev
+    if period == "mtd":
+        start = end.replace(day=1)
+        prev_last = start - timedelta(days=1)
+        return start, end, prev_last.replace(day=1), prev_last.replace(day=min(end.day, prev_last.day))
+    start = date(end.year, 1, 1)
+    prev_end = date(end.year - 1, end.month, min(end.day, 28)) if (end.month, end.day) == (2, 29) else end.replace(year=end.year - 1)
+    return start, end, date(end.year - 1, 1, 1), prev_end
+
+
+async def _compute_snapshot(db: Storage, period: str, as_of: date) -> dict[str, Any]:
+    start, end, prev_start, prev_end = _period_bounds(period, as_of)
+    count, total = await db.range_summary(start_date=start.isoformat(), end_date=end.isoformat())
+    _, prev_total = await db.range_summary(start_date=prev_start.isoformat(), end_date=prev_end.isoformat())
+    top = await db.top_between(start_date=start.isoformat(), end_date=end.isoformat(), limit=PERIOD_TOP)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "count": count,
+        "total": total,
+        "prev_total": prev_total,
+        "growth_pct": _growth_pct(total, prev_total),
+        "top": top,
+    }
+
+
+async def refresh_report_snapshots(db: Storage, *, tz: str) -> None:
+    """Nightly job: recompute and store the day/mtd/ytd snapshots as of yesterday."""
+    async with _runtime(db).snapshot_lock:
+        await _refresh_snapshots(db, tz=tz)
+
+
+async def _refresh_snapshots(db: Storage, *, tz: str) -> None:
+    rt = _runtime(db)
+    as_of = date.today() - timedelta(days=1)
+    rt.snapshots_stale = False
+    snaps = {period: await _compute_snapshot(db, period, as_of) for period in SNAPSHOT_PERIODS}
+    async with _transaction(db) as tx:
+        for period, snap in snaps.items():
+            await tx.save_snapshot(period, as_of=as_of.isoformat(), payload=json_dumps(snap), computed_at=now_iso(tz))
+    rt.snapshots_as_of, rt.snapshots = as_of.isoformat(), snaps
+
+
+async def _report_snapshots(db: Storage, *, tz: str) -> dict[str, dict[str, Any]]:
+    rt = _runtime(db)
+    as_of = (date.today() - timedelta(days=1)).isoformat()
+    if rt.snapshots_stale or rt.snapshots_as_of != as_of:
+        async with rt.snapshot_lock:
+            if not rt.snapshots_stale and rt.snapshots_as_of != as_of:
+                stored = await db.load_snapshots()
+                if all(stored.get(p, ("", ""))[0] == as_of for p in SNAPSHOT_PERIODS):
+                    rt.snapshots_as_of, rt.snapshots = as_of, {p: json.loads(stored[p][1]) for p in SNAPSHOT_PERIODS}
+            if rt.snapshots_stale or rt.snapshots_as_of != as_of:
+                await _refresh_snapshots(db, tz=tz)
+    return rt.snapshots
+
+
+async def period_reports(db: Storage, *, tz: str) -> dict[str, dict[str, Any]]:
+    """Yesterday, month-to-date and year-to-date reports.
+
+    Counts and totals up to yesterday come from the nightly snapshots plus
+    today's sales. The month/year top is ranked by `top_between` over the
+    monthly rollup and this month's days, so a buyer outside yesterday's top
+    who buys today is ranked by their full total.
+    """
+    today = date.today()
+    prev_year = date(today.year - 1, 1, 1).isoformat()
+    return await _cached(
+        db,
+        ("periods", today),
+        [*_months_between(prev_year, today.isoformat()), CUSTOMERS],
+        lambda: _period_reports(db, today=today, tz=tz),
+    )
+
+
+async def _period_reports(db: Storage, *, today: date, tz: str) -> dict[str, dict[str, Any]]:
+    snaps = await _report_snapshots(db, tz=tz)
+    day = today.isoformat()
+    today_count, today_total = await db.range_summary(start_date=day, end_date=day)
+
+    reports = {"day": dict(snaps["day"])}
+    for period in ("mtd", "ytd"):
+        start, end, prev_start, prev_end = _period_bounds(period, today)
+        base = snaps[period]
+        if base["start"] != start.isoformat():  # first day of a new month/year
+            base = {"count": 0, "total": 0, "top": []}
+        _, prev_total = await db.range_summary(start_date=prev_start.isoformat(), end_date=prev_end.isoformat())
+        top = await db.top_between(start_date=start.isoformat(), end_date=day, limit=PERIOD_TOP)
+        total = base["total"] + today_total
+        reports[period] = {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "count": base["count"] + today_count,
+            "total": total,
+            "prev_total": prev_total,
+            "growth_pct": _growth_pct(total, prev_total),
+            "top": top,
+        }
+
+    for rep in reports.values():
+        rep["top"] = [(int(cid), int(total)) for cid, total in rep["top"][:PERIOD_TOP]]
+    customers = await db.get_customers(sorted({cid for rep in reports.values() for cid, _ in rep["top"]}))
+    for rep in reports.values():
+        rep["top"] = [
+            {"customer_id": cid, "full_name": customers[cid].full_name, "phone": customers[cid].phone, "sum_amount": total}
+            for cid, total in rep["top"]
+            if cid in customers
+        ]
+    return reports
+
+
+async def pivot_report(
+    db: Storage, *, start_date: str, end_date: str, dims: tuple[str, ...], metrics: tuple[str, ...] = ("sum", "count")
+) -> list[dict[str, Any]]:
+    """Sales in [start_date, end_date] grouped by `dims`, one row per group; see `Storage.pivot`.
+
+    The whole result is cached, so paging through it does not query again.
+    """
+    unknown = [name for name in dims if name not in PIVOT_DIMENSIONS] + [name for name in metrics if name not in PIVOT_METRICS]
+    if unknown or not metrics or len(set(dims)) != len(dims) or len(set(metrics)) != len(metrics):
+        raise ValueError(f"pivot: invalid dims/metrics {dims!r} {metrics!r}")
+    periods = _months_between(start_date, end_date)
+    if {"level", "status"} & set(dims):
+        periods.append(CUSTOMER_ATTRS)
+    return await _cached(
+        db,
+        ("pivot", start_date, end_date, dims, metrics),
+        periods,
+        lambda: db.pivot(start_date=start_date, end_date=end_date, dims=dims, metrics=metrics),
+    )
+
+
+async def sales_analytics(db: Storage) -> Analytics:
+    """RFM segments and cohort retention over all sales; recomputed only after sales change."""
+    today = date.today()
+    return await _cached(
+        db,
+        ("analytics", today),
+        [SALES],
+        lambda: analyze(db.iter_sale_columns(chunk=ANALYTICS_CHUNK), today=today),
+    )
+
+
+async def product_report(db: Storage, *, limit: int) -> list[dict[str, Any]]:
+    """Best-selling products by lifetime total, read from the per-product running totals."""
+    return await _cached(db, ("products", limit), [SALES], lambda: db.top_products(limit=limit))
+
+
+async def search_sales(
+    db: Storage,
+    *,
+    query: str,
+    start_date: str,
+    end_date: str,
+    customer_id: Optional[int] = None,
+    limit: int,
+    offset: int = 0,
+) -> tuple[int, list[dict[str, Any]]]:
+    """Sales by words of their product or comment, best match first; see `Storage.search_sales`."""
+    return await db.search_sales(
+        query=query.strip(), start_date=start_date, end_date=end_date, customer_id=customer_id, limit=limit, offset=offset
+    )
+
+
+async def monthly_leaderboard(db: Storage, *, limit: int) -> list[dict[str, Any]]:
+    """Current month's top `limit` buyers from the in-memory leaderboard."""
+    month = _current_month()
+    return await _cached(db, ("leaderboard", month, limit), [month, CUSTOMERS], lambda: _monthly_leaderboard(db, limit=limit))
+
+
+async def _monthly_leaderboard(db: Storage, *, limit: int) -> list[dict[str, Any]]:
+    top = (await _month_leaderboard(db)).top(limit)
+    customers = await db.get_customers([cid for cid, _ in top])
+    return [
+        {"customer_id": cid, "full_name": customers[cid].full_name, "phone": customers[cid].phone, "sum_amount": total}
+        for cid, total in top
+        if cid in customers
+    ]
+
+
+async def monthly_rank(db: Storage, *, customer_id: int) -> Optional[tuple[int, int]]:
+    """(place, total) in the current month, or None if the customer bought nothing yet."""
+    board = await _month_leaderboard(db)
+    place = board.rank(customer_id)
+    return None if place is None else (place, board.total(customer_id))
+
+
+async def lifetime_rank(db: Storage, *, customer_id: int) -> Optional[tuple[int, int]]:
+    """(place, buyers) by total_spent among everyone who ever bought, or None for a non-buyer."""
+    board = await _lifetime_leaderboard(db)
+    place = board.rank(customer_id)
+    return None if place is None else (place, len(board))
+
+
+async def check_threshold_rewards(tx: Tx, *, customer_id: int, tz: str, actor_telegram_id: int) -> list[str]:
     """50m -> Chang yutqich, 100m -> Super yutuq. Only once each."""
-    async with connect(db) as conn:
-        total = int(await fetchval(conn, "SELECT total_spent FROM customers WHERE id=?", (customer_id,)) or 0)
-        existing = await fetchall(conn, "SELECT reward_name FROM rewards WHERE customer_id=? AND reward_type='threshold'", (customer_id,))
-        have = {r["reward_name"] for r in existing}
-
-        earned: list[str] = []
-        if total >= BONUS_100M and "Super yutuq" not in have:
-            earned.append("Super yutuq")
-        if total >= BONUS_50M and "Chang yutqich" not in have:
-            earned.append("Chang yutqich")
-
-        for name in earned:
-            await conn.execute(
-                "INSERT INTO rewards(customer_id, reward_type, reward_name, note, created_at) VALUES(?,?,?,?,?)",
-                (customer_id, "threshold", name, "", now_iso(tz)),
-            )
+    total = await tx.customer_total(customer_id)
+    have = await tx.reward_names(customer_id, reward_type="threshold")
+
+    earned: list[str] = []
+    if total >= BONUS_100M and "Super yutuq" not in have:
+        earned.append("Super yutuq")
+    if total >= BONUS_50M and "Chang yutqich" not in have:
+        earned.append("Chang yutqich")
+
+    for name in earned:
+        await tx.insert_reward(customer_id=customer_id, reward_type="threshold", reward_name=name, note="", created_at=now_iso(tz))
 
     if earned:
         await audit(
-            db,
+            tx,
             actor_telegram_id=actor_telegram_id,
             actor_role="admin",
             action="reward.threshold_earned",
@@ -281,114 +653,123 @@ async def check_threshold_rewards(db: Db, *, customer_id: int, tz: str, actor_te
     return earned
 
 
-async def add_manual_reward(db: Db, *, customer_id: int, reward_name: str, note: str, tz: str, actor_telegram_id: int) -> int:
-    async with connect(db) as conn:
-        cur = await conn.execute(
-            "INSERT INTO rewards(customer_id, reward_type, reward_name, note, created_at) VALUES(?,?,?,?,?)",
-            (customer_id, "manual", reward_name.strip(), (note or "").strip(), now_iso(tz)),
-        )
-        rid = int(cur.lastrowid)
-    await audit(db, actor_telegram_id=actor_telegram_id, actor_role="admin", action="reward.manual_add", meta={"customer_id": customer_id, "reward_id": rid, "reward_name": reward_name}, tz=tz)
+async def add_manual_reward(db: Storage, *, customer_id: int, reward_name: str, note: str, tz: str, actor_telegram_id: int) -> int:
+    async with _transaction(db) as tx:
+        rid = await tx.insert_reward(customer_id=customer_id, reward_type="manual", reward_name=reward_name.strip(), note=(note or "").strip(), created_at=now_iso(tz))
+        await audit(tx, actor_telegram_id=actor_telegram_id, actor_role="admin", action="reward.manual_add", meta={"customer_id": customer_id, "reward_id": rid, "reward_name": reward_name}, tz=tz)
+    _runtime(db).bump(_current_month())
     return rid
 
 
-async def list_rewards(db: Db, *, customer_id: int, limit: int = 50) -> list[dict[str, Any]]:
-    async with connect(db) as conn:
-        rows = await fetchall(
-            conn,
-            """
-            SELECT id, reward_type, reward_name, note, created_at
-            FROM rewards
-            WHERE customer_id=?
-            ORDER BY id DESC
-            LIMIT ?
-            """,
-            (customer_id, limit),
-        )
-    return [dict(r) for r in rows]
+async def list_rewards(db: Storage, *, customer_id: int, limit: int = 50) -> list[dict[str, Any]]:
+    return await db.list_rewards(customer_id, limit=limit)
 
 
-async def get_customer_by_chat(db: Db, *, chat_id: int) -> Optional[Customer]:
-    async with connect(db) as conn:
-        row = await fetchone(
-            conn,
-            "SELECT id, full_name, phone, chat_id, status, total_spent, level FROM customers WHERE chat_id=?",
-            (chat_id,),
-        )
-    return None if row is None else Customer(**dict(row))
+async def get_customer_by_chat(db: Storage, *, chat_id: int) -> Optional[Customer]:
+    """The customer linked to `chat_id`; repeat lookups (every customer-panel button) are served from memory."""
+    rt = _runtime(db)
+    customer_id = rt.customer_chats.get(chat_id)
+    if customer_id == NO_CUSTOMER:
+        return None
+    if customer_id is not None:
+        customer = await get_customer(db, customer_id=customer_id)
+        if customer is not None and customer.chat_id == chat_id:
+            return customer
+    epoch = rt.customer_epoch
+    customer = await db.get_customer_by_chat(chat_id)
+    if epoch == rt.customer_epoch:
+        rt.customer_chats.put(chat_id, NO_CUSTOMER if customer is None else customer.id)
+        if customer is not None:
+            rt.customers.put(customer.id, customer)
+    return customer
 
 
-async def active_customers_with_chat(db: Db) -> list[Customer]:
-    async with connect(db) as conn:
-        rows = await fetchall(
-            conn,
-            "SELECT id, full_name, phone, chat_id, status, total_spent, level FROM customers WHERE status='active' AND chat_id IS NOT NULL",
-        )
-    return [Customer(**dict(r)) for r in rows]
+def iter_customers_with_chat(db: Storage, *, active_only: bool, chunk: int = 500) -> AsyncIterator[Customer]:
+    """Broadcast targets, paged so slow sends never pin a read snapshot."""
+    return db.iter_customers_with_chat(active_only=active_only, chunk=chunk)
 
 
-async def all_customers_with_chat(db: Db) -> list[Customer]:
-    async with connect(db) as conn:
-        rows = await fetchall(
-            conn,
-            "SELECT id, full_name, phone, chat_id, status, total_spent, level FROM customers WHERE chat_id IS NOT NULL",
-        )
-    return [Customer(**dict(r)) for r in rows]
+async def count_customers_with_chat(db: Storage, *, active_only: bool) -> int:
+    return await db.count_customers_with_chat(active_only=active_only)
+
 
+async def active_customers_with_chat(db: Storage) -> list[Customer]:
+    return [c async for c in iter_customers_with_chat(db, active_only=True)]
 
-async def customers_inactive_days(db: Db, *, days: int, tz: str) -> list[Customer]:
+
+async def all_customers_with_chat(db: Storage) -> list[Customer]:
+    return [c async for c in iter_customers_with_chat(db, active_only=False)]
+
+
+async def customers_inactive_days(db: Storage, *, days: int, tz: str) -> list[Customer]:
     """No sales in last N days (or no sales ever)."""
     # We'll compare by sale_date (YYYY-MM-DD)
     cutoff = (datetime.now().date() - timedelta(days=days)).isoformat()
-    async with connect(db) as conn:
-        rows = await fetchall(
-            conn,
-            """
-            SELECT c.id, c.full_name, c.phone, c.chat_id, c.status, c.total_spent, c.level
-            FROM customers c
-            LEFT JOIN (
-              SELECT customer_id, MAX(sale_date) AS last_sale_date
-              FROM sales
-              GROUP BY customer_id
-            ) ls ON ls.customer_id = c.id
-            WHERE (ls.last_sale_date IS NULL OR ls.last_sale_date < ?) AND c.status='active'
-            """,
-            (cutoff,),
-        )
-    return [Customer(**dict(r)) for r in rows]
+    return await db.customers_inactive_since(cutoff)
 
 
-async def delete_sale_by_id(db: Db, *, sale_id: int, tz: str, actor_telegram_id: int) -> Optional[int]:
-    async with connect(db) as conn:
-        row = await fetchone(conn, "SELECT id, customer_id FROM sales WHERE id=?", (sale_id,))
-        if row is None:
+async def delete_sale_by_id(db: Storage, *, sale_id: int, tz: str, actor_telegram_id: int) -> Optional[int]:
+    async with _transaction(db) as tx:
+        sale = await tx.get_sale(sale_id)
+        if sale is None:
             return None
-        cid = int(row["customer_id"])
-        await conn.execute("DELETE FROM sales WHERE id=?", (sale_id,))
-        total_spent = int(await fetchval(conn, "SELECT COALESCE(SUM(amount),0) FROM sales WHERE customer_id=?", (cid,)) or 0)
-        level = compute_level(total_spent)
-        await conn.execute("UPDATE customers SET total_spent=?, level=?, updated_at=? WHERE id=?", (total_spent, level, now_iso(tz), cid))
-    await audit(db, actor_telegram_id=actor_telegram_id, actor_role="admin", action="sale.delete_by_id", meta={"sale_id": sale_id, "customer_id": cid}, tz=tz)
+        cid = int(sale["customer_id"])
+        await tx.delete_sale(sale_id)
+        await _apply_total_delta(tx, customer_id=cid, delta=-int(sale["amount"]), at=now_iso(tz))
+        _track_sale(db, customer_id=cid, sale_date=sale["sale_date"], delta=-int(sale["amount"]))
+        await audit(tx, actor_telegram_id=actor_telegram_id, actor_role="admin", action="sale.delete_by_id", meta={"sale_id": sale_id, "customer_id": cid}, tz=tz)
+    rt = _runtime(db)
+    rt.sale_committed(sale["sale_date"])
+    rt.forget_customer(cid)
     return sale_id
 
 
-async def delete_reward(db: Db, *, reward_id: int, tz: str, actor_telegram_id: int) -> Optional[int]:
-    async with connect(db) as conn:
-        row = await fetchone(conn, "SELECT id, customer_id FROM rewards WHERE id=?", (reward_id,))
-        if row is None:
+async def delete_reward(db: Storage, *, reward_id: int, tz: str, actor_telegram_id: int) -> Optional[int]:
+    async with _transaction(db) as tx:
+        reward = await tx.get_reward(reward_id)
+        if reward is None:
             return None
-        cid = int(row["customer_id"])
-        await conn.execute("DELETE FROM rewards WHERE id=?", (reward_id,))
-    await audit(db, actor_telegram_id=actor_telegram_id, actor_role="admin", action="reward.delete", meta={"reward_id": reward_id, "customer_id": cid}, tz=tz)
+        cid = int(reward["customer_id"])
+        await tx.delete_reward(reward_id)
+        await audit(tx, actor_telegram_id=actor_telegram_id, actor_role="admin", action="reward.delete", meta={"reward_id": reward_id, "customer_id": cid}, tz=tz)
+    _runtime(db).bump(reward["created_at"][:7])
     return reward_id
 
 
-async def delete_customer(db: Db, *, customer_id: int, tz: str, actor_telegram_id: int) -> bool:
-    async with connect(db) as conn:
-        row = await fetchone(conn, "SELECT id FROM customers WHERE id=?", (customer_id,))
-        if row is None:
+async def delete_customer(db: Storage, *, customer_id: int, tz: str, actor_telegram_id: int) -> bool:
+    async with _transaction(db) as tx:
+        if not await tx.delete_customer(customer_id):
             return False
-        await conn.execute("DELETE FROM customers WHERE id=?", (customer_id,))
-    await audit(db, actor_telegram_id=actor_telegram_id, actor_role="admin", action="customer.delete", meta={"customer_id": customer_id}, tz=tz)
+        rt = _runtime(db)
+        rt.leaderboard.remove(customer_id)
+        if rt.lifetime is not None:
+            rt.lifetime.remove(customer_id)
+        await audit(tx, actor_telegram_id=actor_telegram_id, actor_role="admin", action="customer.delete", meta={"customer_id": customer_id}, tz=tz)
+    # Sales and rewards cascade, across any number of months.
+    rt = _runtime(db)
+    rt.generation += 1
+    rt.snapshots_stale = True
+    rt.forget_customer(customer_id)
+    if rt.typeahead is not None:
+        rt.typeahead.remove(customer_id)
     return True
 
+
+async def recompute_customer_totals(db: Storage, *, tz: str, customer_id: Optional[int] = None) -> int:
+    """Repair job: re-sum sales into total_spent/level. Returns how many rows were off."""
+    async with _transaction(db) as tx:
+        fixed = 0
+        for r in await tx.sales_totals(customer_id):
+            real_total = int(r["real_total"])
+            level = compute_level(real_total)
+            if int(r["total_spent"]) == real_total and r["level"] == level:
+                continue
+            await tx.set_customer_total(int(r["id"]), total_spent=real_total, level=level, at=now_iso(tz))
+            fixed += 1
+    if fixed:
+        rt = _runtime(db)
+        rt.bump(CUSTOMER_ATTRS)
+        rt.lifetime = None
+        rt.customers.clear()
+        rt.customer_epoch += 1
+    return fixed
@@ -0,0 +1,577 @@
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+from . import db as sql
+from .db import Db, UnitOfWork, fetchall, fetchone, fetchval, iterate, read, snapshot, unit_of_work
+from .models import Customer
+from .search import (
+    SALE_SEARCH_CANDIDATES,
+    SEARCH_CANDIDATES,
+    fts_phrases,
+    like_pattern,
+    parse_query,
+    phone_key,
+    prefix_range,
+    rank,
+    sale_match,
+    split_words,
+)
+from .utils import normalize_key, split_by_month
+
+CUSTOMER_COLUMNS = "id, full_name, phone, chat_id, status, total_spent, level, last_sale_date"
+
+# Sales not yet backfilled into products still carry their own product text.
+PRODUCT_NAME = "COALESCE(p.name, s.product)"
+
+# name -> (selected expression, GROUP BY expression)
+_PIVOT_DIMENSIONS = {
+    # By product id; the text only groups sales the products backfill has not reached.
+    "product": (PRODUCT_NAME, "p.id, CASE WHEN p.id IS NULL THEN s.product END"),
+    "level": ("c.level", "level"),
+    "weekday": ("CAST(strftime('%w', s.sale_date) AS INTEGER)", "weekday"),
+    "month": ("substr(s.sale_date, 1, 7)", "month"),
+    "status": ("c.status", "status"),
+    "customer": ("'#' || c.id || ' ' || c.full_name", "customer"),
+}
+_PIVOT_METRICS = {
+    "sum": "SUM(s.amount)",
+    "count": "COUNT(1)",
+    "avg": "AVG(s.amount)",
+    "customers": "COUNT(DISTINCT s.customer_id)",
+}
+
+
+class SqliteTx:
+    def __init__(self, uow: UnitOfWork) -> None:
+        self.uow = uow
+
+    async def insert_customer(self, *, full_name: str, phone: str, chat_id: Optional[int], created_at: str) -> int:
+        return await self.uow.insert(
+            """
+            INSERT INTO customers(full_name, phone, chat_id, status, total_spent, level, created_at, updated_at, name_key, phone_rev)
+            VALUES(?,?,?,?,?,?,?,?,?,?)
+            """,
+            (full_name, phone, chat_id, "active", 0, "Bronze", created_at, created_at, normalize_key(full_name), phone_key(phone)),
+        )
+
+    async def customer_total(self, customer_id: int) -> int:
+        return int(await self.uow.fetchval("SELECT total_spent FROM customers WHERE id=?", (customer_id,)) or 0)
+
+    async def set_customer_total(self, customer_id: int, *, total_spent: int, level: str, at: str) -> None:
+        await self.uow.execute("UPDATE customers SET total_spent=?, level=?, updated_at=? WHERE id=?", (total_spent, level, at, customer_id))
+
+    async def set_customer_status(self, customer_id: int, *, status: str, at: str) -> None:
+        await self.uow.execute("UPDATE customers SET status=?, updated_at=? WHERE id=?", (status, at, customer_id))
+
+    async def customer_id_by_phone(self, phone: str) -> Optional[int]:
+        row = await self.uow.fetchone("SELECT id FROM customers WHERE phone=?", (phone,))
+        return None if row is None else int(row["id"])
+
+    async def set_customer_chat(self, customer_id: int, *, chat_id: int, at: str) -> None:
+        await self.uow.execute("UPDATE customers SET chat_id=?, updated_at=? WHERE id=?", (chat_id, at, customer_id))
+
+    async def delete_customer(self, customer_id: int) -> bool:
+        if await self.uow.fetchone("SELECT id FROM customers WHERE id=?", (customer_id,)) is None:
+            return False
+        await self.uow.execute("DELETE FROM customers WHERE id=?", (customer_id,))
+        return True
+
+    async def ensure_product(self, *, key: str, name: str, created_at: str) -> int:
+        row = await self.uow.fetchone("SELECT id FROM products WHERE key=?", (key,))
+        if row is not None:
+            return int(row["id"])
+        return await self.uow.insert("INSERT INTO products(key, name, created_at) VALUES(?,?,?)", (key, name, created_at))
+
+    async def insert_sale(self, *, customer_id: int, amount: int, product_id: int, comment: str, sale_date: str, created_at: str) -> int:
+        # The name lives in products; the product column stays empty for new rows.
+        return await self.uow.insert(
+            """
+            INSERT INTO sales(customer_id, amount, product, product_id, comment, sale_date, created_at)
+            VALUES(?,?,'',?,?,?,?)
+            """,
+            (customer_id, amount, product_id, comment, sale_date, created_at),
+        )
+
+    async def get_sale(self, sale_id: int) -> Optional[dict[str, Any]]:
+        row = await self.uow.fetchone("SELECT id, customer_id, amount, sale_date FROM sales WHERE id=?", (sale_id,))
+        return None if row is None else dict(row)
+
+    async def last_sale(self, customer_id: int) -> Optional[dict[str, Any]]:
+        row = await self.uow.fetchone(
+            "SELECT id, customer_id, amount, sale_date FROM sales WHERE customer_id=? ORDER BY id DESC LIMIT 1",
+            (customer_id,),
+        )
+        return None if row is None else dict(row)
+
+    async def delete_sale(self, sale_id: int) -> None:
+        await self.uow.execute("DELETE FROM sales WHERE id=?", (sale_id,))
+
+    async def insert_reward(self, *, customer_id: int, reward_type: str, reward_name: str, note: str, created_at: str) -> int:
+        return await self.uow.insert(
+            "INSERT INTO rewards(customer_id, reward_type, reward_name, note, created_at) VALUES(?,?,?,?,?)",
+            (customer_id, reward_type, reward_name, note, created_at),
+        )
+
+    async def get_reward(self, reward_id: int) -> Optional[dict[str, Any]]:
+        row = await self.uow.fetchone("SELECT id, customer_id, created_at FROM rewards WHERE id=?", (reward_id,))
+        return None if row is None else dict(row)
+
+    async def delete_reward(self, reward_id: int) -> None:
+        await self.uow.execute("DELETE FROM rewards WHERE id=?", (reward_id,))
+
+    async def reward_names(self, customer_id: int, *, reward_type: str) -> set[str]:
+        rows = await self.uow.fetchall("SELECT reward_name FROM rewards WHERE customer_id=? AND reward_type=?", (customer_id, reward_type))
+        return {r["reward_name"] for r in rows}
+
+    async def insert_audit(self, *, actor_telegram_id: Optional[int], actor_role: str, action: str, meta_json: str, at: str) -> None:
+        await self.uow.execute(
+            "INSERT INTO audit_logs(actor_telegram_id, actor_role, action, meta_json, at) VALUES(?,?,?,?,?)",
+            (actor_telegram_id, actor_role, action, meta_json, at),
+        )
+
+    async def sales_totals(self, customer_id: Optional[int] = None) -> list[dict[str, Any]]:
+        where = "" if customer_id is None else "WHERE c.id=?"
+        args: tuple[Any, ...] = () if customer_id is None else (customer_id,)
+        rows = await self.uow.fetchall(
+            f"""
+            SELECT c.id, c.total_spent, c.level, COALESCE(SUM(s.amount),0) AS real_total
+            FROM customers c
+            LEFT JOIN sales s ON s.customer_id = c.id
+            {where}
+            GROUP BY c.id
+            """,
+            args,
+        )
+        return [dict(r) for r in rows]
+
+    async def customer_totals(self) -> list[tuple[int, int]]:
+        rows = await self.uow.fetchall("SELECT id, total_spent FROM customers WHERE total_spent > 0")
+        return [(int(r["id"]), int(r["total_spent"])) for r in rows]
+
+    async def monthly_totals(self, month: str) -> list[tuple[int, int]]:
+        rows = await self.uow.fetchall("SELECT customer_id, total FROM sales_monthly WHERE month=? AND customer_id > 0", (month,))
+        return [(int(r["customer_id"]), int(r["total"])) for r in rows]
+
+    async def save_snapshot(self, period: str, *, as_of: str, payload: str, computed_at: str) -> None:
+        await self.uow.execute(
+            "INSERT OR REPLACE INTO report_snapshots(period, as_of, payload, computed_at) VALUES(?,?,?,?)",
+            (period, as_of, payload, computed_at),
+        )
+
+
+class SqliteStorage:
+    """The production backend: `app.db` pool, migrations and SQL."""
+
+    name = "sqlite"
+
+    def __init__(
+        self,
+        *,
+        path: str,
+        pool_size: int = 4,
+        snapshot_pool_size: int = 2,
+        busy_timeout_ms: int = sql.BUSY_TIMEOUT_MS,
+        write_retries: int = sql.WRITE_RETRIES,
+    ) -> None:
+        self.db = Db(
+            path=path,
+            pool_size=pool_size,
+            snapshot_pool_size=snapshot_pool_size,
+            busy_timeout_ms=busy_timeout_ms,
+            write_retries=write_retries,
+        )
+
+    async def open(self) -> None:
+        await sql.migrate(self.db)
+
+    async def run_backfills(self) -> None:
+        await sql.run_backfills(self.db)
+
+    async def close(self) -> None:
+        await sql.close(self.db)
+
+    def stats(self) -> dict[str, Any]:
+        return sql.stats(self.db)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[SqliteTx]:
+        async with unit_of_work(self.db) as uow:
+            yield SqliteTx(uow)
+
+    async def list_customers(self, *, limit: int) -> list[Customer]:
+        async with read(self.db) as conn:
+            rows = await fetchall(conn, f"SELECT {CUSTOMER_COLUMNS} FROM customers ORDER BY id DESC LIMIT ?", (limit,))
+        return [Customer(**dict(r)) for r in rows]
+
+    async def iter_customers(self) -> AsyncIterator[Customer]:
+        async with snapshot(self.db) as conn:
+            async for r in iterate(conn, f"SELECT {CUSTOMER_COLUMNS} FROM customers ORDER BY id DESC"):
+                yield Customer(**dict(r))
+
+    async def find_customers(self, *, query: str, limit: int) -> list[Customer]:
+        digits, key = parse_query(query)
+        words, short_words = split_words(key)
+        async with read(self.db) as conn:
+            if digits is not None:
+                # Exact id, exact phone, then the newest phone suffixes via idx_customers_phone_rev.
+                lo, hi = prefix_range(phone_key(digits))
+                rows = await fetchall(
+                    conn,
+                    f"""
+                    SELECT {CUSTOMER_COLUMNS} FROM customers WHERE id = ?
+                    UNION
+                    SELECT {CUSTOMER_COLUMNS} FROM customers WHERE phone = ?
+                    UNION
+                    SELECT * FROM (
+                      SELECT {CUSTOMER_COLUMNS} FROM customers WHERE phone_rev >= ? AND phone_rev < ? ORDER BY id DESC LIMIT ?
+                    )
+                    """,
+                    (int(digits) if len(digits) < 19 else -1, digits, lo, hi, limit),
+                )
+            elif words:
+                # The exact name however old, plus the newest names containing every word:
+                # long words through the trigram index, short ones as a filter on its hits.
+                short_sql = "".join(" AND c.name_key LIKE ? ESCAPE '\\'" for _ in short_words)
+                rows = await fetchall(
+                    conn,
+                    f"""
+                    SELECT {CUSTOMER_COLUMNS} FROM customers WHERE name_key = ?
+                    UNION
+                    SELECT * FROM (
+                      SELECT {", ".join(f"c.{col.strip()}" for col in CUSTOMER_COLUMNS.split(","))}
+                      FROM customer_search f
+                      JOIN customers c ON c.id = f.rowid
+                      WHERE customer_search MATCH ? {short_sql}
+                      ORDER BY f.rowid DESC
+                      LIMIT ?
+                    )
+                    """,
+                    (key, fts_phrases(words), *(like_pattern(w) for w in short_words), SEARCH_CANDIDATES),
+                )
+            elif key:
+                # Only words too short for a trigram: names starting with the query through
+                # the name_key index, plus the newest names containing every word (a scan
+                # that stops after SEARCH_CANDIDATES hits).
+                short_sql = " AND ".join("name_key LIKE ? ESCAPE '\\'" for _ in short_words)
+                rows = await fetchall(
+                    conn,
+                    f"""
+                    SELECT * FROM (
+                      SELECT {CUSTOMER_COLUMNS} FROM customers WHERE name_key >= ? AND name_key < ? ORDER BY id DESC LIMIT ?
+                    )
+                    UNION
+                    SELECT * FROM (
+                      SELECT {CUSTOMER_COLUMNS} FROM customers WHERE {short_sql} ORDER BY id DESC LIMIT ?
+                    )
+                    """,
+                    (*prefix_range(key), limit, *(like_pattern(w) for w in short_words), SEARCH_CANDIDATES),
+                )
+            else:
+                rows = await fetchall(conn, f"SELECT {CUSTOMER_COLUMNS} FROM customers ORDER BY id DESC LIMIT ?", (limit,))
+        return rank([Customer(**dict(r)) for r in rows], digits=digits, key=key)[:limit]
+
+    async def get_customer(self, customer_id: int) -> Optional[Customer]:
+        async with read(self.db) as conn:
+            row = await fetchone(conn, f"SELECT {CUSTOMER_COLUMNS} FROM customers WHERE id=?", (customer_id,))
+        return None if row is None else Customer(**dict(row))
+
+    async def get_customer_by_chat(self, chat_id: int) -> Optional[Customer]:
+        async with read(self.db) as conn:
+            row = await fetchone(conn, f"SELECT {CUSTOMER_COLUMNS} FROM customers WHERE chat_id=?", (chat_id,))
+        return None if row is None else Customer(**dict(row))
+
+    async def get_customers(self, customer_ids: list[int]) -> dict[int, Customer]:
+        if not customer_ids:
+            return {}
+        marks = ",".join("?" * len(customer_ids))
+        async with read(self.db) as conn:
+            rows = await fetchall(conn, f"SELECT {CUSTOMER_COLUMNS} FROM customers WHERE id IN ({marks})", tuple(customer_ids))
+        return {int(r["id"]): Customer(**dict(r)) for r in rows}
+
+    async def iter_customers_with_chat(self, *, active_only: bool, chunk: int) -> AsyncIterator[Customer]:
+        # Keyset-paged so slow sends never pin a read snapshot.
+        status_sql = "AND status='active'" if active_only else ""
+        last_id = 0
+        while True:
+            async with read(self.db) as conn:
+                page = [
+                    Customer(**dict(r))
+                    async for r in iterate(
+                        conn,
+                        f"""
+                        SELECT {CUSTOMER_COLUMNS}
+                        FROM customers
+                        WHERE chat_id IS NOT NULL {status_sql} AND id > ?
+                        ORDER BY id
+                        LIMIT ?
+                        """,
+                        (last_id, chunk),
+                        chunk=chunk,
+                    )
+                ]
+            if not page:
+                return
+            for c in page:
+                yield c
+            last_id = page[-1].id
+
+    async def count_customers_with_chat(self, *, active_only: bool) -> int:
+        status_sql = "AND status='active'" if active_only else ""
+        async with read(self.db) as conn:
+            return int(await fetchval(conn, f"SELECT COUNT(1) FROM customers WHERE chat_id IS NOT NULL {status_sql}") or 0)
+
+    async def customers_inactive_since(self, cutoff: str) -> list[Customer]:
+        # Two ranges of idx_customers_status_last_sale: never bought, and bought before cutoff.
+        async with read(self.db) as conn:
+            rows = await fetchall(
+                conn,
+                f"""
+                SELECT {CUSTOMER_COLUMNS} FROM customers WHERE status='active' AND last_sale_date IS NULL
+                UNION ALL
+                SELECT {CUSTOMER_COLUMNS} FROM customers WHERE status='active' AND last_sale_date < ?
+                """,
+                (cutoff,),
+            )
+        return [Customer(**dict(r)) for r in rows]
+
+    async def list_sales_for_customer(self, customer_id: int, *, limit: int, since: str) -> list[dict[str, Any]]:
+        async with read(self.db) as conn:
+            rows = await fetchall(
+                conn,
+                f"""
+                SELECT s.id, s.amount, {PRODUCT_NAME} AS product, s.comment, s.sale_date, s.created_at
+                FROM sales s
+                LEFT JOIN products p ON p.id = s.product_id
+                WHERE s.customer_id=? AND s.sale_date >= ?
+                ORDER BY s.sale_date DESC, s.id DESC
+                LIMIT ?
+                """,
+                (customer_id, since, limit),
+            )
+        return [dict(r) for r in rows]
+
+    async def customer_sales_stats(self, customer_id: int, *, since: str) -> tuple[int, int]:
+        async with read(self.db) as conn:
+            row = await fetchone(
+                conn,
+                "SELECT COUNT(1) AS cnt, COALESCE(SUM(amount),0) AS total FROM sales WHERE customer_id=? AND sale_date >= ?",
+                (customer_id, since),
+            )
+        assert row is not None
+        return int(row["cnt"]), int(row["total"])
+
+    async def iter_sales_between(self, *, start_date: str, end_date: str) -> AsyncIterator[dict[str, Any]]:
+        async with snapshot(self.db) as conn:
+            async for r in iterate(
+                conn,
+                f"""
+                SELECT s.id, s.amount, {PRODUCT_NAME} AS product, s.comment, s.sale_date, c.id as customer_id, c.full_name, c.phone
+                FROM sales s
+                JOIN customers c ON c.id = s.customer_id
+                LEFT JOIN products p ON p.id = s.product_id
+                WHERE s.sale_date BETWEEN ? AND ?
+                ORDER BY s.sale_date DESC, s.id DESC
+                """,
+                (start_date, end_date),
+            ):
+                yield dict(r)
+
+    async def range_summary(self, *, start_date: str, end_date: str) -> tuple[int, int]:
+        if start_date > end_date:
+            return 0, 0
+        async with read(self.db) as conn:
+            rows = await fetchall(
+                conn,
+                """
+                SELECT 1 AS sign, * FROM (SELECT cum_cnt, cum_total FROM sales_daily WHERE day <= ? ORDER BY day DESC LIMIT 1)
+                UNION ALL
+                SELECT -1 AS sign, * FROM (SELECT cum_cnt, cum_total FROM sales_daily WHERE day < ? ORDER BY day DESC LIMIT 1)
+                """,
+                (end_date, start_date),
+            )
+        # A missing row means nothing was sold up to that day.
+        return (
+            sum(int(r["sign"]) * int(r["cum_cnt"]) for r in rows),
+            sum(int(r["sign"]) * int(r["cum_total"]) for r in rows),
+        )
+
+    async def monthly_summary(self, month: str) -> tuple[int, int]:
+        async with read(self.db) as conn:
+            row = await fetchone(conn, "SELECT cnt, total FROM sales_monthly WHERE month=? AND customer_id=0", (month,))
+        return (0, 0) if row is None else (int(row["cnt"]), int(row["total"]))
+
+    async def monthly_top(self, month: str, *, limit: int) -> list[dict[str, Any]]:
+        async with read(self.db) as conn:
+            rows = await fetchall(
+                conn,
+                """
+                SELECT m.customer_id, c.full_name, c.phone, m.total AS sum_amount
+                FROM sales_monthly m
+                JOIN customers c ON c.id = m.customer_id
+                WHERE m.month=? AND m.customer_id > 0
+                ORDER BY m.total DESC, m.customer_id
+                LIMIT ?
+                """,
+                (month, limit),
+            )
+            top = [dict(r) for r in rows]
+            if len(top) < limit:
+                # Fewer buyers than slots: fill with non-buyers, as the old LEFT JOIN did.
+                rows = await fetchall(
+                    conn,
+                    """
+                    SELECT c.id AS customer_id, c.full_name, c.phone, 0 AS sum_amount
+                    FROM customers c
+                    WHERE NOT EXISTS (SELECT 1 FROM sales_monthly m WHERE m.month=? AND m.customer_id=c.id)
+                    ORDER BY c.id
+                    LIMIT ?
+                    """,
+                    (month, limit - len(top)),
+                )
+                top += [dict(r) for r in rows]
+        return top
+
+    async def top_between(self, *, start_date: str, end_date: str, limit: int) -> list[tuple[int, int]]:
+        months, parts = split_by_month(start_date, end_date)
+        branches: list[str] = []
+        args: list[Any] = []
+        if months:
+            branches.append("SELECT customer_id, total FROM sales_monthly WHERE month BETWEEN ? AND ? AND customer_id > 0")
+            args += [months[0], months[-1]]
+        for lo, hi in parts:
+            branches.append("SELECT customer_id, amount AS total FROM sales WHERE sale_date BETWEEN ? AND ?")
+            args += [lo, hi]
+        if not branches:
+            return []
+        async with snapshot(self.db) as conn:
+            rows = await fetchall(
+                conn,
+                f"""
+                SELECT customer_id, SUM(total) AS total
+                FROM ({" UNION ALL ".join(branches)})
+                GROUP BY customer_id
+                ORDER BY total DESC, customer_id
+                LIMIT ?
+                """,
+                (*args, limit),
+            )
+        return [(int(r["customer_id"]), int(r["total"])) for r in rows]
+
+    async def pivot(self, *, start_date: str, end_date: str, dims: tuple[str, ...], metrics: tuple[str, ...]) -> list[dict[str, Any]]:
+        # One range scan over idx_sales_date; customers and products are joined by
+        # primary key only when a dimension needs them.
+        columns = [f"{_PIVOT_DIMENSIONS[d][0]} AS {d}" for d in dims] + [f"{_PIVOT_METRICS[m]} AS {m}" for m in metrics]
+        joins = []
+        if {"level", "status", "customer"} & set(dims):
+            joins.append("JOIN customers c ON c.id = s.customer_id")
+        if "product" in dims:
+            joins.append("LEFT JOIN products p ON p.id = s.product_id")
+        group = f"GROUP BY {', '.join(_PIVOT_DIMENSIONS[d][1] for d in dims)}" if dims else ""
+        order = ", ".join([f"{metrics[0]} DESC", *dims])
+        async with snapshot(self.db) as conn:
+            rows = await fetchall(
+                conn,
+                f"""
+                SELECT {", ".join(columns)}
+                FROM sales s INDEXED BY idx_sales_date
+                {" ".join(joins)}
+                WHERE s.sale_date BETWEEN ? AND ?
+                {group}
+                ORDER BY {order}
+                """,
+                (start_date, end_date),
+            )
+        return [dict(r) for r in rows]
+
+    async def top_products(self, *, limit: int) -> list[dict[str, Any]]:
+        async with read(self.db) as conn:
+            rows = await fetchall(
+                conn,
+                "SELECT id, name, cnt, total FROM products WHERE cnt > 0 ORDER BY total DESC, id LIMIT ?",
+                (limit,),
+            )
+        return [dict(r) for r in rows]
+
+    async def search_sales(
+        self, *, query: str, start_date: str, end_date: str, customer_id: Optional[int], limit: int, offset: int
+    ) -> tuple[int, list[dict[str, Any]]]:
+        match = sale_match(query, start_date=start_date, end_date=end_date, customer_id=customer_id)
+        if match is None:
+            return 0, []
+        # The index is walked newest rowid first and stops after the candidate cap, so
+        # a common word costs the same on a year of sales as on ten; bm25 only ranks
+        # those candidates. The customer and month tags narrow the walk; the exact
+        # filters are still checked on each hit by primary key.
+        where = "sales_search MATCH ? AND s.sale_date BETWEEN ? AND ?"
+        args: list[Any] = [match, start_date, end_date]
+        if customer_id is not None:
+            where += " AND s.customer_id = ?"
+            args.append(customer_id)
+        async with read(self.db) as conn:
+            rows = await fetchall(
+                conn,
+                f"""
+                SELECT m.id, m.customer_id, c.full_name, m.amount, COALESCE(p.name, m.product) AS product, m.comment, m.sale_date,
+                       COUNT(1) OVER () AS matched
+                FROM (
+                  SELECT s.id, s.customer_id, s.amount, s.product_id, s.product, s.comment, s.sale_date,
+                         bm25(sales_search, 2.0, 1.0, 0.0) AS score
+                  FROM sales_search f JOIN sales s ON s.id = f.rowid
+                  WHERE {where}
+                  ORDER BY f.rowid DESC
+                  LIMIT ?
+                ) AS m
+                JOIN customers c ON c.id = m.customer_id
+                LEFT JOIN products p ON p.id = m.product_id
+                ORDER BY m.score, m.id DESC
+                LIMIT ? OFFSET ?
+                """,
+                (*args, SALE_SEARCH_CANDIDATES, limit, offset),
+            )
+        return (int(rows[0]["matched"]) if rows else 0), [{k: r[k] for k in r.keys() if k != "matched"} for r in rows]
+
+    async def iter_sale_columns(self, *, chunk: int) -> AsyncIterator[tuple[list[int], list[str], list[int]]]:
+        async with snapshot(self.db) as conn:
+            cur = await conn.execute("SELECT customer_id, sale_date, amount FROM sales")
+            cur.row_factory = None  # plain tuples: a Row per sale costs more than the query
+            try:
+                while rows := await cur.fetchmany(chunk):
+                    yield [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows]
+            finally:
+                await cur.close()
+
+    async def load_snapshots(self) -> dict[str, tuple[str, str]]:
+        async with read(self.db) as conn:
+            rows = await fetchall(conn, "SELECT period, as_of, payload FROM report_snapshots")
+        return {r["period"]: (r["as_of"], r["payload"]) for r in rows}
+
+    async def list_rewards(self, customer_id: int, *, limit: int) -> list[dict[str, Any]]:
+        async with read(self.db) as conn:
+            rows = await fetchall(
+                conn,
+                """
+                SELECT id, reward_type, reward_name, note, created_at
+                FROM rewards
+                WHERE customer_id=?
+                ORDER BY id DESC
+                LIMIT ?
+                """,
+                (customer_id, limit),
+            )
+        return [dict(r) for r in rows]
+
+    async def claim_update(self, update_id: int, *, at: int) -> bool:
+        async with unit_of_work(self.db) as uow:
+            cur = await uow.execute("INSERT OR IGNORE INTO processed_updates(update_id, seen_at) VALUES(?,?)", (update_id, at))
+            return cur.rowcount == 1
+
+    async def release_update(self, update_id: int) -> None:
+        async with unit_of_work(self.db) as uow:
+            await uow.execute("DELETE FROM processed_updates WHERE update_id=?", (update_id,))
+
+    async def prune_updates(self, *, before: int) -> int:
+        async with unit_of_work(self.db) as uow:
+            cur = await uow.execute("DELETE FROM processed_updates WHERE seen_at < ?", (before,))
+            return cur.rowcount
@@ -24,6 +24,12 @@ class AdminSaleAdd(StatesGroup):
     date = State()
 
 
+class AdminSaleSearch(StatesGroup):
+    query = State()
+    period = State()  # "YYYY-MM-DD YYYY-MM-DD", or "-" for all dates
+    customer = State()  # name/phone/ID, or "-" for every customer
+
+
 class AdminReportMonthly(StatesGroup):
     year_month = State()  # YYYY-MM
 
@@ -37,6 +43,13 @@ class AdminReportRange(StatesGroup):
     end = State()
 
 
+class AdminReportPivot(StatesGroup):
+    start = State()  # YYYY-MM-DD
+    end = State()
+    dims = State()  # comma separated PIVOT_DIMENSIONS, or "-"
+    metrics = State()  # comma separated PIVOT_METRICS, or "-" for sum,count
+
+
 class AdminBroadcast(StatesGroup):
     audience = State()  # all|active
     text = State()
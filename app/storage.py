@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+from typing import Any, AsyncContextManager, AsyncIterator, Optional, Protocol
+
+from .config import Config
+from .models import Customer
+
+
+class Tx(Protocol):
+    """One atomic write block: everything commits together or not at all."""
+
+    async def insert_customer(self, *, full_name: str, phone: str, chat_id: Optional[int], created_at: str) -> int: ...
+
+    async def customer_total(self, customer_id: int) -> int: ...
+
+    async def set_customer_total(self, customer_id: int, *, total_spent: int, level: str, at: str) -> None: ...
+
+    async def set_customer_status(self, customer_id: int, *, status: str, at: str) -> None: ...
+
+    async def customer_id_by_phone(self, phone: str) -> Optional[int]: ...
+
+    async def set_customer_chat(self, customer_id: int, *, chat_id: int, at: str) -> None: ...
+
+    async def delete_customer(self, customer_id: int) -> bool: ...
+
+    async def ensure_product(self, *, key: str, name: str, created_at: str) -> int:
+        """Id of the product with normalized `key`, created with display `name` if new."""
+        ...
+
+    async def insert_sale(self, *, customer_id: int, amount: int, product_id: int, comment: str, sale_date: str, created_at: str) -> int: ...
+
+    async def get_sale(self, sale_id: int) -> Optional[dict[str, Any]]: ...
+
+    async def last_sale(self, customer_id: int) -> Optional[dict[str, Any]]: ...
+
+    async def delete_sale(self, sale_id: int) -> None: ...
+
+    async def insert_reward(self, *, customer_id: int, reward_type: str, reward_name: str, note: str, created_at: str) -> int: ...
+
+    async def get_reward(self, reward_id: int) -> Optional[dict[str, Any]]: ...
+
+    async def delete_reward(self, reward_id: int) -> None: ...
+
+    async def reward_names(self, customer_id: int, *, reward_type: str) -> set[str]: ...
+
+    async def insert_audit(self, *, actor_telegram_id: Optional[int], actor_role: str, action: str, meta_json: str, at: str) -> None: ...
+
+    async def sales_totals(self, customer_id: Optional[int] = None) -> list[dict[str, Any]]:
+        """Per customer: id, total_spent, level and real_total (sum of its sales)."""
+        ...
+
+    async def customer_totals(self) -> list[tuple[int, int]]:
+        """(customer_id, total_spent) of every customer who has spent anything."""
+        ...
+
+    async def monthly_totals(self, month: str) -> list[tuple[int, int]]:
+        """(customer_id, total) of every buyer in `month` (YYYY-MM)."""
+        ...
+
+    async def save_snapshot(self, period: str, *, as_of: str, payload: str, computed_at: str) -> None: ...
+
+
+class Storage(Protocol):
+    """Everything the services layer needs from persistence.
+
+    Business rules (levels, threshold rewards, audit payloads) stay in
+    `services`; a backend only stores and retrieves rows.
+    """
+
+    name: str
+
+    async def open(self) -> None: ...
+
+    async def run_backfills(self) -> None: ...
+
+    async def close(self) -> None: ...
+
+    def stats(self) -> dict[str, Any]: ...
+
+    def transaction(self) -> AsyncContextManager[Tx]: ...
+
+    async def list_customers(self, *, limit: int) -> list[Customer]: ...
+
+    def iter_customers(self) -> AsyncIterator[Customer]: ...
+
+    async def find_customers(self, *, query: str, limit: int) -> list[Customer]:
+        """Customers by id, phone suffix or (Latin/Cyrillic-folded) name, best match first; see `search.rank`."""
+        ...
+
+    async def get_customer(self, customer_id: int) -> Optional[Customer]: ...
+
+    async def get_customer_by_chat(self, chat_id: int) -> Optional[Customer]: ...
+
+    async def get_customers(self, customer_ids: list[int]) -> dict[int, Customer]: ...
+
+    def iter_customers_with_chat(self, *, active_only: bool, chunk: int) -> AsyncIterator[Customer]: ...
+
+    async def count_customers_with_chat(self, *, active_only: bool) -> int: ...
+
+    async def customers_inactive_since(self, cutoff: str) -> list[Customer]:
+        """Active customers whose last sale is before `cutoff` (or who never bought)."""
+        ...
+
+    async def list_sales_for_customer(self, customer_id: int, *, limit: int, since: str) -> list[dict[str, Any]]: ...
+
+    async def customer_sales_stats(self, customer_id: int, *, since: str) -> tuple[int, int]: ...
+
+    def iter_sales_between(self, *, start_date: str, end_date: str) -> AsyncIterator[dict[str, Any]]: ...
+
+    async def range_summary(self, *, start_date: str, end_date: str) -> tuple[int, int]:
+        """(count, total) of sales dated within [start_date, end_date], from running totals."""
+        ...
+
+    async def monthly_summary(self, month: str) -> tuple[int, int]:
+        """(count, total) of sales in `month` (YYYY-MM), from the rollup."""
+        ...
+
+    async def monthly_top(self, month: str, *, limit: int) -> list[dict[str, Any]]:
+        """Biggest buyers of `month`, padded with non-buyers by id up to `limit`."""
+        ...
+
+    async def top_between(self, *, start_date: str, end_date: str, limit: int) -> list[tuple[int, int]]:
+        """(customer_id, total) of the biggest buyers in [start_date, end_date]; whole months come from the rollup."""
+        ...
+
+    async def pivot(self, *, start_date: str, end_date: str, dims: tuple[str, ...], metrics: tuple[str, ...]) -> list[dict[str, Any]]:
+        """Sales in [start_date, end_date] grouped by `dims` (see PIVOT_DIMENSIONS), one row per group.
+
+        Rows map each dimension and metric name to its value and are ordered
+        by the first metric, largest first. `weekday` is 0 (Sunday) .. 6;
+        `customer` is "#<id> <full_name>".
+        """
+        ...
+
+    async def top_products(self, *, limit: int) -> list[dict[str, Any]]:
+        """Best-selling products (id, name, cnt, total) from the running totals, largest total first."""
+        ...
+
+    async def search_sales(
+        self, *, query: str, start_date: str, end_date: str, customer_id: Optional[int], limit: int, offset: int
+    ) -> tuple[int, list[dict[str, Any]]]:
+        """Sales whose product or comment contains every word of `query` as a word prefix.
+
+        The newest SALE_SEARCH_CANDIDATES matches dated within [start_date, end_date]
+        (and of `customer_id`, when given) are ranked by bm25 with product hits
+        counting double, newest first on ties. Returns (how many were ranked, the
+        rows at offset..offset+limit): id, customer_id, full_name, amount,
+        product, comment, sale_date.
+        """
+        ...
+
+    def iter_sale_columns(self, *, chunk: int) -> AsyncIterator[tuple[list[int], list[str], list[int]]]:
+        """Every sale as (customer_ids, sale_dates, amounts) column lists, `chunk` rows at a time."""
+        ...
+
+    async def load_snapshots(self) -> dict[str, tuple[str, str]]:
+        """period -> (as_of, payload JSON) of the latest stored report snapshots."""
+        ...
+
+    async def list_rewards(self, customer_id: int, *, limit: int) -> list[dict[str, Any]]: ...
+
+    async def claim_update(self, update_id: int, *, at: int) -> bool:
+        """Record a Telegram update as processed; False if it already was."""
+        ...
+
+    async def release_update(self, update_id: int) -> None:
+        """Undo `claim_update`, so a re-delivery of the update is handled again."""
+        ...
+
+    async def prune_updates(self, *, before: int) -> int: ...
+
+
+def open_storage(cfg: Config) -> Storage:
+    """Build the backend selected by `Config.storage` (not yet opened)."""
+    if cfg.storage == "memory":
+        from .memory_storage import MemoryStorage
+
+        return MemoryStorage()
+    if cfg.storage == "sqlite":
+        from .sqlite_storage import SqliteStorage
+
+        return SqliteStorage(
+            path=cfg.db_path,
+            pool_size=cfg.db_pool_size,
+            snapshot_pool_size=cfg.db_snapshot_pool_size,
+            busy_timeout_ms=cfg.db_busy_timeout_ms,
+            write_retries=cfg.db_write_retries,
+        )
+    raise RuntimeError(f"STORAGE noma'lum: {cfg.storage!r} (sqlite|memory)")
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+from bisect import bisect_left, insort
+import heapq
+from typing import Iterable, Optional
+
+from .search import parse_query, prefix_range
+from .utils import normalize_key
+
+COUNTRY_CODE = "998"
+DENSE = 8  # a prefix held by over 1/DENSE of the index counts as common
+SCAN_BUDGET = 2000  # customers checked newest-first before falling back to slices
+
+
+def _tokens(full_name: str, phone: str) -> tuple[str, ...]:
+    """Every word of the folded name, and the phone with and without the country code."""
+    words = normalize_key(full_name).split()
+    phones = [phone, phone[len(COUNTRY_CODE) :]] if phone.startswith(COUNTRY_CODE) else [phone]
+    return tuple(dict.fromkeys(words + phones))
+
+
+class CustomerIndex:
+    """Prefix index over customer name words and phones, for as-you-type suggestions.
+
+    A sorted array of (token, customer_id): the customers with a token
+    starting with some prefix are one contiguous slice, found by two
+    bisects. Rare prefixes intersect their slices; common ones (a letter,
+    "90") instead try the newest customers first, which match after a few
+    checks, so neither case touches more than a bounded part of the index.
+    """
+
+    def __init__(self, customers: Iterable[tuple[int, str, str]] = ()) -> None:
+        self._customers: dict[int, tuple[str, str, tuple[str, ...]]] = {}
+        pairs = []
+        for cid, full_name, phone in customers:
+            tokens = _tokens(full_name, phone)
+            self._customers[cid] = (full_name, phone, tokens)
+            pairs += [(t, cid) for t in tokens]
+        self._keys: list[tuple[str, int]] = sorted(pairs)
+        self._ids: list[int] = sorted(self._customers)
+
+    def __len__(self) -> int:
+        return len(self._customers)
+
+    def add(self, customer_id: int, full_name: str, phone: str) -> None:
+        self.remove(customer_id)
+        tokens = _tokens(full_name, phone)
+        self._customers[customer_id] = (full_name, phone, tokens)
+        for t in tokens:
+            insort(self._keys, (t, customer_id))
+        insort(self._ids, customer_id)
+
+    def remove(self, customer_id: int) -> None:
+        entry = self._customers.pop(customer_id, None)
+        if entry is None:
+            return
+        for t in entry[2]:
+            del self._keys[bisect_left(self._keys, (t, customer_id))]
+        del self._ids[bisect_left(self._ids, customer_id)]
+
+    def _slice(self, prefix: str) -> tuple[int, int]:
+        lo, hi = prefix_range(prefix)
+        return bisect_left(self._keys, (lo, 0)), bisect_left(self._keys, (hi, 0))
+
+    def _matches(self, customer_id: int, words: list[str]) -> bool:
+        tokens = self._customers[customer_id][2]
+        return all(any(t.startswith(w) for t in tokens) for w in words)
+
+    def _scan_newest(self, words: list[str], limit: int, skip: Optional[int]) -> Optional[list[int]]:
+        """Newest matches by checking customers newest first; None if that takes more than SCAN_BUDGET checks."""
+        top: list[int] = []
+        for n, cid in enumerate(reversed(self._ids)):
+            if n == SCAN_BUDGET:
+                return None
+            if cid != skip and self._matches(cid, words):
+                top.append(cid)
+                if len(top) == limit:
+                    break
+        return top
+
+    def lookup(self, query: str, *, limit: int) -> list[tuple[int, str, str]]:
+        """(id, full_name, phone) of up to `limit` matches, newest first; an exact id match leads.
+
+        Every word of the query must prefix a name word or the phone; an empty
+        query lists the newest customers.
+        """
+        digits, key = parse_query(query)
+        words = [digits] if digits is not None else list(dict.fromkeys(key.split()))
+        exact = int(digits) if digits is not None and int(digits) in self._customers else None
+        spans = sorted((j - i, i, j, w) for w, (i, j) in ((w, self._slice(w)) for w in words))
+        top: Optional[list[int]] = None
+        if not spans or spans[0][0] * DENSE > len(self._keys):
+            top = self._scan_newest(words, limit, exact)
+        if top is None:
+            _, i, j, _ = spans[0]
+            ids = {cid for _, cid in self._keys[i:j]}
+            for size, i, j, w in spans[1:]:
+                if len(ids) * DENSE < size:
+                    ids = {cid for cid in ids if self._matches(cid, [w])}
+                else:
+                    ids &= {cid for _, cid in self._keys[i:j]}
+            ids.discard(exact)  # type: ignore[arg-type]
+            if len(ids) * DENSE > len(self._ids):
+                top = [cid for cid in reversed(self._ids) if cid in ids][:limit]
+            else:
+                top = heapq.nlargest(limit, ids)
+        if exact is not None:
+            top = [exact, *top[: limit - 1]]
+        return [(cid, *self._customers[cid][:2]) for cid in top]
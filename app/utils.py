@@ -1,10 +1,24 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 import json
 import re
 from typing import Any, Optional
+import unicodedata
+
+# Uzbek Cyrillic -> Latin, so both spellings of a name fold to one key.
+_CYRILLIC_TO_LATIN = str.maketrans(
+    {
+        "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo", "ж": "j",
+        "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+        "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "x", "ц": "s",
+        "ч": "ch", "ш": "sh", "щ": "sh", "ъ": "", "ы": "i", "ь": "", "э": "e", "ю": "yu",
+        "я": "ya", "ў": "o", "қ": "q", "ғ": "g", "ҳ": "h",
+        # o‘ / g‘ are typed with any of these; drop them all.
+        "'": "", "`": "", "ʻ": "", "ʼ": "", "‘": "", "’": "",
+    }
+)
 
 
 def now_iso(tz: str) -> str:
@@ -23,6 +37,16 @@ def parse_amount(text: str) -> Optional[int]:
         return None
 
 
+def parse_date(text: str) -> Optional[date]:
+    """A YYYY-MM-DD calendar date, or None ("2025-13-01" and "2025-02-30" included)."""
+    if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", (text or "").strip()):
+        return None
+    try:
+        return date.fromisoformat(text.strip())
+    except ValueError:
+        return None
+
+
 def fmt_amount(amount: int) -> str:
     return f"{amount:,}".replace(",", " ") + " so'm"
 
@@ -30,3 +54,36 @@ def fmt_amount(amount: int) -> str:
 def json_dumps(obj: Any) -> str:
     return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
 
+
+def normalize_key(text: str) -> str:
+    """Lookup key with case, whitespace and Cyrillic/Latin spelling folded: "Цемент  М400" -> "sement m400"."""
+    folded = unicodedata.normalize("NFKC", text).casefold().translate(_CYRILLIC_TO_LATIN)
+    return " ".join(folded.split())
+
+
+def _next_month(d: date) -> date:
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def split_by_month(start_date: str, end_date: str) -> tuple[list[str], list[tuple[str, str]]]:
+    """Split [start_date, end_date] into whole months (YYYY-MM) and the partial day ranges at either end."""
+    if start_date > end_date:
+        return [], []
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    first = start if start.day == 1 else _next_month(start)
+    stop = end + timedelta(days=1)
+    if stop.day != 1:
+        stop = end.replace(day=1)
+    if first >= stop:
+        return [], [(start_date, end_date)]
+    months: list[str] = []
+    m = first
+    while m < stop:
+        months.append(m.isoformat()[:7])
+        m = _next_month(m)
+    parts: list[tuple[str, str]] = []
+    if start < first:
+        parts.append((start_date, (first - timedelta(days=1)).isoformat()))
+    if stop <= end:
+        parts.append((stop.isoformat(), end_date))
+    return months, parts
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+from pathlib import Path
+
+import pytest
+
+from app.memory_storage import MemoryStorage
+from app.sqlite_storage import SqliteStorage
+from app.storage import Storage
+
+TZ = "UTC"
+BACKENDS = ("sqlite", "memory")
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem: pytest.Function) -> bool | None:
+    """Run `async def` tests on a fresh event loop (storage is opened inside the test)."""
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    args = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+    asyncio.run(pyfuncitem.obj(**args))
+    return True
+
+
+def make_storage(backend: str, tmp_path: Path) -> Storage:
+    if backend == "memory":
+        return MemoryStorage()
+    return SqliteStorage(path=str(tmp_path / "test.sqlite3"))
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, timedelta
+import random
+
+import pytest
+
+from app import services
+from app.analytics import COHORT_MONTHS, RFM_SEGMENTS, analyze
+
+from .conftest import BACKENDS, TZ, make_storage
+
+TODAY = date(2026, 6, 30)
+
+
+def _sales(n: int, seed: int) -> list[tuple[int, str, int]]:
+    rnd = random.Random(seed)
+    return [
+        (rnd.randint(1, 60), (TODAY - timedelta(days=rnd.randint(0, 540))).isoformat(), rnd.randint(1, 50) * 100_000)
+        for _ in range(n)
+    ]
+
+
+async def _chunks(rows: list[tuple[int, str, int]], size: int):
+    for i in range(0, len(rows), size):
+        part = rows[i : i + size]
+        yield [r[0] for r in part], [r[1] for r in part], [r[2] for r in part]
+
+
+def _scores(values: dict[int, float]) -> dict[int, int]:
+    ordered = sorted(values.values())
+    return {cid: 1 + ordered.index(v) * 5 // len(ordered) for cid, v in values.items()}
+
+
+def _rfm_by_hand(rows: list[tuple[int, str, int]]) -> list[tuple[str, int, int]]:
+    last: dict[int, str] = {}
+    freq: dict[int, int] = defaultdict(int)
+    spent: dict[int, int] = defaultdict(int)
+    for cid, day, amount in rows:
+        last[cid] = max(last.get(cid, day), day)
+        freq[cid] += 1
+        spent[cid] += amount
+    recency = _scores({cid: (TODAY - date.fromisoformat(day)).days for cid, day in last.items()})
+    f, m = _scores(freq), _scores(spent)
+    segments = {name: [0, 0] for name, _ in RFM_SEGMENTS}
+    for cid in last:
+        r, fm = 6 - recency[cid], (f[cid] + m[cid]) / 2
+        if r >= 4 and fm >= 4:
+            name = "Chempionlar"
+        elif r >= 3 and fm >= 3:
+            name = "Sodiq mijozlar"
+        elif r >= 4:
+            name = "Yangi mijozlar"
+        elif r <= 2 and fm >= 3:
+            name = "Xavf ostida"
+        else:
+            name = "Uxlab qolganlar"
+        segments[name][0] += 1
+        segments[name][1] += spent[cid]
+    return [(name, count, total) for name, (count, total) in segments.items()]
+
+
+def _month_index(day: str) -> int:
+    return int(day[:4]) * 12 + int(day[5:7]) - 1
+
+
+def _cohorts_by_hand(rows: list[tuple[int, str, int]]) -> dict[str, list[float]]:
+    bought: dict[int, set[int]] = defaultdict(set)
+    for cid, day, _ in rows:
+        bought[cid].add(_month_index(day))
+    lo = max(_month_index(day) for _, day, _ in rows) - COHORT_MONTHS + 1
+    cohorts: dict[int, list[set[int]]] = {}
+    for months in bought.values():
+        first = min(months)
+        if first < lo:
+            continue
+        cohorts.setdefault(first, [])
+        cohorts[first].append(months)
+    out = {}
+    for first, members in sorted(cohorts.items()):
+        span = COHORT_MONTHS - (first - lo)
+        label = f"{first // 12:04d}-{first % 12 + 1:02d}"
+        out[label] = [round(sum(1 for m in members if first + k in m) / len(members), 4) for k in range(span)]
+    return out
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+async def test_analytics_match_a_pure_python_recount(seed: int) -> None:
+    rows = _sales(3000, seed)
+    result = await analyze(_chunks(rows, 700), today=TODAY)
+    assert (result.sales, result.customers) == (len(rows), len({r[0] for r in rows}))
+    assert [(s.name, s.customers, s.monetary) for s in result.segments] == _rfm_by_hand(rows)
+    expected = _cohorts_by_hand(rows)
+    assert result.cohorts.months == list(expected)
+    assert result.cohorts.retention == list(expected.values())
+    assert all(row[0] == 1.0 for row in result.cohorts.retention)
+
+
+async def test_analytics_of_no_sales() -> None:
+    result = await analyze(_chunks([], 10), today=TODAY)
+    assert (result.sales, result.customers, result.cohorts.months) == (0, 0, [])
+    assert [s.customers for s in result.segments] == [0] * len(RFM_SEGMENTS)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+async def test_sales_analytics_reads_every_sale(backend: str, tmp_path) -> None:
+    db = make_storage(backend, tmp_path)
+    await db.open()
+    try:
+        cids = [
+            await services.create_customer(db, full_name=f"Mijoz {i}", phone=f"99890{i:07d}", chat_id=None, tz=TZ, actor_telegram_id=1)
+            for i in range(3)
+        ]
+        for n in range(9):
+            await services.add_sale(
+                db, customer_id=cids[n % 3], amount=1000, product="Sement", comment="", sale_date=f"2026-0{1 + n % 3}-10", tz=TZ, actor_telegram_id=1
+            )
+        first = await services.sales_analytics(db)
+        assert (first.sales, first.customers, sum(s.monetary for s in first.segments)) == (9, 3, 9000)
+        await services.add_sale(db, customer_id=cids[0], amount=500, product="Sement", comment="", sale_date="2026-04-01", tz=TZ, actor_telegram_id=1)
+        second = await services.sales_analytics(db)
+        assert (second.sales, sum(s.monetary for s in second.segments)) == (10, 9500)
+    finally:
+        await db.close()
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import pytest
+
+from app import services
+
+from .conftest import BACKENDS, TZ, make_storage
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+async def test_customer_by_chat_is_cached_and_invalidated(backend: str, tmp_path) -> None:
+    db = make_storage(backend, tmp_path)
+    await db.open()
+    await services.warm_up(db)
+    reads = {"n": 0}
+    by_chat, by_id = db.get_customer_by_chat, db.get_customer
+
+    async def count_by_chat(chat_id: int):
+        reads["n"] += 1
+        return await by_chat(chat_id)
+
+    async def count_by_id(customer_id: int):
+        reads["n"] += 1
+        return await by_id(customer_id)
+
+    db.get_customer_by_chat, db.get_customer = count_by_chat, count_by_id  # type: ignore[method-assign]
+    try:
+        cid = await services.create_customer(db, full_name="Ali", phone="998900000001", chat_id=None, tz=TZ, actor_telegram_id=1)
+        assert await services.get_customer_by_chat(db, chat_id=77) is None
+        await services.link_customer_chat(db, phone="998900000001", chat_id=77, tz=TZ)
+        assert (await services.get_customer_by_chat(db, chat_id=77)).id == cid
+
+        before = reads["n"]
+        for _ in range(5):
+            await services.get_customer_by_chat(db, chat_id=77)
+        assert reads["n"] == before
+
+        await services.add_sale(db, customer_id=cid, amount=5000, product="p", comment="", sale_date="2026-01-01", tz=TZ, actor_telegram_id=1)
+        assert (await services.get_customer_by_chat(db, chat_id=77)).total_spent == 5000
+        await services.link_customer_chat(db, phone="998900000001", chat_id=78, tz=TZ)
+        assert await services.get_customer_by_chat(db, chat_id=77) is None
+        assert (await services.get_customer_by_chat(db, chat_id=78)).id == cid
+        await services.set_customer_status(db, customer_id=cid, status="inactive", tz=TZ, actor_telegram_id=1)
+        assert (await services.get_customer(db, customer_id=cid)).status == "inactive"
+        await services.delete_last_sale(db, customer_id=cid, tz=TZ, actor_telegram_id=1)
+        assert (await services.get_customer_by_chat(db, chat_id=78)).total_spent == 0
+        await services.delete_customer(db, customer_id=cid, tz=TZ, actor_telegram_id=1)
+        assert await services.get_customer_by_chat(db, chat_id=78) is None
+        assert await services.get_customer(db, customer_id=cid) is None
+
+        stats = services.report_cache_stats(db)
+        assert stats["customer_chats.hits"] > 0 and stats["customers.misses"] > 0
+    finally:
+        await db.close()
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import random
+
+from app import services
+from app.memory_storage import MemoryStorage
+from app.sqlite_storage import SqliteStorage
+
+from .conftest import TZ
+
+FIRST = ["Alisher", "Bobur", "Dilshod", "Saban", "Sardor", "Otabek", "Алишер", "Шерзод"]
+LAST = ["Karimov", "Toshmatov", "Yusupov", "Qodirov", "Ergashev"]
+QUERIES = [
+    "alisher", "Алишер", "ALI", "li", "ab", "a", "sh", "r k", "sher", "karimov alisher", "ali k",
+    "12", "#12", "2233", "998", "", "zzz", "50%", "x_y", "шерзод",
+]
+
+
+async def _fill(db) -> None:
+    await db.open()
+    rnd = random.Random(3)
+    for _ in range(300):
+        name = f"{rnd.choice(FIRST)} {rnd.choice(LAST)}"
+        await services.create_customer(db, full_name=name, phone=f"99890{rnd.randint(0, 9999999):07d}", chat_id=None, tz=TZ, actor_telegram_id=1)
+    await services.delete_customer(db, customer_id=5, tz=TZ, actor_telegram_id=1)
+
+
+async def test_backends_find_the_same_customers(tmp_path) -> None:
+    memory, sqlite = MemoryStorage(), SqliteStorage(path=str(tmp_path / "s.sqlite3"))
+    await _fill(memory)
+    await _fill(sqlite)
+    try:
+        for query in QUERIES:
+            assert await services.find_customer(memory, query=query, limit=10) == await services.find_customer(sqlite, query=query, limit=10), query
+    finally:
+        await sqlite.close()
+
+
+async def test_short_words_match_inside_names(tmp_path) -> None:
+    db = SqliteStorage(path=str(tmp_path / "s.sqlite3"))
+    await db.open()
+    try:
+        for name, phone in [("Alisher Karimov", "998900000001"), ("Saban Yusupov", "998900000002")]:
+            await services.create_customer(db, full_name=name, phone=phone, chat_id=None, tz=TZ, actor_telegram_id=1)
+        assert [c.full_name for c in await services.find_customer(db, query="li", limit=5)] == ["Alisher Karimov"]
+        assert [c.full_name for c in await services.find_customer(db, query="ab", limit=5)] == ["Saban Yusupov"]
+    finally:
+        await db.close()
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+
+import pytest
+
+from app import db as dbmod
+
+
+async def _open(path: str, **kwargs) -> dbmod.Db:
+    db = dbmod.Db(path=path, **kwargs)
+    await dbmod.write(db, "CREATE TABLE t(id INTEGER PRIMARY KEY, v TEXT NOT NULL UNIQUE)")
+    return db
+
+
+async def test_writes_queued_together_commit_in_one_batch(tmp_path) -> None:
+    db = await _open(str(tmp_path / "t.sqlite3"))
+    try:
+        before = db.pool.batch_stats.batches
+        # Queued in one loop turn, so the writer finds them all waiting; the duplicate
+        # only rolls back its own savepoint.
+        results = await asyncio.gather(
+            *(dbmod.write(db, "INSERT INTO t(v) VALUES(?)", (f"v{n % 20}",)) for n in range(21)),
+            return_exceptions=True,
+        )
+        assert [type(r) for r in results].count(sqlite3.IntegrityError) == 1
+        assert db.pool.batch_stats.batches - before == 1
+        async with dbmod.read(db) as conn:
+            assert await dbmod.fetchval(conn, "SELECT COUNT(1) FROM t") == 20
+    finally:
+        await dbmod.close(db)
+
+
+async def test_failing_leased_block_rolls_back_only_itself(tmp_path) -> None:
+    db = await _open(str(tmp_path / "t.sqlite3"))
+    try:
+
+        async def fails() -> None:
+            async with dbmod.connect(db) as conn:
+                await conn.execute("INSERT INTO t(v) VALUES('lost')")
+                raise ValueError("boom")
+
+        results = await asyncio.gather(fails(), dbmod.write(db, "INSERT INTO t(v) VALUES('kept')"), return_exceptions=True)
+        assert isinstance(results[0], ValueError)
+        async with dbmod.read(db) as conn:
+            assert [r[0] for r in await dbmod.fetchall(conn, "SELECT v FROM t")] == ["kept"]
+    finally:
+        await dbmod.close(db)
+
+
+async def test_begin_immediate_retries_while_another_process_holds_the_lock(tmp_path) -> None:
+    path = str(tmp_path / "t.sqlite3")
+    db = await _open(path, busy_timeout_ms=0, write_retries=20)
+    other = sqlite3.connect(path, isolation_level=None)
+    try:
+        other.execute("BEGIN IMMEDIATE")
+        asyncio.get_running_loop().call_later(0.05, other.execute, "COMMIT")
+        await dbmod.write(db, "INSERT INTO t(v) VALUES('after')")
+        assert db.pool.batch_stats.retries > 0
+        assert db.pool.batch_stats.busy_failures == 0
+    finally:
+        other.close()
+        await dbmod.close(db)
+
+
+async def test_write_fails_once_the_retries_run_out(tmp_path) -> None:
+    path = str(tmp_path / "t.sqlite3")
+    db = await _open(path, busy_timeout_ms=0, write_retries=0)
+    other = sqlite3.connect(path, isolation_level=None)
+    try:
+        other.execute("BEGIN IMMEDIATE")
+        with pytest.raises(sqlite3.OperationalError):
+            await dbmod.write(db, "INSERT INTO t(v) VALUES('lost')")
+        other.execute("COMMIT")
+        assert db.pool.batch_stats.busy_failures == 1
+        # The writer is still usable once the lock is free.
+        await dbmod.write(db, "INSERT INTO t(v) VALUES('kept')")
+        async with dbmod.read(db) as conn:
+            assert [r[0] for r in await dbmod.fetchall(conn, "SELECT v FROM t")] == ["kept"]
+    finally:
+        other.close()
+        await dbmod.close(db)
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from datetime import date
+import random
+
+import pytest
+
+from app import services
+from app.leaderboard import Leaderboard
+
+from .conftest import BACKENDS, TZ, make_storage
+
+
+def test_leaderboard_matches_a_sorted_recount() -> None:
+    rnd = random.Random(13)
+    board = Leaderboard([(1, 500), (2, 0), (3, 500)])
+    totals = {1: 500, 3: 500}
+    for _ in range(2000):
+        cid = rnd.randint(1, 40)
+        if rnd.random() < 0.05:
+            board.remove(cid)
+            totals.pop(cid, None)
+            continue
+        delta = rnd.choice((-1, 1)) * rnd.randint(1, 5) * 100 if cid in totals else rnd.randint(1, 5) * 100
+        board.add(cid, delta)
+        totals[cid] = totals.get(cid, 0) + delta
+        if not totals[cid]:
+            del totals[cid]
+    expected = sorted(totals.items(), key=lambda kv: (-kv[1], kv[0]))
+    assert len(board) == len(expected)
+    assert board.top(10) == expected[:10]
+    assert [board.rank(cid) for cid, _ in expected] == list(range(1, len(expected) + 1))
+    assert all(board.total(cid) == total for cid, total in expected)
+    assert board.rank(99) is None and board.total(99) == 0
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+async def test_monthly_leaderboard_follows_sales(backend: str, tmp_path) -> None:
+    db = make_storage(backend, tmp_path)
+    await db.open()
+    today = date.today().isoformat()
+    try:
+        ids = [
+            await services.create_customer(db, full_name=f"Mijoz {n}", phone=f"+99890000000{n}", chat_id=None, tz=TZ, actor_telegram_id=1)
+            for n in range(4)
+        ]
+        await services.warm_up(db)
+        for cid, amount in zip(ids, (300, 100, 200, 100)):
+            await services.add_sale(db, customer_id=cid, amount=amount, product="Sement", comment="", sale_date=today, tz=TZ, actor_telegram_id=1)
+        await services.add_sale(db, customer_id=ids[3], amount=900, product="Sement", comment="", sale_date="2020-01-01", tz=TZ, actor_telegram_id=1)
+        top = await services.monthly_leaderboard(db, limit=3)
+        assert [(r["customer_id"], r["sum_amount"]) for r in top] == [(ids[0], 300), (ids[2], 200), (ids[1], 100)]
+
+        await services.add_sale(db, customer_id=ids[1], amount=250, product="Sement", comment="", sale_date=today, tz=TZ, actor_telegram_id=1)
+        await services.delete_last_sale(db, customer_id=ids[0], tz=TZ, actor_telegram_id=1)
+        top = await services.monthly_leaderboard(db, limit=3)
+        assert [(r["customer_id"], r["sum_amount"]) for r in top] == [(ids[1], 350), (ids[2], 200), (ids[3], 100)]
+        expected = await db.monthly_top(today[:7], limit=3)
+        assert [(r["customer_id"], r["sum_amount"]) for r in top] == [(r["customer_id"], r["sum_amount"]) for r in expected]
+    finally:
+        await db.close()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+async def test_cabinet_ranks_follow_totals(backend: str, tmp_path) -> None:
+    db = make_storage(backend, tmp_path)
+    await db.open()
+    today = date.today().isoformat()
+    try:
+        ids = [
+            await services.create_customer(db, full_name=f"Mijoz {n}", phone=f"+99890000000{n}", chat_id=None, tz=TZ, actor_telegram_id=1)
+            for n in range(5)
+        ]
+        # Rank before the first lookup builds the lifetime board from storage.
+        await services.add_sale(db, customer_id=ids[0], amount=500, product="Sement", comment="", sale_date="2020-01-01", tz=TZ, actor_telegram_id=1)
+        assert await services.lifetime_rank(db, customer_id=ids[0]) == (1, 1)
+        for cid, amount, day in [(ids[1], 800, today), (ids[2], 300, today), (ids[3], 500, today)]:
+            await services.add_sale(db, customer_id=cid, amount=amount, product="Sement", comment="", sale_date=day, tz=TZ, actor_telegram_id=1)
+        # Ties on total go to the lower id.
+        assert [await services.lifetime_rank(db, customer_id=cid) for cid in ids] == [(2, 4), (1, 4), (4, 4), (3, 4), None]
+        assert [await services.monthly_rank(db, customer_id=cid) for cid in ids] == [None, (1, 800), (3, 300), (2, 500), None]
+
+        await services.delete_last_sale(db, customer_id=ids[1], tz=TZ, actor_telegram_id=1)
+        await services.delete_customer(db, customer_id=ids[0], tz=TZ, actor_telegram_id=1)
+        assert [await services.lifetime_rank(db, customer_id=cid) for cid in ids[1:]] == [None, (2, 2), (1, 2), None]
+        assert await services.monthly_rank(db, customer_id=ids[2]) == (2, 300)
+    finally:
+        await db.close()
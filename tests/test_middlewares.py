@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from aiogram.types import Update
+import pytest
+
+from app.middlewares import UpdateDedupMiddleware
+from app.services import create_customer
+
+from .conftest import BACKENDS, TZ, make_storage
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+async def test_dedup_runs_each_update_once_and_retries_failures(backend: str, tmp_path) -> None:
+    db = make_storage(backend, tmp_path)
+    await db.open()
+    handled: list[int] = []
+
+    async def handler(event, data):
+        handled.append(event.update_id)
+        return "ok"
+
+    async def failing(event, data):
+        handled.append(event.update_id)
+        raise RuntimeError("database is locked")
+
+    try:
+        dedup = UpdateDedupMiddleware(db, ttl=3600, lru_size=2)
+        assert [await dedup(handler, Update(update_id=u), {}) for u in (1, 1, 2, 3, 1)] == ["ok", None, "ok", "ok", None]
+        with pytest.raises(RuntimeError):
+            await dedup(failing, Update(update_id=4), {})
+        assert await dedup(handler, Update(update_id=4), {}) == "ok"
+        # After a restart the claims come from storage.
+        restarted = UpdateDedupMiddleware(db, ttl=3600)
+        assert [await restarted(handler, Update(update_id=u), {}) for u in (1, 4, 5)] == [None, None, "ok"]
+        assert handled == [1, 2, 3, 4, 4, 5]
+    finally:
+        await db.close()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+async def test_dedup_keeps_the_claim_once_a_write_committed(backend: str, tmp_path) -> None:
+    db = make_storage(backend, tmp_path)
+    await db.open()
+    handled: list[int] = []
+
+    async def write_then_fail(event, data):
+        handled.append(event.update_id)
+        await create_customer(db, full_name="Ali", phone="+998901234567", chat_id=None, tz=TZ, actor_telegram_id=1)
+        raise RuntimeError("telegram send timed out")
+
+    try:
+        dedup = UpdateDedupMiddleware(db, ttl=3600)
+        with pytest.raises(RuntimeError):
+            await dedup(write_then_fail, Update(update_id=7), {})
+        assert await UpdateDedupMiddleware(db, ttl=3600)(write_then_fail, Update(update_id=7), {}) is None
+        assert handled == [7]
+    finally:
+        await db.close()
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import sqlite3
+
+from app import db as dbmod
+from app.sqlite_storage import SqliteStorage
+
+SALES = [
+    (1 + n % 3, 1000 * (n + 1), ["Sement M400", "Цемент м400", "Armatura 12", "Kafel oq"][n % 4], "qarzga" if n % 5 == 0 else "", f"2025-{1 + n % 12:02d}-{1 + n % 27:02d}")
+    for n in range(40)
+]
+
+
+async def _baseline(path: str) -> None:
+    """A database created by the first release (migration 1 only) holding some sales."""
+    full = dbmod.MIGRATIONS
+    dbmod.MIGRATIONS = tuple(m for m in full if m.version == 1)
+    try:
+        db = dbmod.Db(path=path)
+        await dbmod.migrate(db)
+        await dbmod.close(db)
+    finally:
+        dbmod.MIGRATIONS = full
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO customers(id, full_name, phone, status, created_at, updated_at) VALUES(?,?,?,'active','x','x')",
+        [(i, f"Mijoz {i}", f"99890000000{i}") for i in (1, 2, 3)],
+    )
+    conn.executemany("INSERT INTO sales(customer_id, amount, product, comment, sale_date, created_at) VALUES(?,?,?,?,?,'x')", SALES)
+    conn.commit()
+    conn.close()
+
+
+def _rows(conn: sqlite3.Connection, sql: str) -> list[tuple]:
+    return sorted(tuple(r) for r in conn.execute(sql).fetchall())
+
+
+async def test_upgrade_from_baseline_matches_recomputed_rollups(tmp_path) -> None:
+    path = str(tmp_path / "old.sqlite3")
+    await _baseline(path)
+    db = dbmod.Db(path=path)
+    await dbmod.migrate(db)
+    # Interrupt the products backfill after one chunk; run_backfills resumes it.
+    async with dbmod.connect(db) as conn:
+        last = await dbmod._backfill_sale_products(conn, 0, 7)
+        await conn.execute("UPDATE schema_backfills SET last_id=? WHERE version=7", (last,))
+    await dbmod.run_backfills(db, chunk=5)
+    await dbmod.close(db)
+
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == dbmod.MIGRATIONS[-1].version
+        assert conn.execute("SELECT COUNT(1) FROM schema_backfills WHERE done=0").fetchone()[0] == 0
+        assert _rows(conn, "SELECT month, customer_id, cnt, total FROM sales_monthly") == _rows(
+            conn,
+            """
+            SELECT substr(sale_date, 1, 7), customer_id, COUNT(1), SUM(amount) FROM sales GROUP BY 1, 2
+            UNION ALL
+            SELECT substr(sale_date, 1, 7), 0, COUNT(1), SUM(amount) FROM sales GROUP BY 1
+            """,
+        )
+        assert _rows(conn, "SELECT day, cnt, total, cum_cnt, cum_total FROM sales_daily") == _rows(
+            conn,
+            """
+            SELECT day, cnt, total, SUM(cnt) OVER w, SUM(total) OVER w
+            FROM (SELECT sale_date AS day, COUNT(1) AS cnt, SUM(amount) AS total FROM sales GROUP BY sale_date)
+            WINDOW w AS (ORDER BY day ROWS UNBOUNDED PRECEDING)
+            """,
+        )
+        # Both spellings of the cement fold into one product; totals match the sales.
+        assert _rows(conn, "SELECT key, cnt, total FROM products") == [
+            ("armatura 12", 10, sum(s[1] for s in SALES if s[2] == "Armatura 12")),
+            ("kafel oq", 10, sum(s[1] for s in SALES if s[2] == "Kafel oq")),
+            ("sement m400", 20, sum(s[1] for s in SALES if s[2] in ("Sement M400", "Цемент м400"))),
+        ]
+        assert conn.execute("SELECT COUNT(1) FROM sales WHERE product_id IS NULL OR product <> ''").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(1) FROM customers WHERE last_sale_date IS NULL").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(1) FROM sales_search WHERE sales_search MATCH 'armatura'").fetchone()[0] == 10
+        conn.execute("INSERT INTO sales_search(sales_search) VALUES('integrity-check')")
+    finally:
+        conn.close()
+
+
+async def test_products_backfill_keeps_sale_text_until_it_finishes(tmp_path) -> None:
+    path = str(tmp_path / "old.sqlite3")
+    await _baseline(path)
+    db = dbmod.Db(path=path)
+    await dbmod.migrate(db)
+    async with dbmod.connect(db) as conn:
+        await dbmod._backfill_sale_products(conn, 0, len(SALES))
+    await dbmod.close(db)
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("SELECT COUNT(1) FROM sales WHERE product = ''").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+async def test_pivot_groups_products_by_id_during_the_backfill(tmp_path) -> None:
+    path = str(tmp_path / "old.sqlite3")
+    await _baseline(path)
+    db = SqliteStorage(path=path)
+    await db.open()
+    try:
+        async with dbmod.connect(db.db) as conn:
+            await dbmod._backfill_sale_products(conn, 0, 10)
+        args = {"start_date": "2025-01-01", "end_date": "2025-12-31", "metrics": ("sum",)}
+        rows = await db.pivot(dims=("product",), **args)
+        assert sum(r["sum"] for r in rows) == sum(s[1] for s in SALES)
+        # Backfilled sales of both cement spellings share one product row; the rest still group by text.
+        assert sorted(r["product"] for r in rows) == ["Armatura 12", "Armatura 12", "Kafel oq", "Kafel oq", "Sement M400", "Sement M400", "Цемент м400"]
+        await db.run_backfills()
+        rows = await db.pivot(dims=("product",), **args)
+        assert {r["product"]: r["sum"] for r in rows} == {
+            "Sement M400": sum(s[1] for s in SALES if s[2] in ("Sement M400", "Цемент м400")),
+            "Armatura 12": sum(s[1] for s in SALES if s[2] == "Armatura 12"),
+            "Kafel oq": sum(s[1] for s in SALES if s[2] == "Kafel oq"),
+        }
+    finally:
+        await db.close()
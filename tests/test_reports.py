@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+import pytest
+
+from app import services
+from app.utils import parse_date
+
+from .conftest import BACKENDS, TZ, make_storage
+
+
+def test_months_between_steps_across_years() -> None:
+    assert services._months_between("2025-11-15", "2026-02-01") == ["2025-11", "2025-12", "2026-01", "2026-02"]
+    assert services._months_between("2026-02-28", "2026-02-01") == []
+    assert services._months_between("2024-02-29", "2024-02-29") == ["2024-02"]
+
+
+@pytest.mark.parametrize("bad", ["2025-13-01", "2025-02-30", "2025-00-10"])
+def test_months_between_rejects_impossible_dates(bad: str) -> None:
+    with pytest.raises(ValueError):
+        services._months_between(bad, "2026-05-01")
+    assert parse_date(bad) is None
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+async def test_range_summary_matches_sales(backend: str, tmp_path) -> None:
+    db = make_storage(backend, tmp_path)
+    await db.open()
+    try:
+        cid = await services.create_customer(db, full_name="Ali", phone="998900000001", chat_id=None, tz=TZ, actor_telegram_id=1)
+        days = ["2025-12-31", "2026-01-01", "2026-01-31", "2026-02-01", "2026-03-15"]
+        for n, day in enumerate(days, start=1):
+            await services.add_sale(db, customer_id=cid, amount=n * 1000, product="Sement", comment="", sale_date=day, tz=TZ, actor_telegram_id=1)
+        for start, end in [("2026-01-01", "2026-01-31"), ("2025-12-31", "2026-02-01"), ("2026-02-02", "2026-03-14"), ("2020-01-01", "2030-12-31")]:
+            expected = [n * 1000 for n, day in enumerate(days, start=1) if start <= day <= end]
+            assert await services.range_summary(db, start_date=start, end_date=end) == (len(expected), sum(expected))
+        # A write invalidates the cached result.
+        await services.add_sale(db, customer_id=cid, amount=7, product="Sement", comment="", sale_date="2026-01-15", tz=TZ, actor_telegram_id=1)
+        assert await services.range_summary(db, start_date="2026-01-01", end_date="2026-01-31") == (3, 5007)
+    finally:
+        await db.close()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+async def test_period_top_counts_buyers_outside_yesterdays_top(backend: str, tmp_path) -> None:
+    db = make_storage(backend, tmp_path)
+    await db.open()
+    try:
+        today = date.today()
+        if today.day == 1:
+            pytest.skip("month-to-date starts today")
+        yesterday = (today - timedelta(days=1)).isoformat()
+        cids = [
+            await services.create_customer(db, full_name=f"C{i}", phone=f"99890{i:07d}", chat_id=None, tz=TZ, actor_telegram_id=1)
+            for i in range(60)
+        ]
+        for n, cid in enumerate(cids, start=1):
+            await services.add_sale(db, customer_id=cid, amount=n * 100, product="p", comment="", sale_date=yesterday, tz=TZ, actor_telegram_id=1)
+        await services.refresh_report_snapshots(db, tz=TZ)
+        await services.add_sale(db, customer_id=cids[0], amount=5990, product="p", comment="", sale_date=today.isoformat(), tz=TZ, actor_telegram_id=1)
+        top = (await services.period_reports(db, tz=TZ))["mtd"]["top"]
+        assert [(t["customer_id"], t["sum_amount"]) for t in top[:2]] == [(cids[0], 6090), (cids[-1], 6000)]
+    finally:
+        await db.close()
+
+
+async def _pivot_by_hand(db, start: str, end: str, dims: tuple[str, ...]) -> list[tuple]:
+    groups: dict[tuple, list] = {}
+    async for s in services.iter_sales_between(db, start_date=start, end_date=end):
+        c = await services.get_customer(db, customer_id=s["customer_id"])
+        values = {
+            "product": s["product"],
+            "level": c.level,
+            "weekday": (date.fromisoformat(s["sale_date"]).weekday() + 1) % 7,
+            "month": s["sale_date"][:7],
+            "status": c.status,
+            "customer": f"#{c.id} {c.full_name}",
+        }
+        acc = groups.setdefault(tuple(values[d] for d in dims), [0, 0, set()])
+        acc[0] += s["amount"]
+        acc[1] += 1
+        acc[2].add(c.id)
+    return sorted((*key, total, count, len(buyers)) for key, (total, count, buyers) in groups.items())
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+async def test_pivot_matches_a_recount(backend: str, tmp_path) -> None:
+    db = make_storage(backend, tmp_path)
+    await db.open()
+    try:
+        cids = [
+            await services.create_customer(db, full_name=f"Mijoz {i}", phone=f"99890{i:07d}", chat_id=None, tz=TZ, actor_telegram_id=1)
+            for i in range(5)
+        ]
+        await services.set_customer_status(db, customer_id=cids[4], status="blocked", tz=TZ, actor_telegram_id=1)
+        for n in range(60):
+            day = date(2026, 1, 1) + timedelta(days=n * 3)
+            await services.add_sale(
+                db,
+                customer_id=cids[n % 5],
+                amount=(n % 7 + 1) * 2_000_000,
+                product=["Sement", "Armatura", "Kafel"][n % 3],
+                comment="",
+                sale_date=day.isoformat(),
+                tz=TZ,
+                actor_telegram_id=1,
+            )
+        metrics = ("sum", "count", "customers")
+        for start, end in [("2026-01-01", "2026-12-31"), ("2026-02-10", "2026-04-01")]:
+            for dims in [(), ("product",), ("level",), ("weekday", "month"), ("status", "customer"), ("product", "level", "month")]:
+                rows = await services.pivot_report(db, start_date=start, end_date=end, dims=dims, metrics=metrics)
+                assert [r["sum"] for r in rows] == sorted((r["sum"] for r in rows), reverse=True)
+                assert sorted(tuple(r[k] for k in (*dims, *metrics)) for r in rows) == await _pivot_by_hand(db, start, end, dims)
+        # A new sale in the range invalidates the cached result.
+        before = await services.pivot_report(db, start_date="2026-02-10", end_date="2026-04-01", dims=(), metrics=("count",))
+        await services.add_sale(db, customer_id=cids[0], amount=1, product="Sement", comment="", sale_date="2026-03-01", tz=TZ, actor_telegram_id=1)
+        after = await services.pivot_report(db, start_date="2026-02-10", end_date="2026-04-01", dims=(), metrics=("count",))
+        assert after[0]["count"] == before[0]["count"] + 1
+        with pytest.raises(ValueError):
+            await services.pivot_report(db, start_date="2026-01-01", end_date="2026-12-31", dims=("product", "product"))
+    finally:
+        await db.close()
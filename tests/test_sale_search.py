@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import random
+
+from app import services
+from app.memory_storage import MemoryStorage
+from app.search import sale_terms, text_tokens
+from app.sqlite_storage import SqliteStorage
+from app.utils import normalize_key
+
+from .conftest import TZ
+
+PRODUCTS = ["Sement M400", "Armatura 12", "Armatura 8", "Kafel oq", "Цемент М500", "Арматура 14"]
+COMMENTS = ["", "", "yetkazib berildi", "qarzga", "naqd", "доставка оптом", "armatura qaytarildi", "sement sement"]
+YEAR = ("2025-01-01", "2025-12-31")
+
+
+async def _fill(db) -> list[tuple[int, int, str, str, str]]:
+    """Sales as (id, customer_id, product, comment, sale_date), after a few deletes."""
+    await db.open()
+    rnd = random.Random(23)
+    ids = [
+        await services.create_customer(db, full_name=f"Mijoz {i}", phone=f"99890{i:07d}", chat_id=None, tz=TZ, actor_telegram_id=1)
+        for i in range(8)
+    ]
+    sales = {}
+    for _ in range(400):
+        cid, product, comment = rnd.choice(ids), rnd.choice(PRODUCTS), rnd.choice(COMMENTS)
+        day = f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}"
+        sale_id, _ = await services.add_sale(db, customer_id=cid, amount=1000, product=product, comment=comment, sale_date=day, tz=TZ, actor_telegram_id=1)
+        sales[sale_id] = (sale_id, cid, product, comment, day)
+    for sale_id in (3, 10, 77):
+        await services.delete_sale_by_id(db, sale_id=sale_id, tz=TZ, actor_telegram_id=1)
+        del sales[sale_id]
+    return list(sales.values())
+
+
+def _matches(sale: tuple[int, int, str, str, str], query: str) -> bool:
+    # Products are indexed under their folded key, so every spelling of one product matches alike.
+    tokens = text_tokens(normalize_key(sale[2])) + text_tokens(sale[3])
+    return all(any(t.startswith(w) for w in spellings for t in tokens) for spellings in sale_terms(query))
+
+
+async def test_search_matches_a_scan_on_both_backends(tmp_path) -> None:
+    memory, sqlite = MemoryStorage(), SqliteStorage(path=str(tmp_path / "s.sqlite3"))
+    sales = await _fill(memory)
+    assert await _fill(sqlite) == sales
+    names = {s[0]: s[2] for s in sales}
+    try:
+        cases = [
+            ("armatura", None, *YEAR),
+            ("Арматура", None, *YEAR),
+            ("arm 12", None, *YEAR),
+            ("sement", 3, *YEAR),
+            ("qarzga", None, "2025-03-01", "2025-05-31"),
+            ("доставка", None, *YEAR),
+            ("12", None, "2025-06-01", "2025-06-30"),
+            ("Kafel OQ", None, *YEAR),
+            ("zz", None, *YEAR),
+        ]
+        for query, cid, start, end in cases:
+            expected = {
+                s[0] for s in sales if _matches(s, query) and start <= s[4] <= end and (cid is None or s[1] == cid)
+            }
+            found = await services.search_sales(memory, query=query, start_date=start, end_date=end, customer_id=cid, limit=1000)
+            assert found == await services.search_sales(sqlite, query=query, start_date=start, end_date=end, customer_id=cid, limit=1000)
+            total, rows = found
+            assert (total, {r["id"] for r in rows}) == (len(expected), expected), query
+            assert all(r["product"] == names[r["id"]] for r in rows)
+            # Pages are slices of the same ranking.
+            _, page = await services.search_sales(sqlite, query=query, start_date=start, end_date=end, customer_id=cid, limit=5, offset=5)
+            assert page == rows[5:10]
+        assert await services.search_sales(sqlite, query="  ", start_date=YEAR[0], end_date=YEAR[1], limit=10) == (0, [])
+    finally:
+        await memory.close()
+        await sqlite.close()
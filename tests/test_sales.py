@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+import pytest
+
+from app import services
+
+from .conftest import BACKENDS, TZ, make_storage
+
+
+async def _customer(db, name: str = "Ali Valiyev", phone: str = "+998901234567") -> int:
+    return await services.create_customer(db, full_name=name, phone=phone, chat_id=None, tz=TZ, actor_telegram_id=1)
+
+
+async def _sale(db, customer_id: int, amount: int, sale_date: str, product: str = "Sement M400", comment: str = "") -> int:
+    sale_id, _ = await services.add_sale(
+        db, customer_id=customer_id, amount=amount, product=product, comment=comment, sale_date=sale_date, tz=TZ, actor_telegram_id=1
+    )
+    return sale_id
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+async def test_sale_rewards_and_audit_commit_together(backend: str, tmp_path, monkeypatch) -> None:
+    db = make_storage(backend, tmp_path)
+    await db.open()
+    try:
+        cid = await _customer(db)
+
+        async def reward_then_fail(tx, *, customer_id, tz, actor_telegram_id):
+            await tx.insert_reward(customer_id=customer_id, reward_type="threshold", reward_name="Chang yutqich", note="", created_at="x")
+            raise RuntimeError("boom")
+
+        with monkeypatch.context() as m:
+            m.setattr(services, "check_threshold_rewards", reward_then_fail)
+            with pytest.raises(RuntimeError):
+                await _sale(db, cid, 60_000_000, "2026-03-01")
+        customer = await services.get_customer(db, customer_id=cid)
+        assert (customer.total_spent, customer.level, customer.last_sale_date) == (0, "Bronze", None)
+        assert await services.list_sales_for_customer(db, customer_id=cid) == []
+        assert await services.list_rewards(db, customer_id=cid) == []
+        assert await services.range_summary(db, start_date="2026-03-01", end_date="2026-03-31") == (0, 0)
+
+        _, earned = await services.add_sale(
+            db, customer_id=cid, amount=60_000_000, product="Sement", comment="", sale_date="2026-03-01", tz=TZ, actor_telegram_id=1
+        )
+        assert earned == ["Chang yutqich"]
+        assert [r["reward_name"] for r in await services.list_rewards(db, customer_id=cid)] == ["Chang yutqich"]
+        assert (await services.get_customer(db, customer_id=cid)).total_spent == 60_000_000
+    finally:
+        await db.close()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+async def test_last_sale_date_follows_adds_and_deletes(backend: str, tmp_path) -> None:
+    db = make_storage(backend, tmp_path)
+    await db.open()
+    today = date.today()
+    try:
+        cid = await _customer(db)
+        idle = await _customer(db, "Vali Aliyev", "+998901234568")
+        old, mid, new = ((today - timedelta(days=n)).isoformat() for n in (90, 40, 5))
+        await _sale(db, cid, 100, mid)
+        newest = await _sale(db, cid, 100, new)
+        await _sale(db, cid, 100, old)  # an older date entered later does not move it back
+        assert (await services.get_customer(db, customer_id=cid)).last_sale_date == new
+        assert [c.id for c in await services.customers_inactive_days(db, days=30, tz=TZ)] == [idle]
+
+        await services.delete_sale_by_id(db, sale_id=newest, tz=TZ, actor_telegram_id=1)
+        assert (await services.get_customer(db, customer_id=cid)).last_sale_date == mid
+        # Never bought first, then the oldest last sale.
+        assert [c.id for c in await services.customers_inactive_days(db, days=30, tz=TZ)] == [idle, cid]
+
+        await services.delete_last_sale(db, customer_id=cid, tz=TZ, actor_telegram_id=1)
+        await services.delete_last_sale(db, customer_id=cid, tz=TZ, actor_telegram_id=1)
+        assert (await services.get_customer(db, customer_id=cid)).last_sale_date is None
+        assert [c.id for c in await services.customers_inactive_days(db, days=30, tz=TZ)] == [cid, idle]
+    finally:
+        await db.close()
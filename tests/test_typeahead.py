@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from app import services
+from app.search import parse_query
+from app.typeahead import CustomerIndex
+from app.utils import normalize_key
+
+from .conftest import BACKENDS, TZ, make_storage
+
+FIRST = ["Ali", "Vali", "Olim", "Anvar", "Bobur", "Dilshod", "Ra'no", "Shoira", "Aziza", "Umid"]
+LAST = ["Valiyev", "Aliyeva", "Karimov", "Toshmatov", "Qodirov", "Yusupova", "Rahimov"]
+
+
+def _customers(n: int, seed: int) -> list[tuple[int, str, str]]:
+    rnd = random.Random(seed)
+    return [(cid, f"{rnd.choice(FIRST)} {rnd.choice(LAST)}", f"99890{rnd.randrange(10**7):07d}") for cid in range(1, n + 1)]
+
+
+def _lookup_by_hand(customers: list[tuple[int, str, str]], query: str, limit: int) -> list[int]:
+    digits, key = parse_query(query)
+    words = [digits] if digits is not None else key.split()
+    ids = {cid for cid, _, _ in customers}
+    exact = int(digits) if digits is not None and int(digits) in ids else None
+    hits = []
+    for cid, name, phone in sorted(customers, reverse=True):
+        tokens = normalize_key(name).split() + [phone, phone[3:]]
+        if cid != exact and all(any(t.startswith(w) for t in tokens) for w in words):
+            hits.append(cid)
+    return ([exact] if exact is not None else []) + hits[: limit - (exact is not None)]
+
+
+QUERIES = ["", "a", "ali", "Ali val", "va al", "sh", "ra'no", "90", "99890", "12", "1234", "17", "2500", "zz", "olim karimov"]
+
+
+@pytest.mark.parametrize("size", [50, 4000])
+def test_lookup_matches_a_scan(size: int) -> None:
+    customers = _customers(size, seed=size)
+    index = CustomerIndex(customers)
+    for query in QUERIES:
+        for limit in (1, 10):
+            assert [cid for cid, _, _ in index.lookup(query, limit=limit)] == _lookup_by_hand(customers, query, limit), query
+
+
+def test_index_follows_adds_and_removes() -> None:
+    customers = _customers(300, seed=7)
+    index = CustomerIndex(customers[:200])
+    for c in customers[200:]:
+        index.add(*c)
+    for cid in range(1, 300, 3):
+        index.remove(cid)
+    renamed = (5, "Zarina Zokirova", "998911234567")
+    index.add(*renamed)
+    left = [c for c in customers if c[0] % 3 != 1 and c[0] != 5] + [renamed]
+    assert len(index) == len(left)
+    for query in [*QUERIES, "zarina", "911234"]:
+        assert [cid for cid, _, _ in index.lookup(query, limit=10)] == _lookup_by_hand(left, query, 10), query
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+async def test_suggestions_follow_customer_writes(backend: str, tmp_path) -> None:
+    db = make_storage(backend, tmp_path)
+    await db.open()
+    try:
+        ali = await services.create_customer(db, full_name="Ali Valiyev", phone="998901112233", chat_id=None, tz=TZ, actor_telegram_id=1)
+        await services.warm_up(db)
+        vali = await services.create_customer(db, full_name="Vali Aliyev", phone="998904445566", chat_id=None, tz=TZ, actor_telegram_id=1)
+        assert [cid for cid, _, _ in await services.suggest_customers(db, query="ali", limit=5)] == [vali, ali]
+        assert await services.suggest_customers(db, query="90444", limit=5) == [(vali, "Vali Aliyev", "998904445566")]
+        await services.delete_customer(db, customer_id=vali, tz=TZ, actor_telegram_id=1)
+        assert [cid for cid, _, _ in await services.suggest_customers(db, query="ali", limit=5)] == [ali]
+    finally:
+        await db.close()